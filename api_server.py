@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse
 from contextlib import asynccontextmanager
@@ -14,6 +14,9 @@ from src.models import (
     ErrorResponse
 )
 from src.converter import HuggingFaceConverter
+from src.exceptions import ProxyError
+from src.model_list_cache import etag_matches
+from src.upstream import UpstreamPool
 from src.config import config
 
 # 配置日志
@@ -34,14 +37,17 @@ async def lifespan(app: FastAPI):
     
     # 启动时初始化
     logger.info("Initializing Hugging Face API Proxy Server...")
-    converter = HuggingFaceConverter()
+    upstream_pool = UpstreamPool()
+    upstream_pool.start()
+    converter = HuggingFaceConverter(upstream_pool)
     logger.info(f"Server starting on {config.host}:{config.port}")
-    logger.info(f"Using Hugging Face base URL: {config.hf_base_url}")
+    logger.info(f"Using upstreams: {', '.join(item['url'] for item in config.hf_upstreams)}")
     
     yield
     
     # 关闭时清理
     logger.info("Shutting down server...")
+    await upstream_pool.close()
 
 
 # 创建FastAPI应用
@@ -89,7 +95,8 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "chat_completions": "/v1/chat/completions",
-            "models": "/v1/models"
+            "models": "/v1/models",
+            "stats": "/stats"
         }
     }
 
@@ -100,8 +107,21 @@ async def health_check():
     return {"status": "healthy", "timestamp": converter.get_current_timestamp()}
 
 
+@app.get("/stats")
+async def get_stats():
+    """代理运行统计（连接池等）"""
+    global converter
+    
+    # 确保converter已初始化（Vercel环境fallback）
+    if converter is None:
+        logger.warning("Converter not initialized, initializing now...")
+        converter = HuggingFaceConverter()
+    
+    return await converter.get_stats()
+
+
 @app.post("/v1/chat/completions")
-async def create_chat_completion(request: ChatCompletionRequest, http_request: Request):
+async def create_chat_completion(request: ChatCompletionRequest, http_request: Request, http_response: Response):
     """创建聊天完成"""
     global converter
     
@@ -127,26 +147,54 @@ async def create_chat_completion(request: ChatCompletionRequest, http_request: R
         logger.info(f"Chat completion request - Model: {request.model}, Stream: {request.stream}")
         
         if request.stream:
-            # 流式响应
-            async def generate():
-                async for chunk in converter.create_chat_completion_stream(request, client_api_key):
-                    yield chunk
+            # 流式响应（先打开上游流，失败或降级都发生在发送任何数据之前；
+            # 上游迟迟未响应时先开始响应并发送心跳，此时实际服务的模型未知）
+            cache_status = None
+            if converter.is_cacheable(request):
+                # 确定性请求经过响应缓存，命中时将缓存的响应重放为SSE流
+                served_model, chunks, cache_status = await converter.cached_chat_completion_stream(
+                    request, client_api_key, http_request.is_disconnected, http_request.headers.get("Cache-Control")
+                )
+                logger.info(f"Chat completion stream - Cache: {cache_status}")
+            else:
+                served_model, chunks = await converter.coalesced_chat_completion_stream(
+                    request, client_api_key, is_disconnected=http_request.is_disconnected
+                )
             
+            headers = {
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "Content-Type": "text/event-stream",
+            }
+            if served_model is not None:
+                headers["X-Served-Model"] = served_model
+            if cache_status is not None:
+                headers["x-cache"] = cache_status
             return StreamingResponse(
-                generate(),
+                chunks,
                 media_type="text/plain",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "Content-Type": "text/event-stream"
-                }
+                headers=headers
+            )
+        elif converter.is_cacheable(request):
+            # 确定性请求经过响应缓存，命中时直接返回序列化好的响应体
+            body, served_model, cache_status = await converter.cached_chat_completion(
+                request, client_api_key, http_request.headers.get("Cache-Control")
+            )
+            logger.info(f"Chat completion successful - Cache: {cache_status}")
+            return Response(
+                content=body,
+                media_type="application/json",
+                headers={"X-Served-Model": served_model, "x-cache": cache_status}
             )
         else:
             # 非流式响应
-            response = await converter.create_chat_completion(request, client_api_key)
+            response = await converter.coalesced_chat_completion(request, client_api_key)
             logger.info(f"Chat completion successful - Response ID: {response.id}")
+            http_response.headers["X-Served-Model"] = response.model
             return response
             
+    except ProxyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict(), headers=e.headers or None)
     except Exception as e:
         logger.error(f"Error in chat completion: {str(e)}")
         raise HTTPException(
@@ -185,9 +233,11 @@ async def list_models(http_request: Request):
     
     try:
         logger.info("Models list request")
-        models = await converter.get_models(client_api_key)
-        logger.info(f"Returned {len(models.data)} models")
-        return models
+        # 模型列表经过缓存，响应体和ETag都是预先计算好的
+        body, etag = await converter.get_models_body(client_api_key)
+        if etag_matches(http_request.headers.get("If-None-Match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
         
     except Exception as e:
         logger.error(f"Error getting models: {str(e)}")
@@ -206,6 +256,9 @@ async def list_models(http_request: Request):
 @app.exception_handler(404)
 async def not_found_handler(request: Request, exc):
     """404错误处理"""
+    if isinstance(exc, HTTPException) and isinstance(exc.detail, dict):
+        # 代理错误（如没有上游提供请求的模型）保留原有的错误信息
+        return JSONResponse(status_code=404, content=exc.detail, headers=exc.headers)
     return JSONResponse(
         status_code=404,
         content={
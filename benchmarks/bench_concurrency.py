@@ -0,0 +1,36 @@
+"""代理的并发能力：N个并发请求的总耗时应接近单个请求的上游延迟
+
+上游调用完全异步（AsyncOpenAI）时，并发请求在上游等待期间不会互相阻塞；
+如果总耗时随请求数线性增长，说明某处阻塞了事件循环。
+
+    python benchmarks/bench_concurrency.py --requests 200 --latency 1.0
+    python benchmarks/bench_concurrency.py --requests 200 --latency 1.0 --stream
+"""
+import argparse
+import asyncio
+
+from harness import mock_upstream, proxy, run_load, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=1.0, help="模拟上游的首字节延迟（秒）")
+    parser.add_argument("--stream", action="store_true", help="使用流式请求")
+    args = parser.parse_args()
+
+    with mock_upstream(MOCK_LATENCY=str(args.latency), MOCK_TOKENS="20", MOCK_TOKEN_INTERVAL="0") as (upstream, _):
+        # 所有请求同时发出，连接池足够容纳全部请求，排除排队对结果的影响
+        size = str(args.requests)
+        with proxy(upstream, HTTP_MAX_CONNECTIONS=size, HTTP_POOL_SIZE=size) as (url, _):
+            latencies, _, elapsed, errors = asyncio.run(run_load(url, args.requests, args.requests, args.stream))
+
+    print(
+        f"requests={args.requests} upstream_latency={args.latency:.2f}s "
+        f"wall={elapsed:.2f}s (ideal ~{args.latency:.2f}s, serial {args.requests * args.latency:.0f}s) "
+        f"errors={errors} {summarize(latencies)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
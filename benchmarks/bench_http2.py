@@ -0,0 +1,52 @@
+"""HTTP/2与HTTP/1.1上游连接池对比（HTTP2_ENABLED）
+
+启动一个同时支持HTTP/2和HTTP/1.1的TLS模拟上游（hypercorn），分别以HTTP2_ENABLED=false/true
+启动代理，在高并发下比较上游看到的TCP连接数和客户端的p50/p99延迟。
+
+需要: pip install -e ".[http2]" hypercorn，以及openssl命令行工具
+
+    python benchmarks/bench_http2.py --requests 1000 --concurrency 200
+"""
+import argparse
+import asyncio
+import importlib.util
+import sys
+
+from harness import get_json, mock_upstream, post_json, proxy, run_load, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.1, help="模拟上游的首字节延迟（秒）")
+    parser.add_argument("--stream", action="store_true", help="使用流式请求")
+    parser.add_argument("--max-connections", type=int, default=100, help="代理的HTTP_MAX_CONNECTIONS")
+    args = parser.parse_args()
+
+    for module in ("h2", "hypercorn"):
+        if importlib.util.find_spec(module) is None:
+            sys.exit(f"'{module}' is not installed: pip install h2 hypercorn")
+
+    with mock_upstream(tls=True, MOCK_LATENCY=str(args.latency), MOCK_TOKENS="20", MOCK_TOKEN_INTERVAL="0") as (upstream, extra_env):
+        mock_base = upstream.rsplit("/v1", 1)[0]
+        for http2 in (False, True):
+            env = {**extra_env, "HTTP2_ENABLED": str(http2).lower(), "HTTP_MAX_CONNECTIONS": str(args.max_connections)}
+            with proxy(upstream, **env) as (url, _):
+                latencies, _, elapsed, errors = asyncio.run(run_load(
+                    url, args.requests, args.concurrency, args.stream,
+                    after_warmup=lambda: post_json(f"{mock_base}/mock/reset"),
+                ))
+                mock_stats = get_json(f"{mock_base}/mock/stats")
+                pool = get_json(f"{url}/stats")["upstream_pool"]
+            print(
+                f"HTTP2_ENABLED={str(http2).lower():5s} "
+                f"upstream_connections={mock_stats['connections']:4d} "
+                f"versions={mock_stats['http_versions']} "
+                f"rps={len(latencies) / elapsed:7.0f} errors={errors} {summarize(latencies)} "
+                f"(pool: opened={pool.get('connections_opened')}, tls={pool.get('tls_handshakes')})"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""流式读取超时的微基准：每个chunk一个wait_for任务与每个流一个截止时间定时器对比
+
+源流不做任何IO，测量的只是超时机制本身对每个chunk的开销。
+
+    python benchmarks/bench_iter_stream.py --chunks 200000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.timeouts import TimeoutPolicy  # noqa: E402
+
+
+class _Response:
+    async def aclose(self):
+        pass
+
+
+class _Source:
+    """立即产出count个chunk的异步迭代器"""
+
+    def __init__(self, count: int):
+        self.count = count
+        self.response = _Response()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.count == 0:
+            raise StopAsyncIteration
+        self.count -= 1
+        return self.count
+
+
+async def measure(stream, count: int) -> float:
+    started = time.perf_counter()
+    async for _ in stream:
+        pass
+    return count / (time.perf_counter() - started)
+
+
+async def run(count: int):
+    def policy():
+        return TimeoutPolicy(connect=5, first_token=60, idle=30, total=600)
+
+    variants = [
+        ("no timeout", lambda: _Source(count)),
+        ("wait_for per chunk", lambda: policy()._iter_with_wait(_Source(count))),
+        ("deadline timer", lambda: policy().iter_stream(_Source(count), _Response())),
+    ]
+    for name, make in variants:
+        rate = await measure(make(), count)
+        print(f"{name:20s} {rate:12,.0f} chunks/s  {1e6 / rate:6.2f} us/chunk")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=200_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.chunks))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""流式透传与逐chunk转换对比（STREAM_PASSTHROUGH）
+
+上游连续快速地发出大量token，分别以STREAM_PASSTHROUGH=false/true启动代理，
+比较代理进程消耗的CPU时间和客户端收到的chunk速率。透传只在不拆分<think>时生效，
+因此两次运行都设置STREAM_REASONING_SPLIT=false。CPU时间读取/proc，只支持Linux。
+
+    python benchmarks/bench_passthrough.py --streams 50 --tokens 2000
+"""
+import argparse
+import asyncio
+
+from harness import cpu_seconds, mock_upstream, proxy, run_load
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=50, help="流的总数")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--tokens", type=int, default=2000, help="每个流的token数")
+    args = parser.parse_args()
+
+    with mock_upstream(MOCK_LATENCY="0", MOCK_TOKENS=str(args.tokens), MOCK_TOKEN_INTERVAL="0") as (upstream, _):
+        for passthrough in (False, True):
+            env = {"STREAM_PASSTHROUGH": str(passthrough).lower(), "STREAM_REASONING_SPLIT": "false"}
+            with proxy(upstream, **env) as (url, process):
+                cpu = {}
+                _, frames, elapsed, errors = asyncio.run(run_load(
+                    url, args.streams, args.concurrency, stream=True,
+                    after_warmup=lambda: cpu.setdefault("start", cpu_seconds(process.pid)),
+                ))
+                used = cpu_seconds(process.pid) - cpu["start"]
+            print(
+                f"STREAM_PASSTHROUGH={str(passthrough).lower():5s} "
+                f"proxy_cpu={used:6.2f}s ({used / max(frames, 1) * 1e6:5.1f} us/chunk) "
+                f"client_rate={frames / elapsed:10,.0f} chunks/s errors={errors}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""基准测试的公共工具：启动模拟上游和代理子进程、并发压测、统计延迟分位数"""
+import asyncio
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+MODEL = "bench-model"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"process exited with code {process.returncode}: {' '.join(process.args)}")
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"port {port} did not open within {timeout}s")
+
+
+@contextlib.contextmanager
+def _serve(args: List[str], port: int, cwd: str, env: Dict[str, str]) -> Iterator[subprocess.Popen]:
+    # 设置BENCH_LOG_DIR时保留子进程的输出，便于排查压测中的错误
+    log_dir = os.getenv("BENCH_LOG_DIR")
+    output = open(os.path.join(log_dir, f"{os.path.basename(cwd)}-{port}.log"), "wb") if log_dir else subprocess.DEVNULL
+    process = subprocess.Popen(args, cwd=cwd, env={**os.environ, **env}, stdout=output, stderr=subprocess.STDOUT)
+    try:
+        _wait_for_port(port, process)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        if log_dir:
+            output.close()
+
+
+def _self_signed_cert(directory: str) -> Tuple[str, str]:
+    """用openssl生成127.0.0.1的自签名证书，返回(证书路径, 私钥路径)"""
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-keyout", key, "-out", cert, "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+        ],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return cert, key
+
+
+@contextlib.contextmanager
+def mock_upstream(tls: bool = False, **env: str) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """启动模拟上游，返回(上游的/v1地址, 代理需要额外设置的环境变量)
+
+    tls=True时用hypercorn加自签名证书启动（同时支持HTTP/2和HTTP/1.1），
+    代理通过SSL_CERT_FILE信任该证书。
+    """
+    port = free_port()
+    if not tls:
+        args = [
+            sys.executable, "-m", "uvicorn", "mock_upstream:app", "--port", str(port), "--log-level", "warning",
+            "--timeout-keep-alive", "120",
+        ]
+        with _serve(args, port, BENCH_DIR, env):
+            yield f"http://127.0.0.1:{port}/v1", {}
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = _self_signed_cert(directory)
+        # hypercorn默认每个连接处理1000个请求后关闭，压测中会表现为上游连接错误
+        config = os.path.join(directory, "hypercorn.toml")
+        with open(config, "w") as f:
+            f.write("keep_alive_max_requests = 1000000\n")
+        args = [
+            sys.executable, "-m", "hypercorn", "mock_upstream:app", "--config", config, "--bind", f"127.0.0.1:{port}",
+            "--certfile", cert, "--keyfile", key, "--log-level", "warning", "--keep-alive", "120",
+        ]
+        with _serve(args, port, BENCH_DIR, env):
+            yield f"https://127.0.0.1:{port}/v1", {"SSL_CERT_FILE": cert}
+
+
+@contextlib.contextmanager
+def proxy(upstream_url: str, **env: str) -> Iterator[Tuple[str, subprocess.Popen]]:
+    """启动代理（uvicorn api_server:app），返回(代理地址, 进程)"""
+    port = free_port()
+    env = {
+        "HF_BASE_URL": upstream_url,
+        "HF_TOKEN": "bench",
+        "CIRCUIT_BREAKER_ENABLED": "false",
+        **env,
+    }
+    # 压测客户端的连接可能在队列中空闲较久，延长keep-alive避免复用到已被服务端关闭的连接
+    args = [
+        sys.executable, "-m", "uvicorn", "api_server:app", "--port", str(port), "--log-level", "warning",
+        "--timeout-keep-alive", "120",
+    ]
+    with _serve(args, port, ROOT_DIR, env) as process:
+        yield f"http://127.0.0.1:{port}", process
+
+
+def cpu_seconds(pid: int) -> float:
+    """进程累计的用户态和内核态CPU时间（读取/proc，只支持Linux）"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def summarize(latencies: List[float]) -> str:
+    if not latencies:
+        return "no successful requests"
+    return (
+        f"p50={percentile(latencies, 0.5) * 1000:.0f}ms "
+        f"p99={percentile(latencies, 0.99) * 1000:.0f}ms "
+        f"max={max(latencies) * 1000:.0f}ms"
+    )
+
+
+def chat_body(stream: bool, content: str = "hello", **extra) -> dict:
+    return {"model": MODEL, "stream": stream, "messages": [{"role": "user", "content": content}], **extra}
+
+
+async def one_request(client: httpx.AsyncClient, url: str, body: dict) -> Tuple[float, int]:
+    """发送一个请求并读完响应，返回(耗时, 流式响应的data帧数)"""
+    started = time.perf_counter()
+    frames = 0
+    async with client.stream("POST", f"{url}/v1/chat/completions", json=body) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {(await response.aread())[:200]!r}")
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                frames += 1
+    return time.perf_counter() - started, frames
+
+
+async def run_load(
+    url: str,
+    total: int,
+    concurrency: int,
+    stream: bool,
+    after_warmup: Optional[Callable[[], None]] = None
+) -> Tuple[List[float], int, float, int]:
+    """以固定并发数发送total个请求，返回(成功请求的耗时, data帧总数, 总耗时, 失败的请求数)
+
+    after_warmup在预热请求之后、正式压测之前调用，用于清零统计。
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        # 预热：建立连接、加载代理的惰性初始化
+        await one_request(client, url, chat_body(stream, "warmup"))
+        if after_warmup is not None:
+            after_warmup()
+
+        async def worker(i: int) -> Optional[Tuple[float, int]]:
+            async with semaphore:
+                try:
+                    return await one_request(client, url, chat_body(stream, f"request {i}"))
+                except (httpx.HTTPError, RuntimeError):
+                    return None
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*[worker(i) for i in range(total)])
+        elapsed = time.perf_counter() - started
+    succeeded = [result for result in results if result is not None]
+    return (
+        [latency for latency, _ in succeeded],
+        sum(frames for _, frames in succeeded),
+        elapsed,
+        total - len(succeeded),
+    )
+
+
+def get_json(url: str) -> Optional[dict]:
+    with httpx.Client(verify=False, timeout=10) as client:
+        response = client.get(url)
+        return response.json() if response.status_code == 200 else None
+
+
+def post_json(url: str) -> Optional[dict]:
+    with httpx.Client(verify=False, timeout=10) as client:
+        response = client.post(url)
+        return response.json() if response.status_code == 200 else None
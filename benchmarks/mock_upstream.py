@@ -0,0 +1,102 @@
+"""基准测试用的模拟上游（OpenAI兼容的/v1/chat/completions和/v1/models）
+
+行为由环境变量控制：
+- MOCK_LATENCY：返回响应（流式为第一个chunk）之前等待的秒数
+- MOCK_TOKENS：每个响应的token数
+- MOCK_TOKEN_INTERVAL：流式响应中相邻token之间的秒数
+- MOCK_REASONING：为true时回答以<think>...</think>开头
+
+用uvicorn启动时只支持HTTP/1.1；用hypercorn加TLS证书启动时通过ALPN同时支持HTTP/2和HTTP/1.1。
+GET /mock/stats返回收到的请求数、不同客户端连接数和各HTTP版本的请求数，POST /mock/reset清零。
+"""
+import asyncio
+import json
+import os
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+LATENCY = float(os.getenv("MOCK_LATENCY", "0.2"))
+TOKENS = int(os.getenv("MOCK_TOKENS", "20"))
+TOKEN_INTERVAL = float(os.getenv("MOCK_TOKEN_INTERVAL", "0.01"))
+REASONING = os.getenv("MOCK_REASONING", "false").lower() == "true"
+
+app = FastAPI()
+
+requests_seen = 0
+# (客户端地址, 端口)，每个TCP连接对应一个
+connections = set()
+http_versions = Counter()
+
+
+def _pieces():
+    pieces = ["<think>", "let me ", "think", "</think>"] if REASONING else []
+    return pieces + [f"token{i} " for i in range(TOKENS)]
+
+
+def _chunk(model: str, delta: dict, finish_reason=None) -> str:
+    chunk = {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion.chunk",
+        "created": 1700000000,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+@app.middleware("http")
+async def record_connection(request: Request, call_next):
+    global requests_seen
+    if request.url.path.startswith("/v1/"):
+        requests_seen += 1
+        connections.add(tuple(request.scope.get("client") or ()))
+        http_versions[request.scope.get("http_version", "1.1")] += 1
+    return await call_next(request)
+
+
+@app.get("/mock/stats")
+async def stats():
+    return {"requests": requests_seen, "connections": len(connections), "http_versions": dict(http_versions)}
+
+
+@app.post("/mock/reset")
+async def reset():
+    global requests_seen
+    requests_seen = 0
+    connections.clear()
+    http_versions.clear()
+    return {"ok": True}
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "bench-model", "object": "model", "created": 1700000000, "owned_by": "mock"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "bench-model")
+    await asyncio.sleep(LATENCY)
+
+    if not body.get("stream"):
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": 1700000000,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(_pieces())}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": TOKENS, "total_tokens": 10 + TOKENS},
+        }
+
+    async def generate():
+        for piece in _pieces():
+            yield _chunk(model, {"content": piece})
+            if TOKEN_INTERVAL > 0:
+                await asyncio.sleep(TOKEN_INTERVAL)
+        yield _chunk(model, {}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
@@ -46,6 +46,9 @@ setup(
             "flake8>=6.0.0",
             "mypy>=1.0.0",
         ],
+        "http2": [
+            "h2>=4.1.0",
+        ],
     },
     entry_points={
         "console_scripts": [
@@ -0,0 +1,180 @@
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from openai import APIStatusError
+
+from .circuit_breaker import is_upstream_failure
+from .exceptions import ModelNotServedError
+
+logger = logging.getLogger(__name__)
+
+
+class Upstream:
+    """一个OpenAI兼容的上游端点及其实时负载状态
+
+    api_key为该端点自己的凭据，配置后不会向它发送客户端的API Key；None表示转发客户端
+    （或服务端默认）的API Key，只应用于Hugging Face路由这类本身按租户鉴权的端点。
+    models为该端点提供的模型ID白名单，None表示提供所有模型。
+    """
+
+    # 不需要鉴权的自建端点（api_key配置为空字符串）发送的占位Key
+    NO_AUTH_KEY = "EMPTY"
+
+    def __init__(self, url: str, weight: float = 1.0, api_key: Optional[str] = None, models: Optional[Iterable[str]] = None):
+        self.url = url
+        self.weight = max(weight, 0.01)
+        self.api_key = api_key
+        self.models = set(models) if models else None
+        self.ewma_latency: Optional[float] = None
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+        # 统计信息
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+
+    @property
+    def is_ejected(self) -> bool:
+        return time.monotonic() < self.ejected_until
+
+    def serves(self, model: Optional[str]) -> bool:
+        """端点是否提供该模型（按上游模型ID精确匹配）"""
+        return model is None or self.models is None or model in self.models
+
+    def credential(self, client_api_key: Optional[str]) -> Optional[str]:
+        """发往该端点的API Key"""
+        if self.api_key is None:
+            return client_api_key
+        return self.api_key or self.NO_AUTH_KEY
+
+    def load(self, default_latency: float) -> float:
+        """负载评分：EWMA延迟 ×（在途请求数 + 1）/ 权重，越小越好"""
+        latency = self.ewma_latency if self.ewma_latency is not None else default_latency
+        return latency * (self.in_flight + 1) / self.weight
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "weight": self.weight,
+            "models": sorted(self.models) if self.models is not None else None,
+            "own_credentials": self.api_key is not None,
+            "ewma_latency": round(self.ewma_latency, 4) if self.ewma_latency is not None else None,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "ejected": self.is_ejected,
+            "ejections": self.ejections,
+        }
+
+
+class UpstreamBalancer:
+    """多上游的延迟感知负载均衡
+
+    只在提供所请求模型的上游中选择。按权重随机抽取两个候选（power of two choices），
+    选择EWMA延迟与在途请求数综合评分更低的一个。连续失败达到阈值的上游被临时摘除
+    （被动异常检测），但摘除比例不超过max_ejection_percent。
+    """
+
+    def __init__(
+        self,
+        upstreams: List[Upstream],
+        ewma_alpha: float,
+        ejection_failures: int,
+        ejection_seconds: float,
+        max_ejection_percent: float,
+    ):
+        self.upstreams = upstreams
+        self.ewma_alpha = ewma_alpha
+        self.ejection_failures = ejection_failures
+        self.ejection_seconds = ejection_seconds
+        self.max_ejection_percent = max_ejection_percent
+
+    @classmethod
+    def from_config(cls, app_config) -> "UpstreamBalancer":
+        """根据配置创建负载均衡器"""
+        return cls(
+            upstreams=[
+                Upstream(item["url"], item["weight"], item.get("api_key"), item.get("models"))
+                for item in app_config.hf_upstreams
+            ],
+            ewma_alpha=app_config.lb_ewma_alpha,
+            ejection_failures=app_config.lb_ejection_failures,
+            ejection_seconds=app_config.lb_ejection_seconds,
+            max_ejection_percent=app_config.lb_max_ejection_percent,
+        )
+
+    def choose(self, model: Optional[str] = None) -> Upstream:
+        """选择一个提供该模型的上游，没有时抛出ModelNotServedError"""
+        serving = [upstream for upstream in self.upstreams if upstream.serves(model)]
+        if not serving:
+            raise ModelNotServedError(model)
+        if len(serving) == 1:
+            return serving[0]
+
+        candidates = [upstream for upstream in serving if not upstream.is_ejected]
+        if not candidates:
+            candidates = serving
+
+        first = random.choices(candidates, weights=[u.weight for u in candidates])[0]
+        others = [upstream for upstream in candidates if upstream is not first]
+        if not others:
+            return first
+        second = random.choices(others, weights=[u.weight for u in others])[0]
+
+        # 尚无延迟样本的上游按已知上游的最低延迟计算，使其能尽快获得样本
+        known = [u.ewma_latency for u in candidates if u.ewma_latency is not None]
+        default_latency = min(known) if known else 1.0
+        return min((first, second), key=lambda u: u.load(default_latency))
+
+    def record(self, upstream: Upstream, latency: float, failed: bool):
+        """记录一次调用结果，更新EWMA延迟和异常摘除状态"""
+        if failed:
+            upstream.failures += 1
+            upstream.consecutive_failures += 1
+            if upstream.consecutive_failures >= self.ejection_failures and self._can_eject():
+                upstream.ejected_until = time.monotonic() + self.ejection_seconds
+                upstream.ejections += 1
+                upstream.consecutive_failures = 0
+                logger.warning(f"Ejecting upstream {upstream.url} for {self.ejection_seconds:g}s")
+            return
+
+        upstream.consecutive_failures = 0
+        if upstream.ewma_latency is None:
+            upstream.ewma_latency = latency
+        else:
+            upstream.ewma_latency += self.ewma_alpha * (latency - upstream.ewma_latency)
+
+    def _can_eject(self) -> bool:
+        ejected = sum(1 for upstream in self.upstreams if upstream.is_ejected)
+        return (ejected + 1) / len(self.upstreams) <= self.max_ejection_percent
+
+    async def call(self, operation: Callable[[Upstream], Awaitable], model: Optional[str] = None):
+        """选择提供该模型的上游并执行operation(upstream)"""
+        upstream = self.choose(model)
+        upstream.requests += 1
+        upstream.in_flight += 1
+        started_at = time.monotonic()
+        try:
+            result = await operation(upstream)
+        except Exception as e:
+            if is_upstream_failure(e) or self._is_credential_failure(upstream, e):
+                self.record(upstream, time.monotonic() - started_at, failed=True)
+            raise
+        else:
+            self.record(upstream, time.monotonic() - started_at, failed=False)
+            return result
+        finally:
+            upstream.in_flight -= 1
+
+    @staticmethod
+    def _is_credential_failure(upstream: Upstream, error: Exception) -> bool:
+        """使用端点自己凭据的请求被拒绝（401/403）说明端点配置有误，计为该端点的故障"""
+        return upstream.api_key is not None and isinstance(error, APIStatusError) and error.status_code in (401, 403)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各上游状态"""
+        return {upstream.url: upstream.get_stats() for upstream in self.upstreams}
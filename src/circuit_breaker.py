@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Dict
+
+from openai import APIConnectionError, APIStatusError
+
+from .exceptions import CircuitOpenError, UpstreamTimeoutError
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """上游5xx、连接失败和超时计为上游故障；4xx是请求本身的问题，不计入"""
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    return isinstance(error, (APIConnectionError, UpstreamTimeoutError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """单个模型/provider的熔断器
+
+    - closed: 正常放行，统计最近window_size次调用的失败率和慢调用率
+    - open: 失败率或慢调用率超过阈值后直接拒绝，open_duration秒后进入half_open
+    - half_open: 只放行probes个探测请求，全部成功则恢复closed，任一失败则重新open
+    """
+
+    def __init__(
+        self,
+        key: str,
+        failure_rate_threshold: float,
+        slow_call_seconds: float,
+        slow_call_rate_threshold: float,
+        window_size: int,
+        min_calls: int,
+        open_duration: float,
+        probes: int,
+    ):
+        self.key = key
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+        self.probes = max(probes, 1)
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        # (是否失败, 是否慢调用)
+        self._outcomes: deque = deque(maxlen=window_size)
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        # 统计信息
+        self.rejected = 0
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        """判断是否放行一次调用"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_duration:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+            logger.info(f"Circuit for {self.key} is half-open, sending probe requests")
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.probes:
+                self.rejected += 1
+                return False
+            self._probes_in_flight += 1
+        return True
+
+    def retry_after(self) -> float:
+        """距离熔断器进入half_open的剩余时间"""
+        return max(self.open_duration - (time.monotonic() - self.opened_at), 0.0)
+
+    def record_success(self, latency: float):
+        """记录一次成功调用"""
+        slow = self.slow_call_seconds > 0 and latency >= self.slow_call_seconds
+        if self.state == HALF_OPEN:
+            self._probes_in_flight -= 1
+            if slow:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.probes:
+                self.state = CLOSED
+                self._outcomes.clear()
+                logger.info(f"Circuit for {self.key} closed")
+            return
+        self._outcomes.append((False, slow))
+        self._check_thresholds()
+
+    def record_failure(self):
+        """记录一次失败调用"""
+        if self.state == HALF_OPEN:
+            self._probes_in_flight -= 1
+            self._open()
+            return
+        self._outcomes.append((True, False))
+        self._check_thresholds()
+
+    def record_ignored(self):
+        """调用结果与上游健康无关（如客户端错误、请求被取消），只释放探测名额"""
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    def _check_thresholds(self):
+        calls = len(self._outcomes)
+        if self.state != CLOSED or calls < self.min_calls:
+            return
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow_calls = sum(1 for _, slow in self._outcomes if slow)
+        if failures / calls >= self.failure_rate_threshold:
+            self._open()
+        elif self.slow_call_seconds > 0 and slow_calls / calls >= self.slow_call_rate_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._outcomes.clear()
+        logger.warning(f"Circuit for {self.key} opened for {self.open_duration:g}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取熔断器状态"""
+        calls = len(self._outcomes)
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "failure_rate": round(failures / calls, 4) if calls else 0.0,
+            "retry_after": round(self.retry_after(), 2) if self.state == OPEN else 0.0,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreakerRegistry:
+    """按模型ID（包含provider后缀）管理熔断器"""
+
+    # 模型ID来自客户端，限制熔断器数量防止内存无限增长
+    MAX_BREAKERS = 1000
+
+    def __init__(self, app_config):
+        self.config = app_config
+        self.enabled = app_config.circuit_breaker_enabled
+        self._breakers: "OrderedDict[str, CircuitBreaker]" = OrderedDict()
+
+    def get(self, model: str) -> CircuitBreaker:
+        """获取（或创建）模型对应的熔断器"""
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                key=model,
+                failure_rate_threshold=self.config.cb_failure_rate,
+                slow_call_seconds=self.config.cb_slow_call_seconds,
+                slow_call_rate_threshold=self.config.cb_slow_call_rate,
+                window_size=self.config.cb_window_size,
+                min_calls=self.config.cb_min_calls,
+                open_duration=self.config.cb_open_seconds,
+                probes=self.config.cb_half_open_probes,
+            )
+            self._breakers[model] = breaker
+            if len(self._breakers) > self.MAX_BREAKERS:
+                self._evict_one()
+        else:
+            self._breakers.move_to_end(model)
+        return breaker
+
+    def _evict_one(self):
+        # 优先淘汰最久未使用的closed熔断器，保留open状态以免绕过熔断
+        for key, breaker in self._breakers.items():
+            if breaker.state == CLOSED:
+                del self._breakers[key]
+                return
+        self._breakers.popitem(last=False)
+
+    def is_open(self, model: str) -> bool:
+        """熔断器当前是否拒绝请求（只读，不消耗half_open的探测名额）"""
+        breaker = self._breakers.get(model)
+        if not self.enabled or breaker is None or breaker.state != OPEN:
+            return False
+        return breaker.retry_after() > 0
+
+    async def call(self, model: str, operation: Callable[[], Awaitable]):
+        """经过熔断器执行operation，熔断时立即抛出CircuitOpenError"""
+        if not self.enabled:
+            return await operation()
+
+        breaker = self.get(model)
+        if not breaker.allow():
+            raise CircuitOpenError(model, breaker.retry_after())
+
+        started_at = time.monotonic()
+        try:
+            result = await operation()
+        except BaseException as e:
+            if isinstance(e, Exception) and is_upstream_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.record_ignored()
+            raise
+        breaker.record_success(time.monotonic() - started_at)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取所有熔断器状态"""
+        return {
+            "enabled": self.enabled,
+            "breakers": {key: breaker.get_stats() for key, breaker in self._breakers.items()},
+        }
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def hash_api_key(api_key: str) -> str:
+    """计算API Key的哈希值，缓存中绝不保存原始Key"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class ClientCache:
+    """按API Key哈希缓存上游客户端的有界LRU缓存
+
+    超过最大条目数时淘汰最久未使用的客户端，超过TTL的客户端在下次访问时淘汰。
+    被淘汰的客户端交给on_evict回调关闭。
+    """
+
+    def __init__(self, max_entries: int, ttl: float, on_evict: Optional[Callable[[Any], Any]] = None):
+        """初始化缓存"""
+        self.max_entries = max(max_entries, 1)
+        self.ttl = ttl
+        self.on_evict = on_evict
+        # key -> (client, created_at)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str):
+        """获取缓存的客户端，不存在或已过期时返回None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        client, created_at = entry
+        if self.ttl > 0 and time.monotonic() - created_at > self.ttl:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            self._evict(client)
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return client
+
+    def put(self, key: str, client):
+        """放入客户端，必要时淘汰最久未使用的条目"""
+        old = self._entries.pop(key, None)
+        if old is not None and old[0] is not client:
+            self._evict(old[0])
+
+        self._entries[key] = (client, time.monotonic())
+        while len(self._entries) > self.max_entries:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.evictions += 1
+            self._evict(evicted)
+
+    def get_or_create(self, key: str, factory: Callable[[], Any]):
+        """获取缓存的客户端，未命中时通过factory创建并缓存"""
+        client = self.get(key)
+        if client is None:
+            client = factory()
+            self.put(key, client)
+        return client
+
+    def clear(self):
+        """清空缓存并关闭所有客户端"""
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for client, _ in entries:
+            self._evict(client)
+
+    def _evict(self, client):
+        """调用淘汰回调，异步回调在当前事件循环中后台执行"""
+        if self.on_evict is None:
+            return
+        try:
+            result = self.on_evict(client)
+        except Exception as e:
+            logger.warning(f"Error closing evicted client: {str(e)}")
+            return
+        if asyncio.iscoroutine(result):
+            try:
+                asyncio.get_running_loop().create_task(result)
+            except RuntimeError:
+                # 没有运行中的事件循环，无法异步关闭
+                result.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -1,4 +1,5 @@
 import os
+import json
 from typing import Optional
 from dotenv import load_dotenv
 
@@ -13,6 +14,14 @@ class Config:
         # Hugging Face 配置
         self.hf_token: str = os.getenv("HF_TOKEN", "")
         self.hf_base_url: str = os.getenv("HF_BASE_URL", "https://router.huggingface.co/v1")
+        # 多个OpenAI兼容上游及权重，格式 "url|weight,url|weight"，未配置时只使用HF_BASE_URL
+        self.hf_upstreams: list = self._parse_upstreams(os.getenv("HF_UPSTREAMS", ""))
+        
+        # 负载均衡配置（EWMA延迟平滑系数、连续失败摘除阈值、摘除时长、最大摘除比例）
+        self.lb_ewma_alpha: float = float(os.getenv("LB_EWMA_ALPHA", "0.3"))
+        self.lb_ejection_failures: int = int(os.getenv("LB_EJECTION_FAILURES", "5"))
+        self.lb_ejection_seconds: float = float(os.getenv("LB_EJECTION_SECONDS", "30"))
+        self.lb_max_ejection_percent: float = float(os.getenv("LB_MAX_EJECTION_PERCENT", "0.5"))
         
         # 服务器配置
         self.host: str = os.getenv("HOST", "0.0.0.0")
@@ -26,12 +35,132 @@ class Config:
         # 默认模型配置
         self.default_model: str = os.getenv("DEFAULT_MODEL", "openai/gpt-oss-120b:fireworks-ai")
         
-        # 请求超时配置
+        # 请求超时配置（REQUEST_TIMEOUT为单个请求的总时长上限）
         self.request_timeout: int = int(os.getenv("REQUEST_TIMEOUT", "300"))
+        self.upstream_connect_timeout: float = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "10"))
+        self.upstream_first_token_timeout: float = float(os.getenv("UPSTREAM_FIRST_TOKEN_TIMEOUT", "120"))
+        self.upstream_idle_timeout: float = float(os.getenv("UPSTREAM_IDLE_TIMEOUT", "60"))
+        # 按模型覆盖超时，JSON格式，例如 {"deepseek-ai/DeepSeek-R1": {"first_token": 600}}
+        self.model_timeouts: dict = json.loads(os.getenv("MODEL_TIMEOUTS", "{}"))
+        
+        # 上游重试配置（RETRY_BUDGET_RATIO限制重试带来的额外请求比例）
+        self.upstream_max_retries: int = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+        self.retry_base_delay: float = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+        self.retry_max_delay: float = float(os.getenv("RETRY_MAX_DELAY", "8"))
+        self.retry_budget_ratio: float = float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+        
+        # 非流式请求对冲配置（HEDGE_DELAY为0时使用模型最近延迟的HEDGE_PERCENTILE分位数）
+        self.hedge_enabled: bool = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+        self.hedge_delay: float = float(os.getenv("HEDGE_DELAY", "0"))
+        self.hedge_percentile: float = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+        self.hedge_min_samples: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+        self.hedge_max_fraction: float = float(os.getenv("HEDGE_MAX_FRACTION", "0.05"))
+        
+        # 不带provider后缀的模型自动选择最快的provider（默认关闭）
+        self.provider_selection_enabled: bool = os.getenv("PROVIDER_SELECTION_ENABLED", "false").lower() == "true"
+        self.provider_exploration_rate: float = float(os.getenv("PROVIDER_EXPLORATION_RATE", "0.1"))
+        self.provider_ewma_alpha: float = float(os.getenv("PROVIDER_EWMA_ALPHA", "0.3"))
+        self.provider_expected_tokens: int = int(os.getenv("PROVIDER_EXPECTED_TOKENS", "256"))
+        # 模型可用的provider，JSON格式，例如 {"openai/gpt-oss-120b": ["fireworks-ai", "cerebras"]}
+        # 未配置的模型从/v1/models返回的providers字段和带后缀的请求中学习
+        self.model_providers: dict = json.loads(os.getenv("MODEL_PROVIDERS", "{}"))
+        
+        # 客户端断开检测的轮询间隔（秒），为0时只依赖ASGI服务器取消生成器
+        self.disconnect_poll_interval: float = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+        
+        # 等待首个token期间发送SSE心跳（": keep-alive"）的间隔（秒），为0时不发送
+        self.sse_heartbeat_interval: float = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))
+        
+        # 不需要任何转换时原样透传上游的SSE字节（默认关闭）
+        self.stream_passthrough: bool = os.getenv("STREAM_PASSTHROUGH", "false").lower() == "true"
+        
+        # 流式响应中上游读取与客户端写入之间的缓冲高水位（估算字节数），为0时两者同步进行
+        # 客户端落后超过高水位时的策略：coalesce（合并缓冲的内容）、drop（中止该流）、block（暂停读取上游）
+        self.stream_buffer_high_water: int = int(os.getenv("STREAM_BUFFER_HIGH_WATER", "65536"))
+        self.stream_backpressure_policy: str = os.getenv("STREAM_BACKPRESSURE_POLICY", "coalesce").lower()
+        
+        # 流式响应合并连续的内容delta（默认关闭），在时间窗口（秒）或字节数达到上限时发出
+        self.stream_coalesce_enabled: bool = os.getenv("STREAM_COALESCE_ENABLED", "false").lower() == "true"
+        self.stream_coalesce_window: float = float(os.getenv("STREAM_COALESCE_WINDOW", "0.02"))
+        self.stream_coalesce_bytes: int = int(os.getenv("STREAM_COALESCE_BYTES", "256"))
+        
+        # 流式响应中将</think>之前的内容作为delta.reasoning发送
+        # REASONING_MODELS中的模型没有<think>开始标签，从流开头就按思考内容处理（按子串匹配，逗号分隔）
+        # 默认的DeepSeek-R1与非流式响应的拆分一致；这些模型的流如果没有</think>，全部内容都会作为思考内容发送
+        self.stream_reasoning_split: bool = os.getenv("STREAM_REASONING_SPLIT", "true").lower() == "true"
+        self.reasoning_models: list = [
+            item.strip() for item in os.getenv("REASONING_MODELS", "DeepSeek-R1").split(",") if item.strip()
+        ]
+        
+        # 模型降级链，JSON格式，例如 {"deepseek-ai/DeepSeek-R1": ["Qwen/QwQ-32B"]}
+        self.model_fallbacks: dict = json.loads(os.getenv("MODEL_FALLBACKS", "{}"))
+        
+        # 熔断器配置（按模型ID及provider后缀，CB_SLOW_CALL_SECONDS为0时不统计慢调用）
+        self.circuit_breaker_enabled: bool = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+        self.cb_failure_rate: float = float(os.getenv("CB_FAILURE_RATE", "0.5"))
+        self.cb_slow_call_seconds: float = float(os.getenv("CB_SLOW_CALL_SECONDS", "0"))
+        self.cb_slow_call_rate: float = float(os.getenv("CB_SLOW_CALL_RATE", "0.8"))
+        self.cb_window_size: int = int(os.getenv("CB_WINDOW_SIZE", "20"))
+        self.cb_min_calls: int = int(os.getenv("CB_MIN_CALLS", "10"))
+        self.cb_open_seconds: float = float(os.getenv("CB_OPEN_SECONDS", "30"))
+        self.cb_half_open_probes: int = int(os.getenv("CB_HALF_OPEN_PROBES", "1"))
+        
+        # 上游连接池配置
+        self.http_pool_size: int = int(os.getenv("HTTP_POOL_SIZE", "20"))
+        self.http_max_connections: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.http_keepalive_expiry: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+        self.http2_enabled: bool = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+        
+        # 确定性（temperature=0）请求的响应缓存（默认关闭），按响应体字节数限制总大小
+        self.response_cache_enabled: bool = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+        self.response_cache_max_bytes: int = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.response_cache_ttl: float = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+        # 缓存后端：memory（进程内）或sqlite（持久化，多个worker进程共享）
+        self.response_cache_backend: str = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+        self.response_cache_path: str = os.getenv("RESPONSE_CACHE_PATH", "./cache/responses.db")
+        
+        # 合并并发的相同确定性请求，只向上游发送一次（默认关闭）
+        self.request_coalescing_enabled: bool = os.getenv("REQUEST_COALESCING_ENABLED", "false").lower() == "true"
+        
+        # 按API Key缓存的上游客户端配置
+        self.client_cache_size: int = int(os.getenv("CLIENT_CACHE_SIZE", "256"))
+        self.client_cache_ttl: float = float(os.getenv("CLIENT_CACHE_TTL", "600"))
+        
+        # /v1/models的模型列表缓存（0表示不缓存），过期后在stale时间内先返回旧列表并在后台刷新
+        self.models_cache_ttl: float = float(os.getenv("MODELS_CACHE_TTL", "300"))
+        self.models_cache_stale_ttl: float = float(os.getenv("MODELS_CACHE_STALE_TTL", "3600"))
         
         # 不需要验证HF_TOKEN，因为支持客户端传递
         # self._validate_config()
     
+    def _parse_upstreams(self, value: str) -> list:
+        """解析HF_UPSTREAMS配置
+
+        支持 url|weight,url|weight 简写，或JSON数组：
+        [{"url": ..., "weight": 1, "api_key": ..., "models": [...]}]
+        api_key为该端点自己的凭据（空字符串表示不需要鉴权），models为该端点提供的模型白名单。
+        """
+        value = value.strip()
+        if value.startswith("["):
+            upstreams = [
+                {
+                    "url": item["url"],
+                    "weight": float(item.get("weight", 1.0)),
+                    "api_key": item.get("api_key"),
+                    "models": item.get("models"),
+                }
+                for item in json.loads(value)
+            ]
+            return upstreams or [{"url": self.hf_base_url, "weight": 1.0}]
+        upstreams = []
+        for item in value.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            url, _, weight = item.partition("|")
+            upstreams.append({"url": url.strip(), "weight": float(weight) if weight else 1.0})
+        return upstreams or [{"url": self.hf_base_url, "weight": 1.0}]
+    
     def _validate_config(self):
         """验证配置"""
         # HF_TOKEN不再是必需的，支持客户端传递
@@ -1,15 +1,16 @@
+import asyncio
 import time
+from collections import deque
 import uuid
 import re
-from typing import List, Dict, Any, AsyncGenerator
-from openai import OpenAI
+from typing import List, Dict, Any, AsyncGenerator, Awaitable, Callable, Optional, Set, Tuple
+import anyio
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
 from .models import (
     ChatCompletionRequest,
     ChatCompletionResponse,
-    ChatCompletionStreamResponse,
     Choice,
-    StreamChoice,
-    Delta,
     Usage,
     Message,
     Model,
@@ -19,6 +20,22 @@ from .models import (
     ContentType
 )
 from .config import config
+from .upstream import UpstreamPool
+from .client_cache import ClientCache, hash_api_key
+from .response_cache import create_response_cache, cache_key
+from .singleflight import SingleFlight
+from .model_list_cache import ModelListCache, serialize_models
+from .exceptions import ProxyError, CircuitOpenError, ModelNotServedError, UpstreamTimeoutError
+from .timeouts import TimeoutPolicy
+from .retry import RetryPolicy, RetryBudget
+from .hedging import HedgePolicy
+from .circuit_breaker import CircuitBreakerRegistry
+from .balancer import UpstreamBalancer, Upstream
+from .provider_selector import ProviderSelector
+from .stream_stats import StreamStats
+from .stream_buffer import StreamBuffer, pump
+from .sse import StreamChunkEncoder, coalesce_deltas, with_heartbeats
+from .reasoning import ReasoningSplitter
 import json
 import logging
 
@@ -28,12 +45,71 @@ logger = logging.getLogger(__name__)
 class HuggingFaceConverter:
     """Hugging Face API转换器"""
     
-    def __init__(self):
+    # DEBUG日志级别下每个流保留的最近chunk数
+    DEBUG_TAIL_CHUNKS = 64
+    
+    def __init__(self, upstream_pool: UpstreamPool = None):
         """初始化转换器"""
         self.config = config
+        
+        # 共享的上游连接池（未由lifespan提供时自行创建，例如Vercel环境）
+        self.upstream_pool = upstream_pool or UpstreamPool()
+        self._base_client = None
+        
+        # 按API Key哈希缓存的客户端，重复调用方直接复用
+        self.client_cache = ClientCache(
+            max_entries=self.config.client_cache_size,
+            ttl=self.config.client_cache_ttl,
+            on_evict=self._close_client,
+        )
+        
+        # 上游429/5xx和连接失败的重试策略（SDK自带的重试已关闭）
+        self.retry_policy = RetryPolicy(
+            max_retries=self.config.upstream_max_retries,
+            base_delay=self.config.retry_base_delay,
+            max_delay=self.config.retry_max_delay,
+            budget=RetryBudget(ratio=self.config.retry_budget_ratio),
+        )
+        
+        # 按模型/provider的熔断器，后端故障时快速失败
+        self.circuit_breakers = CircuitBreakerRegistry(self.config)
+        
+        # 非流式请求的对冲策略（默认关闭）
+        self.hedge_policy = HedgePolicy(
+            enabled=self.config.hedge_enabled,
+            delay=self.config.hedge_delay,
+            percentile=self.config.hedge_percentile,
+            min_samples=self.config.hedge_min_samples,
+            max_fraction=self.config.hedge_max_fraction,
+        )
+        
+        # 多个上游端点之间的延迟感知负载均衡
+        self.balancer = UpstreamBalancer.from_config(self.config)
+        
+        # 不带provider后缀的模型自动选择最快的健康provider
+        self.provider_selector = ProviderSelector(self.config, self.circuit_breakers)
+        
+        # 模型降级次数统计，键为 "原模型 -> 降级模型"
+        self.fallbacks: Dict[str, int] = {}
+        
+        # 流式响应统计（含客户端断开后节省的上游token）
+        self.stream_stats = StreamStats()
+        
+        # 确定性（temperature=0）请求的响应缓存（默认关闭）
+        self.response_cache = None
+        if self.config.response_cache_enabled:
+            self.response_cache = create_response_cache(self.config)
+        
+        # 并发的相同确定性请求合并（默认关闭）
+        self.singleflight = SingleFlight() if self.config.request_coalescing_enabled else None
+        
+        # /v1/models的模型列表缓存（stale-while-revalidate）
+        self.models_cache = None
+        if self.config.models_cache_ttl > 0:
+            self.models_cache = ModelListCache(self.config.models_cache_ttl, self.config.models_cache_stale_ttl)
     
-    def get_client(self, api_key: str = None):
-        """获取OpenAI客户端，支持动态API Key"""
+    def get_client(self, api_key: str = None, base_url: str = None):
+        """获取异步OpenAI客户端，支持动态API Key和上游地址"""
         # 优先使用客户端传递的API Key
         if api_key:
             effective_api_key = api_key
@@ -46,11 +122,45 @@ class HuggingFaceConverter:
             effective_api_key = "client-api-key-required"
             logger.warning("🔑 No API key available - client must provide valid HF token")
         
-        return OpenAI(
-            base_url=self.config.hf_base_url,
-            api_key=effective_api_key,
+        # 所有客户端共享同一个连接池，连接池重建后已缓存的客户端全部失效
+        if self._base_client is None or not self.upstream_pool.is_started:
+            self.client_cache.clear()
+            self._base_client = AsyncOpenAI(
+                base_url=self.config.hf_base_url,
+                api_key=effective_api_key,
+                http_client=self.upstream_pool.start(),
+                max_retries=0,
+            )
+        
+        base_url = base_url or self.config.hf_base_url
+        return self.client_cache.get_or_create(
+            f"{base_url}|{hash_api_key(effective_api_key)}",
+            lambda: self._base_client.with_options(api_key=effective_api_key, base_url=base_url),
         )
     
+    async def _close_client(self, client: AsyncOpenAI):
+        """关闭被淘汰的客户端（共享连接池由lifespan负责关闭）"""
+        if self.upstream_pool.http_client is not None and client._client is self.upstream_pool.http_client:
+            return
+        await client.close()
+    
+    async def get_stats(self) -> Dict[str, Any]:
+        """获取代理运行统计信息"""
+        return {
+            "upstream_pool": self.upstream_pool.get_stats(),
+            "client_cache": self.client_cache.get_stats(),
+            "retry": self.retry_policy.get_stats(),
+            "hedging": self.hedge_policy.get_stats(),
+            "circuit_breakers": self.circuit_breakers.get_stats(),
+            "upstreams": self.balancer.get_stats(),
+            "providers": self.provider_selector.get_stats(),
+            "fallbacks": dict(self.fallbacks),
+            "streams": self.stream_stats.get_stats(),
+            "response_cache": await self.response_cache.get_stats() if self.response_cache is not None else None,
+            "singleflight": self.singleflight.get_stats() if self.singleflight is not None else None,
+            "models_cache": self.models_cache.get_stats() if self.models_cache is not None else None,
+        }
+    
     def convert_messages_to_hf_format(self, messages: List[Message]) -> List[Dict[str, Any]]:
         """将OpenAI消息格式转换为Hugging Face格式"""
         hf_messages = []
@@ -86,6 +196,54 @@ class HuggingFaceConverter:
                 })
         return hf_messages
     
+    def build_upstream_params(self, request: ChatCompletionRequest, hf_messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """构造发往上游的请求参数（不含stream和timeout）"""
+        params = {
+            "model": request.model,
+            "messages": hf_messages,
+            "temperature": request.temperature,
+            "top_p": request.top_p,
+            "max_tokens": request.max_tokens,
+            "stop": request.stop,
+        }
+        if request.stream and request.stream_options and request.stream_options.include_usage:
+            # 请求上游在流中返回usage（当前SDK版本的create()没有stream_options参数）
+            params["extra_body"] = {"stream_options": {"include_usage": True}}
+        return params
+    
+    async def _call_upstream(self, params: Dict[str, Any], api_key: str, policy: TimeoutPolicy, stream: bool):
+        """发起上游请求（流式请求只负责打开流）
+
+        由外到内依次为：模型/provider熔断时直接失败 → 429/5xx按退避策略重试 →
+        慢请求对冲（仅非流式）→ 选择上游端点 → 连接/首个token/总时长超时。
+        熔断器只统计重试后的最终结果，单个上游端点的故障由负载均衡摘除处理。
+        """
+        model = params["model"]
+        
+        async def attempt(upstream: Upstream):
+            # 配置了自己凭据的端点不会收到客户端的API Key
+            client = self.get_client(upstream.credential(api_key), upstream.url)
+            started_at = time.monotonic()
+            response = await policy.run(
+                client.chat.completions.create(**params, stream=stream, timeout=policy.http_timeout(stream)),
+                "first_token" if stream else "total"
+            )
+            if not stream:
+                # 只计时成功的这一次调用（不含重试等待和被取消的对冲），输出token数以上游的usage为准
+                usage = getattr(response, "usage", None)
+                completion_tokens = getattr(usage, "completion_tokens", None) or 0
+                self.provider_selector.record_completion(model, completion_tokens, time.monotonic() - started_at)
+            return response
+        
+        async def balanced():
+            return await self.balancer.call(attempt, model)
+        
+        if stream:
+            operation = balanced
+        else:
+            operation = lambda: self.hedge_policy.run(model, balanced)
+        return await self.circuit_breakers.call(model, lambda: self.retry_policy.run(operation, policy))
+    
     def generate_response_id(self) -> str:
         """生成响应ID"""
         return f"chatcmpl-{uuid.uuid4().hex[:29]}"
@@ -139,37 +297,329 @@ class HuggingFaceConverter:
         # 如果没有thinking标签，返回原内容作为最终回答
         return "", content
     
+    async def _open_with_fallback(
+        self,
+        request: ChatCompletionRequest,
+        hf_messages: List[Dict[str, Any]],
+        api_key: str,
+        stream: bool
+    ) -> Tuple[str, Dict[str, Any], TimeoutPolicy, Any]:
+        """按降级链依次尝试模型，返回(实际服务的模型, 上游参数, 超时策略, 上游响应)
+
+        模型过载、故障或熔断时，在向客户端发送任何数据之前透明地切换到降级链中的下一个模型。
+        """
+        chain = [request.model] + list(self.config.model_fallbacks.get(request.model, []))
+        for index, model in enumerate(chain):
+            # 不带provider后缀时选择最快的provider
+            params = self.build_upstream_params(request, hf_messages)
+            params["model"] = self.provider_selector.select(model)
+            policy = TimeoutPolicy.for_model(model)
+            try:
+                response = await self._call_upstream(params, api_key, policy, stream)
+                return model, params, policy, response
+            except APITimeoutError as e:
+                error = policy.from_client_timeout(e)
+            except Exception as e:
+                error = e
+            # 包括4xx在内的失败都计入provider评分，坏的provider不会一直被选中
+            self.provider_selector.record_failure(params["model"])
+            
+            if index == len(chain) - 1 or not self._should_fall_back(error):
+                raise error
+            logger.warning(f"Model {model} unavailable ({str(error)}), falling back to {chain[index + 1]}")
+            key = f"{model} -> {chain[index + 1]}"
+            self.fallbacks[key] = self.fallbacks.get(key, 0) + 1
+    
+    @staticmethod
+    def _should_fall_back(error: Exception) -> bool:
+        """过载（429）、上游故障、熔断和没有上游提供该模型时降级；其他4xx是请求本身的问题，换模型也无济于事"""
+        if isinstance(error, (CircuitOpenError, UpstreamTimeoutError, ModelNotServedError)):
+            return True
+        if isinstance(error, APIStatusError):
+            return error.status_code == 429 or error.status_code >= 500
+        return isinstance(error, APIConnectionError)
+    
     async def create_chat_completion(
         self, 
         request: ChatCompletionRequest,
         api_key: str = None
     ) -> ChatCompletionResponse:
-        """创建聊天完成（非流式）"""
+        """创建聊天完成（非流式），响应中的model为实际服务的模型"""
         try:
             # 转换消息格式
             hf_messages = self.convert_messages_to_hf_format(request.messages)
             
-            # 使用动态API Key获取客户端
-            client = self.get_client(api_key)
-            
             # 调用Hugging Face API
-            response = client.chat.completions.create(
-                model=request.model,
-                messages=hf_messages,
-                temperature=request.temperature,
-                top_p=request.top_p,
-                max_tokens=request.max_tokens,
-                stop=request.stop,
-                stream=False
+            served_model, params, policy, response = await self._open_with_fallback(
+                request, hf_messages, api_key, stream=False
             )
             
             # 转换响应格式
-            return self._convert_hf_response_to_openai(response, request.model, request)
+            return self._convert_hf_response_to_openai(response, served_model, request)
             
+        except ProxyError as e:
+            logger.warning(f"Proxy error in create_chat_completion: {str(e)}")
+            raise
         except Exception as e:
             logger.error(f"Error in create_chat_completion: {str(e)}")
             raise
     
+    @staticmethod
+    def is_deterministic(request: ChatCompletionRequest) -> bool:
+        """请求是否为确定性采样的单个回答（相同请求的结果可以共享）"""
+        return request.temperature == 0 and (request.n or 1) == 1
+    
+    def is_cacheable(self, request: ChatCompletionRequest) -> bool:
+        """请求的响应是否可以缓存（启用缓存且为确定性请求）"""
+        return self.response_cache is not None and self.is_deterministic(request)
+    
+    def response_cache_key(self, request: ChatCompletionRequest, api_key: str = None) -> str:
+        """按模型、转换后的消息、采样参数和API Key计算缓存键"""
+        hf_messages = self.convert_messages_to_hf_format(request.messages)
+        params = self.build_upstream_params(request, hf_messages)
+        params.pop("extra_body", None)
+        effective_api_key = api_key or self.config.hf_token or ""
+        return cache_key(params, hash_api_key(effective_api_key))
+    
+    async def cached_chat_completion(
+        self,
+        request: ChatCompletionRequest,
+        api_key: str = None,
+        cache_control: str = None
+    ) -> Tuple[bytes, str, str]:
+        """经过响应缓存的非流式聊天完成，返回(响应体, 实际服务的模型, 缓存状态)
+
+        缓存状态为HIT、MISS、BYPASS或COALESCED（与并发的相同请求共享了同一个上游响应）。
+        Cache-Control: no-cache跳过缓存读取但仍写入新结果，no-store既不读取也不写入。
+        合并的请求中只有发起上游请求的一方写入缓存。降级模型的回答不写入缓存，
+        否则在TTL内原模型恢复后仍会返回降级模型的结果。
+        """
+        directives = self._cache_directives(cache_control)
+        key = self.response_cache_key(request, api_key)
+        
+        if "no-cache" not in directives and "no-store" not in directives:
+            cached = await self.response_cache.get(key)
+            if cached is not None:
+                body, served_model = cached
+                return body, served_model, "HIT"
+        
+        async def complete() -> Tuple[bytes, str]:
+            response = await self.create_chat_completion(request, api_key)
+            body = response.model_dump_json().encode("utf-8")
+            if "no-store" not in directives and response.model == request.model:
+                await self.response_cache.put(key, body, response.model)
+            return body, response.model
+        
+        if self.singleflight is not None:
+            (body, served_model), leader = await self.singleflight.do(f"cached:{key}", complete)
+            if not leader:
+                return body, served_model, "COALESCED"
+        else:
+            body, served_model = await complete()
+        return body, served_model, "BYPASS" if directives & {"no-cache", "no-store"} else "MISS"
+    
+    async def cached_chat_completion_stream(
+        self,
+        request: ChatCompletionRequest,
+        api_key: str = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        cache_control: str = None
+    ) -> Tuple[Optional[str], AsyncGenerator[str, None], str]:
+        """经过响应缓存的流式聊天完成，返回(实际服务的模型, SSE生成器, 缓存状态)
+
+        命中时将缓存的响应重放为SSE流；未命中时正常请求上游，完整结束的流写入缓存，
+        之后流式和非流式请求都可以命中。Cache-Control的处理与cached_chat_completion相同。
+        """
+        directives = self._cache_directives(cache_control)
+        key = self.response_cache_key(request, api_key)
+        
+        if "no-cache" not in directives and "no-store" not in directives:
+            cached = await self.response_cache.get(key)
+            if cached is not None:
+                body, served_model = cached
+                include_usage = bool(request.stream_options and request.stream_options.include_usage)
+                return served_model, self._replay_stream(body, served_model, include_usage), "HIT"
+        
+        store_key = None if "no-store" in directives else key
+        served_model, chunks, leader = await self._coalesced_stream(
+            request, api_key, is_disconnected, cache_key=store_key, key=key
+        )
+        if not leader:
+            # 加入了进行中的相同流，由发起流的请求负责写入缓存
+            return served_model, chunks, "COALESCED"
+        return served_model, chunks, "BYPASS" if directives & {"no-cache", "no-store"} else "MISS"
+    
+    async def coalesced_chat_completion(
+        self,
+        request: ChatCompletionRequest,
+        api_key: str = None
+    ) -> ChatCompletionResponse:
+        """非流式聊天完成：相同的确定性请求并发时只向上游发送一次，每个请求得到结果的副本"""
+        if self.singleflight is None or not self.is_deterministic(request):
+            return await self.create_chat_completion(request, api_key)
+        return await self._complete_once(request, api_key, self.response_cache_key(request, api_key))
+    
+    async def _complete_once(self, request: ChatCompletionRequest, api_key: Optional[str], key: str) -> ChatCompletionResponse:
+        response, _ = await self.singleflight.do(f"json:{key}", lambda: self.create_chat_completion(request, api_key))
+        return response.model_copy(deep=True)
+    
+    async def coalesced_chat_completion_stream(
+        self,
+        request: ChatCompletionRequest,
+        api_key: str = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        cache_key: Optional[str] = None,
+        key: Optional[str] = None
+    ) -> Tuple[Optional[str], AsyncGenerator[str, None]]:
+        """流式聊天完成：相同的确定性请求并发时共享同一个上游流，返回值与start_chat_completion_stream相同
+
+        后加入的请求从第一帧开始收到完整的流。上游流不跟随任何一个客户端的断开，
+        所有客户端都断开后才关闭。打开失败时每个请求都得到同一个异常。
+        """
+        served_model, chunks, _ = await self._coalesced_stream(request, api_key, is_disconnected, cache_key, key)
+        return served_model, chunks
+    
+    async def _coalesced_stream(
+        self,
+        request: ChatCompletionRequest,
+        api_key: Optional[str],
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]],
+        cache_key: Optional[str],
+        key: Optional[str]
+    ) -> Tuple[Optional[str], AsyncGenerator[str, None], bool]:
+        """同coalesced_chat_completion_stream，额外返回是否为发起上游流的请求（只有它的cache_key生效）"""
+        if self.singleflight is None or not self.is_deterministic(request):
+            served_model, chunks = await self.start_chat_completion_stream(request, api_key, is_disconnected, cache_key)
+            return served_model, chunks, True
+        
+        key = key or self.response_cache_key(request, api_key)
+        include_usage = bool(request.stream_options and request.stream_options.include_usage)
+        
+        def start():
+            opening = asyncio.ensure_future(self.open_chat_completion_stream(request, api_key, None, cache_key))
+            return self._stream_after_open(opening), opening
+        
+        frames, leader = self.singleflight.stream(f"{'stream+usage' if include_usage else 'stream'}:{key}", start)
+        # 订阅在加入时已经登记，之后的任何失败都必须关闭frames
+        interval = self.config.sse_heartbeat_interval
+        try:
+            done, _ = await asyncio.wait({frames.flight.opening}, timeout=interval if interval > 0 else None)
+        except asyncio.CancelledError:
+            frames.close()
+            raise
+        
+        served_model = None
+        opening = frames.flight.opening
+        if done and not opening.cancelled():
+            if opening.exception() is not None:
+                frames.close()
+                raise opening.exception()
+            served_model = opening.result()[0]
+        return served_model, with_heartbeats(frames, interval) if interval > 0 else frames, leader
+    
+    @staticmethod
+    def _cache_directives(cache_control: Optional[str]) -> Set[str]:
+        """解析请求头Cache-Control中的指令"""
+        return {item.strip().lower() for item in (cache_control or "").split(",")}
+    
+    async def _replay_stream(self, body: bytes, served_model: str, include_usage: bool) -> AsyncGenerator[str, None]:
+        """将缓存的响应重放为SSE流，思考内容和回答内容各合并为一个chunk"""
+        cached = json.loads(body)
+        choice = cached["choices"][0]
+        message = choice["message"]
+        encoder = StreamChunkEncoder(self.generate_response_id(), self.get_current_timestamp(), served_model)
+        for frame in self._split_reasoning(encoder, message.get("reasoning") or "", message.get("content") or ""):
+            yield frame
+        yield encoder.finish(choice.get("finish_reason"))
+        if include_usage:
+            usage = cached.get("usage") or {}
+            yield encoder.usage(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        yield "data: [DONE]\n\n"
+    
+    async def open_chat_completion_stream(
+        self,
+        request: ChatCompletionRequest,
+        api_key: str = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        cache_key: Optional[str] = None
+    ) -> Tuple[str, AsyncGenerator[str, None]]:
+        """打开上游流（含重试、熔断和模型降级），返回(实际服务的模型, SSE生成器)
+
+        打开失败时直接抛出异常，此时尚未向客户端发送任何数据。
+        is_disconnected用于检测客户端断开（如Request.is_disconnected），断开后立即关闭上游响应。
+        指定cache_key时，完整结束的流以非流式响应的格式写入响应缓存（降级模型的流不写入）。
+        """
+        # 转换消息格式
+        hf_messages = self.convert_messages_to_hf_format(request.messages)
+        
+        # 调用Hugging Face API（流式，打开流计入首个token的期限）
+        served_model, params, policy, stream = await self._open_with_fallback(
+            request, hf_messages, api_key, stream=True
+        )
+        if served_model != request.model:
+            # 缓存键对应请求的模型，降级模型的回答不写入缓存
+            cache_key = None
+        include_usage = bool(request.stream_options and request.stream_options.include_usage)
+        if cache_key is None and self._can_pass_through(request, served_model, include_usage):
+            return served_model, self._passthrough_chunks(stream, params, policy, is_disconnected)
+        prompt_tokens = 0
+        if include_usage or cache_key is not None:
+            prompt_tokens = sum(self.estimate_tokens(msg.content) for msg in request.messages)
+        return served_model, self._stream_chunks(
+            stream, served_model, params, policy, is_disconnected, include_usage, prompt_tokens, cache_key
+        )
+    
+    async def start_chat_completion_stream(
+        self,
+        request: ChatCompletionRequest,
+        api_key: str = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        cache_key: Optional[str] = None
+    ) -> Tuple[Optional[str], AsyncGenerator[str, None]]:
+        """打开上游流并在首个token之前发送SSE心跳，返回(实际服务的模型, SSE生成器)
+
+        上游在一个心跳间隔内打开了流（或失败）时与open_chat_completion_stream相同；
+        否则先开始SSE响应并发送心跳，此时返回的模型为None，打开失败以错误信息的形式发送。
+        """
+        interval = self.config.sse_heartbeat_interval
+        if interval <= 0:
+            return await self.open_chat_completion_stream(request, api_key, is_disconnected, cache_key)
+        
+        opening = asyncio.ensure_future(self.open_chat_completion_stream(request, api_key, is_disconnected, cache_key))
+        try:
+            done, _ = await asyncio.wait({opening}, timeout=interval)
+        except asyncio.CancelledError:
+            opening.cancel()
+            raise
+        if done:
+            served_model, chunks = opening.result()
+            return served_model, with_heartbeats(chunks, interval)
+        return None, with_heartbeats(self._stream_after_open(opening), interval)
+    
+    async def _stream_after_open(self, opening: asyncio.Future) -> AsyncGenerator[str, None]:
+        """等待上游流打开后发送SSE数据（响应已经开始，错误只能以SSE数据的形式发送）"""
+        chunks = None
+        try:
+            try:
+                _, chunks = await opening
+            except ProxyError as e:
+                logger.warning(f"Proxy error in create_chat_completion_stream: {str(e)}")
+                yield f"data: {json.dumps(e.to_dict())}\n\n"
+                return
+            except Exception as e:
+                logger.error(f"Error in create_chat_completion_stream: {str(e)}")
+                yield f"data: {json.dumps(self._internal_error(e))}\n\n"
+                return
+            
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            if not opening.done():
+                opening.cancel()
+            elif chunks is not None:
+                with anyio.CancelScope(shield=True):
+                    await chunks.aclose()
+    
     async def create_chat_completion_stream(
         self, 
         request: ChatCompletionRequest,
@@ -177,88 +627,359 @@ class HuggingFaceConverter:
     ) -> AsyncGenerator[str, None]:
         """创建流式聊天完成"""
         try:
-            # 转换消息格式
-            hf_messages = self.convert_messages_to_hf_format(request.messages)
-            
-            # 使用动态API Key获取客户端
-            client = self.get_client(api_key)
+            _, chunks = await self.open_chat_completion_stream(request, api_key)
+        except ProxyError as e:
+            logger.warning(f"Proxy error in create_chat_completion_stream: {str(e)}")
+            yield f"data: {json.dumps(e.to_dict())}\n\n"
+            return
+        except Exception as e:
+            logger.error(f"Error in create_chat_completion_stream: {str(e)}")
+            yield f"data: {json.dumps(self._internal_error(e))}\n\n"
+            return
+        
+        async for chunk in chunks:
+            yield chunk
+    
+    async def _stream_chunks(
+        self,
+        stream,
+        served_model: str,
+        params: Dict[str, Any],
+        policy: TimeoutPolicy,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        include_usage: bool = False,
+        prompt_tokens: int = 0,
+        cache_key: Optional[str] = None
+    ) -> AsyncGenerator[str, None]:
+        """将已打开的上游流转换为OpenAI格式的SSE数据
+
+        include_usage为True时在[DONE]之前发送usage chunk（stream_options.include_usage）。
+        指定cache_key时，收到finish_reason并正常结束的流写入响应缓存；出错、中断或客户端断开的流不缓存。
+        """
+        # provider评分所需的首个token时间和token数（每个内容chunk约为一个token）
+        first_token_at = None
+        token_count = 0
+        # 是否已向客户端发送[DONE]或错误信息；未发送就结束说明客户端已断开
+        finished = False
+        # 是否已发送带finish_reason的chunk（include_usage时之后还要等待上游的usage）
+        finish_seen = False
+        # 写入响应缓存用：上游的原始内容（与非流式响应一样按parse_thinking_content拆分）
+        caching = cache_key is not None
+        raw_parts: List[str] = []
+        final_reason = None
+        
+        deltas = None
+        buffer = None
+        reader = None
+        client_gone = asyncio.Event()
+        watcher = None
+        if is_disconnected is not None and self.config.disconnect_poll_interval > 0:
+            watcher = asyncio.create_task(self._watch_disconnect(is_disconnected, stream, client_gone))
+        self.stream_stats.active_streams += 1
+        
+        try:
+            # 每个流只渲染一次id/created/model前缀，每个token只转义delta内容
+            encoder = StreamChunkEncoder(self.generate_response_id(), self.get_current_timestamp(), served_model)
             
-            # 调用Hugging Face API（流式）
-            stream = client.chat.completions.create(
-                model=request.model,
-                messages=hf_messages,
-                temperature=request.temperature,
-                top_p=request.top_p,
-                max_tokens=request.max_tokens,
-                stop=request.stop,
-                stream=True
-            )
+            # 流式拆分thinking内容
+            splitter = None
+            if self.config.stream_reasoning_split:
+                splitter = ReasoningSplitter(reasoning=self._is_reasoning_model(served_model))
             
-            response_id = self.generate_response_id()
-            created = self.get_current_timestamp()
+            # 调试用：只在DEBUG日志级别下保留最近的若干个chunk，每个流的状态大小固定
+            debug_tail = deque(maxlen=self.DEBUG_TAIL_CHUNKS) if logger.isEnabledFor(logging.DEBUG) else None
             
-            # 用于累积内容的变量（仅用于调试）
-            accumulated_content = ""
+            # 上游在流中返回的usage（需要请求时带上stream_options）
+            upstream_usage: Dict[str, Any] = {}
             
-            # 发送流式响应
-            for chunk in stream:
+            # 发送流式响应（首个token、chunk间空闲和总时长超时时中止）
+            deltas = self._iter_deltas(policy.iter_stream(stream), upstream_usage)
+            if self.config.stream_buffer_high_water > 0:
+                # 上游读取与客户端写入解耦：读取任务写入有界缓冲，慢客户端不再拖慢上游读取
+                buffer = StreamBuffer(self.config.stream_buffer_high_water, self.config.stream_backpressure_policy)
+                self.stream_stats.add_buffer(buffer)
+                reader = asyncio.create_task(pump(deltas, buffer))
+                deltas = buffer.__aiter__()
+            if self.config.stream_coalesce_enabled:
+                # 合并高速流中连续的内容delta，减少SSE帧数
+                deltas = coalesce_deltas(deltas, self.config.stream_coalesce_window, self.config.stream_coalesce_bytes)
+            async for content, tokens, finish_reason in deltas:
                 # 检查是否有内容 - 添加None值检查
-                if chunk.choices and chunk.choices[0].delta.content is not None:
-                    content = chunk.choices[0].delta.content
-                    accumulated_content += content
+                if content is not None:
+                    if debug_tail is not None:
+                        debug_tail.append(content)
+                    if caching:
+                        raw_parts.append(content)
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                    token_count += tokens
                     
-                    # 直接透传原始内容，不做任何特殊处理
-                    # 这确保了与官方API完全一致的输出格式
-                    stream_response = ChatCompletionStreamResponse(
-                        id=response_id,
-                        created=created,
-                        model=request.model,
-                        choices=[
-                            StreamChoice(
-                                index=0,
-                                delta=Delta(content=content),
-                                finish_reason=None
-                            )
-                        ]
-                    )
-                    yield f"data: {stream_response.model_dump_json()}\n\n"
+                    if splitter is None:
+                        # 直接透传原始内容，不做任何特殊处理
+                        # 这确保了与官方API完全一致的输出格式
+                        yield encoder.content(content)
+                    else:
+                        # </think>之前的内容作为delta.reasoning发送
+                        for frame in self._split_reasoning(encoder, *splitter.feed(content)):
+                            yield frame
                 
                 # 检查是否结束 - 改进结束检测逻辑
-                if chunk.choices and chunk.choices[0].finish_reason is not None:
+                if finish_reason is not None:
+                    if splitter is not None:
+                        for frame in self._split_reasoning(encoder, *splitter.flush()):
+                            yield frame
                     # 发送结束标记 - 确保包含finish_reason的最终chunk
-                    final_response = ChatCompletionStreamResponse(
-                        id=response_id,
-                        created=created,
-                        model=request.model,
-                        choices=[
-                            StreamChoice(
-                                index=0,
-                                delta=Delta(),
-                                finish_reason=chunk.choices[0].finish_reason
-                            )
-                        ]
-                    )
-                    yield f"data: {final_response.model_dump_json()}\n\n"
+                    yield encoder.finish(finish_reason)
+                    if first_token_at is not None:
+                        self.provider_selector.record(
+                            params["model"],
+                            first_token_at - policy.started_at,
+                            token_count,
+                            time.monotonic() - first_token_at
+                        )
+                    self.stream_stats.record_completed(token_count)
+                    if debug_tail is not None:
+                        logger.debug(f"Stream finished after {token_count} tokens, tail: {''.join(debug_tail)!r}")
+                    final_reason = finish_reason
+                    if include_usage:
+                        # 上游的usage chunk在结束chunk之后发送，继续读取直到上游流结束
+                        finish_seen = True
+                        continue
+                    if caching:
+                        await self._cache_stream(cache_key, served_model, raw_parts, final_reason, prompt_tokens)
                     # 立即发送[DONE]标记
+                    finished = True
                     yield "data: [DONE]\n\n"
                     return  # 使用return而不是break确保函数完全结束
             
+            if client_gone.is_set():
+                return
+            if finish_seen:
+                if caching:
+                    await self._cache_stream(cache_key, served_model, raw_parts, final_reason, prompt_tokens)
+                yield self._usage_chunk(encoder, upstream_usage, prompt_tokens, token_count)
+                finished = True
+                yield "data: [DONE]\n\n"
+                return
+            if splitter is not None:
+                for frame in self._split_reasoning(encoder, *splitter.flush()):
+                    yield frame
+            if include_usage:
+                yield self._usage_chunk(encoder, upstream_usage, prompt_tokens, token_count)
+            
             # 如果循环正常结束但没有收到finish_reason，也要发送[DONE]
             # 这种情况可能发生在某些模型或网络问题时
             logger.warning("Stream ended without finish_reason, sending [DONE] anyway")
+            finished = True
             yield "data: [DONE]\n\n"
             
         except Exception as e:
-            logger.error(f"Error in create_chat_completion_stream: {str(e)}")
-            # 发送错误信息
-            error_response = {
-                "error": {
-                    "message": str(e),
-                    "type": "internal_error",
-                    "code": "internal_error"
-                }
+            if client_gone.is_set():
+                # 上游响应因客户端断开被主动关闭，读取中断属于预期情况
+                return
+            finished = True
+            if finish_seen:
+                # 回答已完整发送，只是等待上游usage时出错，使用本地统计结束流
+                logger.warning(f"Error while waiting for upstream usage: {str(e)}")
+                yield self._usage_chunk(encoder, {}, prompt_tokens, token_count)
+                yield "data: [DONE]\n\n"
+                return
+            if isinstance(e, (APITimeoutError, httpx.TimeoutException)):
+                e = policy.from_client_timeout(e)
+            if isinstance(e, ProxyError):
+                logger.warning(f"Proxy error in create_chat_completion_stream: {str(e)}")
+                yield f"data: {json.dumps(e.to_dict())}\n\n"
+            else:
+                logger.error(f"Error in create_chat_completion_stream: {str(e)}")
+                # 发送错误信息
+                yield f"data: {json.dumps(self._internal_error(e))}\n\n"
+        finally:
+            self.stream_stats.active_streams -= 1
+            if watcher is not None:
+                watcher.cancel()
+            if not finished and not finish_seen:
+                # 客户端断开：由watcher检测到，或ASGI服务器取消/关闭了生成器
+                logger.info(f"Client disconnected, cancelled upstream stream after {token_count} tokens")
+                self.stream_stats.record_cancelled(token_count, params.get("max_tokens"))
+            # 及时关闭上游响应，将连接归还到共享连接池；生成器被取消时也必须执行完毕
+            with anyio.CancelScope(shield=True):
+                if reader is not None:
+                    reader.cancel()
+                    await asyncio.wait({reader})
+                if deltas is not None:
+                    await deltas.aclose()
+                await stream.response.aclose()
+            if buffer is not None:
+                self.stream_stats.remove_buffer(buffer)
+    
+    async def _cache_stream(
+        self,
+        cache_key: str,
+        served_model: str,
+        raw_parts: List[str],
+        finish_reason: Optional[str],
+        prompt_tokens: int
+    ):
+        """将完整结束的流按非流式响应的格式写入响应缓存
+
+        与非流式响应一样用parse_thinking_content拆分原始内容，之后的非流式请求命中时
+        与直接请求上游的结果一致（不取决于流式拆分器的配置）。
+        """
+        raw_content = "".join(raw_parts)
+        thinking_content, final_content = self.parse_thinking_content(raw_content)
+        response = self._build_completion_response(
+            served_model, final_content, thinking_content or None, finish_reason,
+            prompt_tokens, self.estimate_tokens(raw_content)
+        )
+        await self.response_cache.put(cache_key, response.model_dump_json().encode("utf-8"), served_model)
+    
+    def _is_reasoning_model(self, model: str) -> bool:
+        """模型是否输出不带开始标签的thinking内容（匹配REASONING_MODELS中的任一片段，默认为DeepSeek-R1）"""
+        model = model.lower()
+        return any(pattern.lower() in model for pattern in self.config.reasoning_models)
+    
+    @staticmethod
+    def _split_reasoning(encoder: StreamChunkEncoder, reasoning: str, content: str) -> List[str]:
+        """将拆分后的思考内容和回答内容渲染为SSE数据"""
+        frames = []
+        if reasoning:
+            frames.append(encoder.reasoning(reasoning))
+        if content:
+            frames.append(encoder.content(content))
+        return frames
+    
+    @staticmethod
+    def _usage_chunk(encoder: StreamChunkEncoder, upstream_usage: Dict[str, Any], prompt_tokens: int, completion_tokens: int) -> str:
+        """渲染usage chunk：优先使用上游返回的usage，否则使用估算的prompt token数和逐chunk累计的输出token数"""
+        if upstream_usage.get("completion_tokens") is not None:
+            prompt_tokens = upstream_usage.get("prompt_tokens") or 0
+            completion_tokens = upstream_usage["completion_tokens"]
+        return encoder.usage(prompt_tokens, completion_tokens)
+    
+    @staticmethod
+    async def _iter_deltas(chunks, upstream_usage: Dict[str, Any]) -> AsyncGenerator[Tuple[Optional[str], int, Optional[str]], None]:
+        """从上游chunk中提取(内容, token数, finish_reason)，每个内容chunk约为一个token
+
+        上游返回的usage（通常在最后一个chunk中）写入upstream_usage。
+        """
+        async for chunk in chunks:
+            usage = getattr(chunk, "usage", None)
+            if usage:
+                upstream_usage.update(usage if isinstance(usage, dict) else usage.model_dump())
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            content = choice.delta.content
+            if content is None and choice.finish_reason is None:
+                continue
+            yield content, 1 if content is not None else 0, choice.finish_reason
+    
+    def _can_pass_through(self, request: ChatCompletionRequest, served_model: str, include_usage: bool) -> bool:
+        """流是否可以原样透传上游的SSE字节（不需要任何转换）"""
+        if not self.config.stream_passthrough:
+            return False
+        if served_model != request.model or include_usage or self.config.stream_coalesce_enabled:
+            # 降级后需要改写model，include_usage需要本地统计兜底，合并需要解析delta
+            return False
+        # 任何模型的流都可能以<think>开头，只有看到内容之后才知道是否需要拆分，拆分开启时不能透传
+        return not self.config.stream_reasoning_split
+    
+    async def _passthrough_chunks(
+        self,
+        stream,
+        params: Dict[str, Any],
+        policy: TimeoutPolicy,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> AsyncGenerator[bytes, None]:
+        """原样转发上游的SSE字节，只扫描[DONE]标记用于统计，不解析JSON"""
+        first_token_at = None
+        # data事件数，约等于token数
+        token_count = 0
+        # 上一块的结尾，用于识别被拆分到两块中的[DONE]
+        tail = b""
+        done_seen = False
+        # 是否已向客户端发送[DONE]或错误信息；未发送就结束说明客户端已断开
+        finished = False
+        
+        client_gone = asyncio.Event()
+        watcher = None
+        if is_disconnected is not None and self.config.disconnect_poll_interval > 0:
+            watcher = asyncio.create_task(self._watch_disconnect(is_disconnected, stream, client_gone))
+        self.stream_stats.active_streams += 1
+        
+        try:
+            # 直接读取SDK尚未消费的上游响应体（首个token、chunk间空闲和总时长超时时中止）
+            async for data in policy.iter_stream(stream.response.aiter_bytes(), stream.response):
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                if not done_seen:
+                    token_count += data.count(b"data:")
+                    if b"[DONE]" in tail + data[:8] or b"[DONE]" in data:
+                        done_seen = True
+                        token_count -= 1
+                        self.stream_stats.record_completed(token_count)
+                        self.provider_selector.record(
+                            params["model"],
+                            first_token_at - policy.started_at,
+                            token_count,
+                            time.monotonic() - first_token_at
+                        )
+                    tail = data[-8:]
+                yield data
+            
+            if client_gone.is_set():
+                return
+            finished = True
+            if not done_seen:
+                logger.warning("Upstream stream ended without [DONE], sending [DONE] anyway")
+                yield b"data: [DONE]\n\n"
+        
+        except Exception as e:
+            if client_gone.is_set():
+                return
+            finished = True
+            if isinstance(e, (APITimeoutError, httpx.TimeoutException)):
+                e = policy.from_client_timeout(e)
+            if isinstance(e, ProxyError):
+                logger.warning(f"Proxy error in create_chat_completion_stream: {str(e)}")
+                yield f"data: {json.dumps(e.to_dict())}\n\n".encode()
+            else:
+                logger.error(f"Error in create_chat_completion_stream: {str(e)}")
+                yield f"data: {json.dumps(self._internal_error(e))}\n\n".encode()
+        finally:
+            self.stream_stats.active_streams -= 1
+            if watcher is not None:
+                watcher.cancel()
+            if not finished and not done_seen:
+                logger.info(f"Client disconnected, cancelled upstream stream after {token_count} tokens")
+                self.stream_stats.record_cancelled(token_count, params.get("max_tokens"))
+            with anyio.CancelScope(shield=True):
+                await stream.response.aclose()
+    
+    async def _watch_disconnect(
+        self,
+        is_disconnected: Callable[[], Awaitable[bool]],
+        stream,
+        client_gone: asyncio.Event
+    ):
+        """定期检查客户端是否已断开，断开后立即关闭上游响应，中止正在进行的读取"""
+        while True:
+            await asyncio.sleep(self.config.disconnect_poll_interval)
+            if await is_disconnected():
+                client_gone.set()
+                await stream.response.aclose()
+                return
+    
+    @staticmethod
+    def _internal_error(error: Exception) -> Dict[str, Any]:
+        """构造内部错误的响应内容"""
+        return {
+            "error": {
+                "message": str(error),
+                "type": "internal_error",
+                "code": "internal_error"
             }
-            yield f"data: {json.dumps(error_response)}\n\n"
+        }
     
     def _convert_hf_response_to_openai(self, hf_response, model: str, request: ChatCompletionRequest) -> ChatCompletionResponse:
         """将Hugging Face响应转换为OpenAI格式"""
@@ -272,19 +993,36 @@ class HuggingFaceConverter:
         prompt_tokens = sum(self.estimate_tokens(msg.content) for msg in request.messages)
         completion_tokens = self.estimate_tokens(raw_content)
         
+        return self._build_completion_response(
+            model, final_content, thinking_content or None, choice.finish_reason,
+            prompt_tokens, completion_tokens, role=choice.message.role, index=choice.index
+        )
+    
+    def _build_completion_response(
+        self,
+        model: str,
+        content: str,
+        reasoning: Optional[str],
+        finish_reason: Optional[str],
+        prompt_tokens: int,
+        completion_tokens: int,
+        role: str = "assistant",
+        index: int = 0
+    ) -> ChatCompletionResponse:
+        """构造非流式响应"""
         return ChatCompletionResponse(
             id=self.generate_response_id(),
             created=self.get_current_timestamp(),
             model=model,
             choices=[
                 Choice(
-                    index=choice.index,
+                    index=index,
                     message=Message(
-                        role=choice.message.role,
-                        content=final_content,
-                        reasoning=thinking_content if thinking_content else None
+                        role=role,
+                        content=content,
+                        reasoning=reasoning
                     ),
-                    finish_reason=choice.finish_reason
+                    finish_reason=finish_reason
                 )
             ],
             usage=Usage(
@@ -297,31 +1035,63 @@ class HuggingFaceConverter:
     async def get_models(self, api_key: str = None) -> ModelListResponse:
         """获取可用模型列表"""
         try:
-            # 使用动态API Key获取客户端
-            client = self.get_client(api_key)
-            
-            # 调用Hugging Face API获取模型列表
-            models_response = client.models.list()
-            
-            models = []
-            for model in models_response.data:
-                models.append(Model(
-                    id=model.id,
-                    created=getattr(model, 'created', self.get_current_timestamp()),
-                    owned_by=getattr(model, 'owned_by', 'huggingface')
-                ))
-            
-            return ModelListResponse(data=models)
-            
+            return await self._fetch_models(api_key)
+        except Exception as e:
+            logger.error(f"Error in get_models: {str(e)}")
+            return self._default_models()
+    
+    async def get_models_body(self, api_key: str = None) -> Tuple[bytes, str]:
+        """获取序列化好的模型列表和ETag，经过按API Key哈希的模型列表缓存
+
+        获取失败时返回默认模型列表（不缓存）。
+        """
+        if self.models_cache is None:
+            return serialize_models(await self.get_models(api_key))
+        
+        key = hash_api_key(api_key or self.config.hf_token or "")
+        try:
+            return await self.models_cache.get(key, lambda: self._fetch_models_body(api_key))
         except Exception as e:
             logger.error(f"Error in get_models: {str(e)}")
-            # 返回默认模型列表
-            return ModelListResponse(
-                data=[
-                    Model(
-                        id=config.default_model,
-                        created=self.get_current_timestamp(),
-                        owned_by="huggingface"
-                    )
-                ]
-            )
\ No newline at end of file
+            return serialize_models(self._default_models())
+    
+    async def _fetch_models_body(self, api_key: Optional[str]) -> Tuple[bytes, str]:
+        return serialize_models(await self._fetch_models(api_key))
+    
+    async def _fetch_models(self, api_key: Optional[str]) -> ModelListResponse:
+        """从上游获取模型列表（失败时抛出异常）"""
+        # 使用动态API Key获取客户端
+        client = self.get_client(api_key)
+        
+        # 调用Hugging Face API获取模型列表
+        models_response = await client.models.list()
+        
+        models = []
+        for model in models_response.data:
+            # Hugging Face路由返回每个模型可用的provider，用于自动选择provider
+            providers = getattr(model, 'providers', None)
+            if isinstance(providers, list):
+                self.provider_selector.learn_providers(model.id, [
+                    item["provider"] for item in providers
+                    if isinstance(item, dict) and item.get("provider") and item.get("status", "live") == "live"
+                ])
+            
+            models.append(Model(
+                id=model.id,
+                created=getattr(model, 'created', self.get_current_timestamp()),
+                owned_by=getattr(model, 'owned_by', 'huggingface')
+            ))
+        
+        return ModelListResponse(data=models)
+    
+    def _default_models(self) -> ModelListResponse:
+        """上游不可用时返回的默认模型列表"""
+        return ModelListResponse(
+            data=[
+                Model(
+                    id=config.default_model,
+                    created=self.get_current_timestamp(),
+                    owned_by="huggingface"
+                )
+            ]
+        )
\ No newline at end of file
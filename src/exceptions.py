@@ -0,0 +1,65 @@
+from typing import Any, Dict
+
+
+class ProxyError(Exception):
+    """代理错误基类，携带返回给客户端的HTTP状态码和错误类型"""
+    status_code: int = 500
+    error_type: str = "internal_error"
+    code: str = "internal_error"
+
+    def __init__(self, message: str, code: str = None):
+        super().__init__(message)
+        self.message = message
+        if code is not None:
+            self.code = code
+        # 需要随错误响应返回的HTTP头
+        self.headers: Dict[str, str] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为OpenAI格式的错误响应"""
+        return {
+            "error": {
+                "message": self.message,
+                "type": self.error_type,
+                "code": self.code
+            }
+        }
+
+
+class UpstreamTimeoutError(ProxyError):
+    """上游超时（连接、首个token、chunk间空闲或总时长）"""
+    status_code = 504
+    error_type = "timeout_error"
+    code = "upstream_timeout"
+
+
+class CircuitOpenError(ProxyError):
+    """模型/provider的熔断器处于打开状态，请求未发往上游"""
+    status_code = 503
+    error_type = "service_unavailable"
+    code = "circuit_open"
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(
+            f"Model {model} is temporarily unavailable (circuit open), retry after {retry_after:.0f}s"
+        )
+        self.model = model
+        self.headers["Retry-After"] = str(max(int(retry_after + 0.999), 1))
+
+
+class ModelNotServedError(ProxyError):
+    """没有任何上游端点提供请求的模型（HF_UPSTREAMS中的models白名单）"""
+    status_code = 404
+    error_type = "invalid_request_error"
+    code = "model_not_found"
+
+    def __init__(self, model: str):
+        super().__init__(f"Model {model} is not served by any configured upstream")
+        self.model = model
+
+
+class SlowClientError(ProxyError):
+    """客户端读取过慢，流式缓冲超过上限后被中止"""
+    status_code = 503
+    error_type = "service_unavailable"
+    code = "slow_client"
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .latency import LatencyWindow
+from .retry import RetryBudget
+
+logger = logging.getLogger(__name__)
+
+
+class HedgePolicy:
+    """非流式请求的对冲策略
+
+    主请求在对冲延迟内未返回时再发出一个相同的请求，先成功的结果胜出，另一个被取消。
+    对冲延迟可以固定配置，也可以取该模型最近延迟的分位数（如p95）。
+    对冲请求与重试一样是额外负载，同样通过预算限制其占总请求的比例。
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        delay: float,
+        percentile: float,
+        min_samples: int,
+        max_fraction: float,
+    ):
+        self.enabled = enabled
+        self.delay = delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.budget = RetryBudget(ratio=max_fraction, min_per_second=0)
+        self._latencies: Dict[str, LatencyWindow] = {}
+
+        # 统计信息
+        self.requests = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+
+    def record_latency(self, model: str, latency: float):
+        """记录模型一次成功请求的延迟"""
+        window = self._latencies.get(model)
+        if window is None:
+            window = self._latencies[model] = LatencyWindow()
+        window.record(latency)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """获取模型的对冲延迟，样本不足且未配置固定延迟时返回None（不对冲）"""
+        if self.delay > 0:
+            return self.delay
+        window = self._latencies.get(model)
+        if window is None or len(window) < self.min_samples:
+            return None
+        return window.percentile(self.percentile)
+
+    async def run(self, model: str, operation: Callable[[], Awaitable]):
+        """执行operation，超过对冲延迟后发出对冲请求，返回先成功的结果"""
+        if not self.enabled:
+            return await self._timed(model, operation())
+
+        self.requests += 1
+        self.budget.record_request()
+        delay = self.hedge_delay(model)
+        primary = asyncio.ensure_future(self._timed(model, operation()))
+        tasks = [primary]
+        try:
+            if delay is None:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            if not self.budget.try_acquire():
+                self.budget_denied += 1
+                return await primary
+
+            self.hedges_sent += 1
+            logger.info(f"Hedging request for model {model} after {delay:.2f}s")
+            hedge = asyncio.ensure_future(self._timed(model, operation()))
+            tasks.append(hedge)
+
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # 取消落败或被放弃的请求，释放上游连接
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _timed(self, model: str, awaitable: Awaitable):
+        started_at = time.monotonic()
+        result = await awaitable
+        self.record_latency(model, time.monotonic() - started_at)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取对冲统计"""
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "hedges_sent": self.hedges_sent,
+            "hedge_rate": round(self.hedges_sent / self.requests, 4) if self.requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "win_rate": round(self.hedge_wins / self.hedges_sent, 4) if self.hedges_sent else 0.0,
+            "budget_denied": self.budget_denied,
+            "delays": {model: self.hedge_delay(model) for model in self._latencies},
+        }
@@ -0,0 +1,24 @@
+from collections import deque
+from typing import Optional
+
+
+class LatencyWindow:
+    """最近N个延迟样本的滑动窗口，用于计算分位数"""
+
+    def __init__(self, size: int = 200):
+        self._samples: deque = deque(maxlen=size)
+
+    def record(self, latency: float):
+        """记录一个延迟样本（秒）"""
+        self._samples.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """计算分位数（q取0~1），没有样本时返回None"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(int(q * len(ordered)), len(ordered) - 1)
+        return ordered[index]
@@ -0,0 +1,114 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .models import ModelListResponse
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_models(models: ModelListResponse) -> Tuple[bytes, str]:
+    """序列化模型列表并计算ETag"""
+    body = models.model_dump_json().encode("utf-8")
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """请求头If-None-Match是否匹配ETag（弱比较）"""
+    if not if_none_match:
+        return False
+    # 弱ETag（W/前缀）与强ETag按相同的值比较
+    candidates = {item.strip() for item in if_none_match.split(",")}
+    candidates |= {item[2:] for item in candidates if item.startswith("W/")}
+    return "*" in candidates or etag in candidates
+
+
+class ModelListCache:
+    """按API Key哈希缓存序列化好的模型列表（stale-while-revalidate）
+
+    TTL内直接返回缓存；过期后在stale_ttl内仍返回旧列表，同时由单个后台任务刷新；
+    超过stale_ttl或没有缓存时等待获取，并发的获取只发送一次。获取失败时不缓存，
+    已有的旧列表继续使用。
+    """
+
+    # API Key来自客户端，限制缓存的条目数防止内存无限增长
+    MAX_ENTRIES = 256
+
+    def __init__(self, ttl: float, stale_ttl: float):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # key -> (响应体, ETag, 获取时间)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # 正在进行的获取（同步等待或后台刷新）
+        self._fetches: Dict[str, asyncio.Future] = {}
+
+        # 统计信息
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    async def get(self, key: str, fetch: Callable[[], Awaitable[Tuple[bytes, str]]]) -> Tuple[bytes, str]:
+        """返回(响应体, ETag)，fetch负责从上游获取并序列化（失败时抛出异常）"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            body, etag, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            self._entries.move_to_end(key)
+            if age <= self.ttl:
+                self.hits += 1
+                return body, etag
+            if age <= self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                if key not in self._fetches:
+                    self.refreshes += 1
+                    self._start_fetch(key, fetch)
+                return body, etag
+
+        self.misses += 1
+        task = self._fetches.get(key) or self._start_fetch(key, fetch)
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            if entry is not None:
+                # 获取失败时继续使用过期的列表
+                return entry[0], entry[1]
+            raise
+
+    def _start_fetch(self, key: str, fetch: Callable[[], Awaitable[Tuple[bytes, str]]]) -> asyncio.Future:
+        task = asyncio.ensure_future(fetch())
+        self._fetches[key] = task
+        task.add_done_callback(lambda _: self._fetch_done(key, task))
+        return task
+
+    def _fetch_done(self, key: str, task: asyncio.Future):
+        if self._fetches.get(key) is task:
+            del self._fetches[key]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.refresh_failures += 1
+            logger.warning(f"Model list refresh failed: {str(task.exception())}")
+            return
+        body, etag = task.result()
+        self._entries[key] = (body, etag, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取模型列表缓存统计信息"""
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+        }
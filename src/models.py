@@ -41,6 +41,11 @@ class Message(BaseModel):
     reasoning: Optional[str] = None  # 用于存储thinking内容
 
 
+class StreamOptions(BaseModel):
+    """流式响应选项"""
+    include_usage: Optional[bool] = False  # 在[DONE]之前发送包含usage的chunk
+
+
 class ChatCompletionRequest(BaseModel):
     """聊天完成请求模型"""
     model: str
@@ -49,6 +54,7 @@ class ChatCompletionRequest(BaseModel):
     top_p: Optional[float] = Field(default=1.0, ge=0.0, le=1.0)
     n: Optional[int] = Field(default=1, ge=1)
     stream: Optional[bool] = False
+    stream_options: Optional[StreamOptions] = None
     stop: Optional[Union[str, List[str]]] = None
     max_tokens: Optional[int] = Field(default=None, ge=1)
     presence_penalty: Optional[float] = Field(default=0.0, ge=-2.0, le=2.0)
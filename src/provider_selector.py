@@ -0,0 +1,207 @@
+import logging
+import random
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderScore:
+    """某个模型在某个provider上的滚动性能统计"""
+
+    def __init__(self):
+        # 流式请求：首个token延迟和首个token之后的生成速度
+        self.ttft: Optional[float] = None
+        self.tokens_per_second: Optional[float] = None
+        # 非流式请求：上游返回的输出token数除以整个请求的耗时（含首个token延迟），单独统计
+        self.completion_tokens_per_second: Optional[float] = None
+        # 失败率（EWMA，成功计0，失败计1）
+        self.failure_rate = 0.0
+        self.samples = 0
+        self.failures = 0
+
+    def update(self, alpha: float, ttft: Optional[float], tokens_per_second: Optional[float]):
+        """记录一次成功的流式请求"""
+        self.failure_rate -= alpha * self.failure_rate
+        if ttft is not None:
+            self.ttft = ttft if self.ttft is None else self.ttft + alpha * (ttft - self.ttft)
+        if tokens_per_second is not None:
+            if self.tokens_per_second is None:
+                self.tokens_per_second = tokens_per_second
+            else:
+                self.tokens_per_second += alpha * (tokens_per_second - self.tokens_per_second)
+        self.samples += 1
+
+    def update_completion(self, alpha: float, tokens_per_second: Optional[float]):
+        """记录一次成功的非流式请求"""
+        self.failure_rate -= alpha * self.failure_rate
+        if tokens_per_second is not None:
+            if self.completion_tokens_per_second is None:
+                self.completion_tokens_per_second = tokens_per_second
+            else:
+                self.completion_tokens_per_second += alpha * (tokens_per_second - self.completion_tokens_per_second)
+        self.samples += 1
+
+    def fail(self, alpha: float):
+        self.failure_rate += alpha * (1.0 - self.failure_rate)
+        self.samples += 1
+        self.failures += 1
+
+    def expected_seconds(self, expected_tokens: int) -> float:
+        """预计生成expected_tokens个token所需时间（首个token延迟 + 生成时间），按失败率折算
+
+        优先使用流式请求的计时，只有非流式请求的计时时按端到端速度估算。
+        没有任何成功的计时数据时为无穷大，不会被当作最快的provider。
+        """
+        if self.ttft is not None or self.tokens_per_second is not None:
+            seconds = self.ttft or 0.0
+            if self.tokens_per_second:
+                seconds += expected_tokens / self.tokens_per_second
+        elif self.completion_tokens_per_second:
+            seconds = expected_tokens / self.completion_tokens_per_second
+        else:
+            return float("inf")
+        if self.failure_rate >= 0.99:
+            return float("inf")
+        return seconds / (1.0 - self.failure_rate)
+
+
+class ProviderSelector:
+    """为不带provider后缀的模型ID选择最快的健康provider
+
+    维护每个模型在各provider上的首个token延迟和生成速度（EWMA），
+    按预计完成时间选择最快的provider，并以exploration_rate的概率随机探索，保持评分新鲜。
+    熔断器处于打开状态的provider不参与选择。
+
+    可用的provider只来自MODEL_PROVIDERS和/v1/models中状态为live的条目，客户端请求中的
+    provider后缀不会加入候选集合。失败的请求计入对应provider的失败率。
+    """
+
+    # 模型ID可能来自/v1/models，限制记录的模型数量防止内存无限增长
+    MAX_MODELS = 1000
+    # 还没有评分的provider每隔这么多秒最多试探一次，避免并发请求全部发往未知的provider
+    UNSCORED_TRIAL_INTERVAL = 30.0
+
+    def __init__(self, app_config, circuit_breakers=None):
+        self.enabled = app_config.provider_selection_enabled
+        self.exploration_rate = app_config.provider_exploration_rate
+        self.ewma_alpha = app_config.provider_ewma_alpha
+        self.expected_tokens = app_config.provider_expected_tokens
+        self.circuit_breakers = circuit_breakers
+
+        self._providers: Dict[str, Set[str]] = {}
+        self._scores: Dict[str, Dict[str, ProviderScore]] = {}
+        for model, providers in app_config.model_providers.items():
+            self.learn_providers(model, providers)
+
+        # "模型:provider" -> 最近一次试探未评分provider的时间
+        self._trials: Dict[str, float] = {}
+
+        # 统计信息
+        self.selections = 0
+        self.explorations = 0
+
+    def learn_providers(self, model: str, providers: Iterable[str]):
+        """记录模型可用的provider（来自配置或/v1/models）"""
+        known = self._providers.get(model)
+        if known is None:
+            if len(self._providers) >= self.MAX_MODELS:
+                return
+            known = self._providers[model] = set()
+        known.update(providers)
+
+    def select(self, model: str) -> str:
+        """返回实际发往上游的模型ID"""
+        if ":" in model:
+            # 客户端指定了provider，原样转发
+            return model
+
+        if not self.enabled:
+            return model
+        providers = [
+            provider for provider in self._providers.get(model, ())
+            if self.circuit_breakers is None or not self.circuit_breakers.is_open(f"{model}:{provider}")
+        ]
+        if not providers:
+            return model
+
+        self.selections += 1
+        scores = self._scores.get(model, {})
+        now = time.monotonic()
+        unscored = [
+            provider for provider in providers
+            if provider not in scores and now - self._trials.get(f"{model}:{provider}", float("-inf")) >= self.UNSCORED_TRIAL_INTERVAL
+        ]
+        if unscored:
+            provider = random.choice(unscored)
+            self._trials[f"{model}:{provider}"] = now
+        elif random.random() < self.exploration_rate:
+            self.explorations += 1
+            provider = random.choice(providers)
+        else:
+            def expected(p: str) -> float:
+                score = scores.get(p)
+                return score.expected_seconds(self.expected_tokens) if score is not None else float("inf")
+            provider = min(providers, key=expected)
+        logger.debug(f"Selected provider {provider} for model {model}")
+        return f"{model}:{provider}"
+
+    def _score(self, routed_model: str) -> Optional[ProviderScore]:
+        """获取"模型:provider"的评分，不是已知provider时返回None"""
+        if ":" not in routed_model:
+            return None
+        model, provider = routed_model.split(":", 1)
+        if provider not in self._providers.get(model, ()):
+            return None
+        scores = self._scores.setdefault(model, {})
+        score = scores.get(provider)
+        if score is None:
+            score = scores[provider] = ProviderScore()
+        return score
+
+    def record(self, routed_model: str, ttft: Optional[float], tokens: int, generation_seconds: float):
+        """记录一次完成的流式请求（tokens为首个token之后generation_seconds内收到的chunk数）"""
+        score = self._score(routed_model)
+        if score is None:
+            return
+        tokens_per_second = tokens / generation_seconds if tokens > 0 and generation_seconds > 0 else None
+        score.update(self.ewma_alpha, ttft, tokens_per_second)
+
+    def record_completion(self, routed_model: str, completion_tokens: int, seconds: float):
+        """记录一次完成的非流式请求（completion_tokens为上游返回的usage，seconds为该次上游调用的耗时）"""
+        score = self._score(routed_model)
+        if score is None:
+            return
+        tokens_per_second = completion_tokens / seconds if completion_tokens > 0 and seconds > 0 else None
+        score.update_completion(self.ewma_alpha, tokens_per_second)
+
+    def record_failure(self, routed_model: str):
+        """记录一次失败的请求（包括4xx），提高该provider的失败率"""
+        score = self._score(routed_model)
+        if score is not None:
+            score.fail(self.ewma_alpha)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各模型的provider评分"""
+        scoreboard = {}
+        for model, providers in self._providers.items():
+            scores = self._scores.get(model, {})
+            scoreboard[model] = {}
+            for provider in sorted(providers):
+                score = scores.get(provider) or ProviderScore()
+                scoreboard[model][provider] = {
+                    "ttft": round(score.ttft, 4) if score.ttft is not None else None,
+                    "tokens_per_second": round(score.tokens_per_second, 2) if score.tokens_per_second is not None else None,
+                    "completion_tokens_per_second": (
+                        round(score.completion_tokens_per_second, 2) if score.completion_tokens_per_second is not None else None
+                    ),
+                    "failure_rate": round(score.failure_rate, 4),
+                    "samples": score.samples,
+                    "failures": score.failures,
+                }
+        return {
+            "enabled": self.enabled,
+            "selections": self.selections,
+            "explorations": self.explorations,
+            "models": scoreboard,
+        }
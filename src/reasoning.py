@@ -0,0 +1,96 @@
+from typing import Tuple
+
+THINK_START = "<think>"
+THINK_END = "</think>"
+
+# 状态
+_DETECT = "detect"        # 流开头，判断是否以<think>开始
+_REASONING = "reasoning"  # 在</think>之前，文本属于思考过程
+_AFTER_TAG = "after_tag"  # 刚遇到</think>，跳过回答开头的空白
+_CONTENT = "content"      # 文本属于最终回答
+
+
+def _partial_suffix(text: str, tag: str) -> int:
+    """text结尾可能是tag开头部分的最大长度（tag被拆分到下一个chunk时需要暂存）"""
+    for length in range(min(len(text), len(tag) - 1), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class ReasoningSplitter:
+    """流式thinking内容拆分器
+
+    逐个chunk地将</think>之前的文本路由到delta.reasoning，之后的文本路由到delta.content。
+    标签被拆分到多个chunk时只暂存不超过标签长度的尾部，每个chunk的处理时间只与chunk本身的长度有关，
+    不会重新扫描已输出的内容。
+
+    只有以<think>开头的流才进入思考阶段，其余的流原样作为content输出。reasoning=True时
+    流一开始就处于思考阶段（没有开始标签的模型），拆分结果必须在看到</think>之前就发出，
+    因此没有</think>的流全部作为思考内容输出，这一点与非流式的parse_thinking_content不同。
+    """
+
+    def __init__(self, reasoning: bool = False):
+        self._reasoning_model = reasoning
+        self._state = _DETECT
+        self._held = ""
+        self._reasoning_started = False
+
+    def feed(self, text: str) -> Tuple[str, str]:
+        """处理一个chunk的文本，返回(思考内容, 回答内容)，可能为空字符串"""
+        if self._state == _CONTENT:
+            return "", text
+
+        text = self._held + text
+        self._held = ""
+
+        if self._state == _DETECT:
+            stripped = text.lstrip()
+            if not stripped or (len(stripped) < len(THINK_START) and THINK_START.startswith(stripped)):
+                # 还无法判断是否以<think>开头
+                self._held = text
+                return "", ""
+            if stripped.startswith(THINK_START):
+                self._state = _REASONING
+                text = stripped[len(THINK_START):]
+            elif self._reasoning_model:
+                self._state = _REASONING
+                text = stripped
+            else:
+                self._state = _CONTENT
+                return "", text
+
+        reasoning = ""
+        if self._state == _REASONING:
+            if not self._reasoning_started:
+                # 与非流式一致，去掉思考内容开头的空白
+                text = text.lstrip()
+                self._reasoning_started = bool(text)
+            end_pos = text.find(THINK_END)
+            if end_pos == -1:
+                held = _partial_suffix(text, THINK_END)
+                if held:
+                    self._held = text[-held:]
+                    text = text[:-held]
+                return text, ""
+            reasoning = text[:end_pos]
+            text = text[end_pos + len(THINK_END):]
+            self._state = _AFTER_TAG
+
+        if self._state == _AFTER_TAG:
+            text = text.lstrip()
+            if not text:
+                return reasoning, ""
+            self._state = _CONTENT
+        return reasoning, text
+
+    def flush(self) -> Tuple[str, str]:
+        """流结束时输出暂存的文本"""
+        held, self._held = self._held, ""
+        if self._state == _REASONING:
+            return held, ""
+        if self._state == _DETECT and self._reasoning_model:
+            return held.lstrip(), ""
+        if self._state == _AFTER_TAG:
+            return "", ""
+        return "", held
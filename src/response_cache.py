@@ -0,0 +1,277 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import anyio
+
+logger = logging.getLogger(__name__)
+
+# 每个条目除响应体和键之外的估算内存开销（字节）
+ENTRY_OVERHEAD = 200
+
+
+def cache_key(params: Dict[str, Any], api_key_hash: str) -> str:
+    """按模型、转换后的消息和采样参数计算规范化的缓存键
+
+    键中包含API Key的哈希，命中缓存不会绕过上游对API Key的校验。
+    """
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{api_key_hash}|{canonical}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """非流式聊天完成的内存响应缓存
+
+    按响应体字节数限制总大小的LRU，条目超过TTL后在下次访问时淘汰。
+    缓存序列化后的响应体，命中时直接返回，不再经过Pydantic。
+    接口为异步以便与SQLiteResponseCache互换，内部操作都是同步的内存操作。
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (响应体, 实际服务的模型, 写入时间, 估算大小)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.size_bytes = 0
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """获取缓存的(响应体, 实际服务的模型)，不存在或已过期时返回None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        body, served_model, created_at, size = entry
+        if self.ttl > 0 and time.monotonic() - created_at > self.ttl:
+            del self._entries[key]
+            self.size_bytes -= size
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body, served_model
+
+    async def put(self, key: str, body: bytes, served_model: str):
+        """写入响应体，超过字节预算时淘汰最久未使用的条目"""
+        size = len(body) + len(key) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size_bytes -= old[3]
+        self._entries[key] = (body, served_model, time.monotonic(), size)
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size_bytes -= evicted[3]
+            self.evictions += 1
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息（与SQLiteResponseCache的接口一致）"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteResponseCache:
+    """SQLite（WAL模式）持久化响应缓存，同一主机上的多个worker进程共享，重启后仍然有效
+
+    接口与ResponseCache相同。条目的写入/访问时间使用墙钟时间以便跨进程共享；
+    总大小超过max_bytes时按最近访问时间淘汰并回收文件空间。
+
+    所有数据库操作都在一个专用的工作线程中串行执行，其他worker持有写锁（如正在压缩）时
+    只有等待缓存的请求受影响，事件循环不会被阻塞。锁等待时间很短，等待超时和其他数据库错误
+    都按未命中（或放弃写入）处理，不影响请求。
+    """
+
+    # 命中时最多每隔这么多秒更新一次访问时间，避免每次读取都产生写操作
+    TOUCH_INTERVAL = 60.0
+    # 每写入这么多次检查一次过期条目和总大小
+    COMPACT_EVERY = 50
+    # 等待其他进程释放写锁的最长时间（秒）
+    BUSY_TIMEOUT = 0.25
+
+    def __init__(self, path: str, max_bytes: int, ttl: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._puts = 0
+        # 串行执行数据库操作的线程限制器（需要在事件循环中创建，首次使用时创建）
+        self._limiter: Optional[anyio.CapacityLimiter] = None
+
+        # 统计信息（当前进程）
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.errors = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=self.BUSY_TIMEOUT)
+        # auto_vacuum只能在建表之前设置
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, body BLOB NOT NULL, served_model TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        # 启动时清理过期条目（热启动保留其余条目），其他进程正在写入时留到之后的写入再做
+        try:
+            self._compact()
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache compaction skipped: {str(e)}")
+
+    async def _run(self, fn, *args):
+        """在数据库线程中执行fn"""
+        if self._limiter is None:
+            self._limiter = anyio.CapacityLimiter(1)
+        return await anyio.to_thread.run_sync(fn, *args, limiter=self._limiter)
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """获取缓存的(响应体, 实际服务的模型)，不存在或已过期时返回None"""
+        return await self._run(self._get, key)
+
+    async def put(self, key: str, body: bytes, served_model: str):
+        """写入响应体，定期清理过期条目并把总大小压缩到字节预算以内"""
+        await self._run(self._put, key, body, served_model)
+
+    def _get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        try:
+            row = self._db.execute(
+                "SELECT body, served_model, created_at, accessed_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            body, served_model, created_at, accessed_at = row
+            now = time.time()
+            if self.ttl > 0 and now - created_at > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if now - accessed_at > self.TOUCH_INTERVAL:
+                self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            self.errors += 1
+            self.misses += 1
+            logger.warning(f"Response cache read failed: {str(e)}")
+            return None
+
+        self.hits += 1
+        return bytes(body), served_model
+
+    def _put(self, key: str, body: bytes, served_model: str):
+        size = len(body) + len(key) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, body, served_model, created_at, accessed_at, size) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, body, served_model, now, now, size),
+            )
+            self._puts += 1
+            if self._puts % self.COMPACT_EVERY == 0:
+                self._compact()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Response cache write failed: {str(e)}")
+
+    def _count(self) -> Tuple[Optional[int], Optional[int]]:
+        """所有进程共享的条目数和总大小，其他进程持有写锁超时时返回(None, None)"""
+        try:
+            return self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        except sqlite3.Error:
+            return None, None
+
+    def _compact(self):
+        """在一个事务中删除过期条目，超过字节预算时按最近访问时间淘汰，然后回收文件空间"""
+        expired = 0
+        evicted = 0
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            if self.ttl > 0:
+                cursor = self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+                expired = max(cursor.rowcount, 0)
+
+            excess = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0] - self.max_bytes
+            if excess > 0:
+                # 最久未访问的若干条目的大小之和刚好不小于超出的字节数
+                count = self._db.execute(
+                    "SELECT COUNT(*) FROM (SELECT SUM(size) OVER (ORDER BY accessed_at ROWS UNBOUNDED PRECEDING) - size AS before "
+                    "FROM responses) WHERE before < ?",
+                    (excess,),
+                ).fetchone()[0]
+                cursor = self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)", (count,)
+                )
+                evicted = max(cursor.rowcount, 0)
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self.expirations += expired
+        self.evictions += evicted
+        if expired or evicted:
+            self._db.execute("PRAGMA incremental_vacuum")
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息（条目数和大小为所有进程共享的数据，在数据库线程中统计；命中率为当前进程）"""
+        entries, size_bytes = await self._run(self._count)
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": entries,
+            "size_bytes": size_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "errors": self.errors,
+        }
+
+
+def create_response_cache(app_config):
+    """根据配置创建响应缓存（memory或sqlite）"""
+    if app_config.response_cache_backend == "sqlite":
+        return SQLiteResponseCache(
+            path=app_config.response_cache_path,
+            max_bytes=app_config.response_cache_max_bytes,
+            ttl=app_config.response_cache_ttl,
+        )
+    return ResponseCache(max_bytes=app_config.response_cache_max_bytes, ttl=app_config.response_cache_ttl)
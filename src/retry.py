@@ -0,0 +1,164 @@
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+logger = logging.getLogger(__name__)
+
+# 可重试的上游HTTP状态码
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+
+class RetryBudget:
+    """全局重试预算
+
+    在滑动时间窗口内，重试次数不超过请求数的ratio倍（另保留每秒min_per_second次的最低额度），
+    防止上游故障时重试放大流量。
+    """
+
+    def __init__(self, ratio: float, min_per_second: float = 1.0, window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._requests: deque = deque()
+        self._retries: deque = deque()
+
+        # 统计信息
+        self.total_requests = 0
+        self.total_retries = 0
+        self.exhausted = 0
+
+    def _prune(self, now: float):
+        cutoff = now - self.window
+        while self._requests and self._requests[0] < cutoff:
+            self._requests.popleft()
+        while self._retries and self._retries[0] < cutoff:
+            self._retries.popleft()
+
+    def record_request(self):
+        """记录一次原始请求（不含重试）"""
+        now = time.monotonic()
+        self._prune(now)
+        self._requests.append(now)
+        self.total_requests += 1
+
+    def try_acquire(self) -> bool:
+        """申请一次重试额度"""
+        now = time.monotonic()
+        self._prune(now)
+        allowed = max(self.min_per_second * self.window, self.ratio * len(self._requests))
+        if len(self._retries) >= allowed:
+            self.exhausted += 1
+            return False
+        self._retries.append(now)
+        self.total_retries += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取重试预算统计"""
+        self._prune(time.monotonic())
+        return {
+            "ratio": self.ratio,
+            "window_requests": len(self._requests),
+            "window_retries": len(self._retries),
+            "total_requests": self.total_requests,
+            "total_retries": self.total_retries,
+            "budget_exhausted": self.exhausted,
+        }
+
+
+class RetryPolicy:
+    """上游请求的重试策略：指数退避 + 完全抖动，遵循Retry-After，受全局重试预算约束"""
+
+    def __init__(self, max_retries: int, base_delay: float, max_delay: float, budget: RetryBudget):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+
+        # 统计信息
+        self.recovered = 0
+        self.gave_up = 0
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """429/502/503/504和连接失败可以重试；读超时说明上游已在处理，不再重试"""
+        if isinstance(error, APIStatusError):
+            return error.status_code in RETRYABLE_STATUS_CODES
+        if isinstance(error, APITimeoutError):
+            return isinstance(error.__cause__, httpx.ConnectTimeout)
+        return isinstance(error, APIConnectionError)
+
+    @staticmethod
+    def retry_after(error: Exception) -> Optional[float]:
+        """解析上游响应的Retry-After头（秒数或HTTP日期）"""
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        value = response.headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(retry_at.timestamp() - time.time(), 0.0)
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """计算第attempt次重试前的等待时间"""
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(self, operation: Callable[[], Awaitable], timeout_policy=None):
+        """执行operation，可重试的失败按退避策略重试
+
+        operation每次调用都必须返回新的awaitable。只有在尚未向客户端发送任何数据时才能调用本方法。
+        """
+        self.budget.record_request()
+        attempt = 0
+        while True:
+            try:
+                result = await operation()
+                if attempt:
+                    self.recovered += 1
+                return result
+            except Exception as e:
+                if not self.is_retryable(e) or attempt >= self.max_retries:
+                    if attempt:
+                        self.gave_up += 1
+                    raise
+
+                delay = self.backoff(attempt, e)
+                if timeout_policy is not None and delay >= timeout_policy.remaining():
+                    # 等待后已超过总时长上限，直接返回本次错误
+                    self.gave_up += 1
+                    raise
+                if not self.budget.try_acquire():
+                    logger.warning(f"Retry budget exhausted, not retrying: {str(e)}")
+                    self.gave_up += 1
+                    raise
+
+                attempt += 1
+                logger.warning(f"Retrying upstream request (attempt {attempt}/{self.max_retries}) in {delay:.2f}s: {str(e)}")
+                await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取重试统计"""
+        return {
+            "max_retries": self.max_retries,
+            "recovered": self.recovered,
+            "gave_up": self.gave_up,
+            "budget": self.budget.get_stats(),
+        }
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+
+import anyio
+
+logger = logging.getLogger(__name__)
+
+
+class StreamFlight:
+    """一个正在进行的流式请求，向所有订阅者广播同一份SSE帧
+
+    上游流在独立的任务中读取，已发出的帧全部保留，后加入的订阅者从第一帧开始收到完整的流。
+    单个订阅者断开不影响其他订阅者，所有订阅者都离开后才取消上游读取。
+    """
+
+    def __init__(self, frames: AsyncIterator[str], opening: asyncio.Future, on_done: Callable[[], None]):
+        # 打开上游流的任务，完成后可以得到实际服务的模型
+        self.opening = opening
+        self._frames: List[str] = []
+        self._done = False
+        self._changed = asyncio.Event()
+        self._subscribers = 0
+        self._on_done = on_done
+        self._task = asyncio.ensure_future(self._run(frames))
+        self._task.add_done_callback(lambda _: self._finished())
+
+    async def _run(self, frames: AsyncIterator[str]):
+        try:
+            async for frame in frames:
+                self._frames.append(frame)
+                self._notify()
+        except Exception as e:
+            logger.error(f"Error in coalesced stream: {str(e)}")
+        finally:
+            self._done = True
+            self._notify()
+            with anyio.CancelScope(shield=True):
+                await frames.aclose()
+
+    def _finished(self):
+        # 读取任务在开始之前就被取消时_run不会执行，在这里结束流并取消打开任务
+        self._done = True
+        self._notify()
+        if not self.opening.done():
+            self.opening.cancel()
+        self._on_done()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def subscribe(self) -> "StreamSubscription":
+        """登记一个订阅者，返回从第一帧开始读取流的迭代器"""
+        self._subscribers += 1
+        return StreamSubscription(self)
+
+    def unsubscribe(self):
+        """订阅者离开，最后一个订阅者离开时取消上游读取"""
+        self._subscribers -= 1
+        if self._subscribers <= 0 and not self._done:
+            # 立即停止接受新的订阅者，之后的相同请求重新发往上游
+            self._on_done()
+            self._task.cancel()
+
+
+class StreamSubscription:
+    """一个订阅者读取StreamFlight的异步迭代器
+
+    订阅在创建时即已登记，close()/aclose()退订且只生效一次。迭代器从未被迭代就被丢弃时
+    （例如响应在发送第一帧之前失败），被回收时同样会退订，不会让上游流一直等待订阅者。
+    """
+
+    def __init__(self, flight: StreamFlight):
+        self.flight = flight
+        self._index = 0
+        # 只引用flight.unsubscribe而不引用self，迭代器被回收时执行
+        self._finalizer = weakref.finalize(self, flight.unsubscribe)
+
+    def close(self):
+        """退订（多次调用只生效一次）"""
+        self._finalizer()
+
+    async def aclose(self):
+        self.close()
+
+    def __aiter__(self) -> "StreamSubscription":
+        return self
+
+    async def __anext__(self) -> str:
+        flight = self.flight
+        try:
+            while self._finalizer.alive:
+                changed = flight._changed
+                if self._index < len(flight._frames):
+                    frame = flight._frames[self._index]
+                    self._index += 1
+                    return frame
+                if flight._done:
+                    break
+                await changed.wait()
+        except BaseException:
+            # 读取被取消（客户端断开）时同样退订
+            self.close()
+            raise
+        self.close()
+        raise StopAsyncIteration
+
+
+class SingleFlight:
+    """合并并发的相同请求：同一个键同时只有一个请求发往上游，其余请求等待并共享它的结果"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, StreamFlight] = {}
+
+        # 统计信息
+        self.leaders = 0
+        self.coalesced = 0
+        self.stream_leaders = 0
+        self.stream_coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """执行fn并返回(结果, 是否为发起请求的调用者)；同一个键已有请求在进行时等待它的结果
+
+        请求在独立的任务中执行，任何一个等待者被取消都不会取消请求本身。
+        有副作用的步骤（例如写入缓存）应放在fn内，保证只执行一次。
+        """
+        task = self._calls.get(key)
+        leader = task is None
+        if leader:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._call_done(key, task))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task), leader
+
+    def _call_done(self, key: str, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # 所有等待者都已离开时异常无人读取，这里读取一次避免asyncio报告未处理的异常
+            task.exception()
+
+    def stream(
+        self,
+        key: str,
+        start: Callable[[], Tuple[AsyncIterator[str], asyncio.Future]]
+    ) -> Tuple[StreamSubscription, bool]:
+        """加入同一个键正在进行的流；没有时调用start()得到(SSE帧生成器, 打开任务)并开始读取
+
+        返回(当前订阅者的迭代器, 是否为发起流的调用者)。
+        """
+        flight = self._streams.get(key)
+        leader = flight is None
+        if leader:
+            self.stream_leaders += 1
+            frames, opening = start()
+            flight = StreamFlight(frames, opening, lambda: self._stream_done(key, flight))
+            self._streams[key] = flight
+        else:
+            self.stream_coalesced += 1
+        return flight.subscribe(), leader
+
+    def _stream_done(self, key: str, flight: StreamFlight):
+        if self._streams.get(key) is flight:
+            del self._streams[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取请求合并统计信息"""
+        return {
+            "in_flight": len(self._calls),
+            "in_flight_streams": len(self._streams),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "stream_leaders": self.stream_leaders,
+            "stream_coalesced": self.stream_coalesced,
+        }
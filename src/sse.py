@@ -0,0 +1,150 @@
+import asyncio
+from json.encoder import encode_basestring
+from typing import AsyncIterator, List, Optional, Tuple
+
+import anyio
+
+
+class StreamChunkEncoder:
+    """流式chunk的快速编码器
+
+    每个流的id/created/model前缀只渲染一次，每个token只对delta内容做JSON转义，
+    输出与ChatCompletionStreamResponse(...).model_dump_json()逐字节一致。
+    """
+
+    def __init__(self, response_id: str, created: int, model: str):
+        self._head = (
+            f'data: {{"id":{encode_basestring(response_id)},"object":"chat.completion.chunk",'
+            f'"created":{int(created)},"model":{encode_basestring(model)},"choices":'
+        )
+        self._prefix = self._head + '[{"index":0,"delta":'
+        self._content_prefix = self._prefix + '{"role":null,"content":'
+        self._content_suffix = ',"reasoning":null},"finish_reason":null}]}\n\n'
+        self._reasoning_prefix = self._prefix + '{"role":null,"content":null,"reasoning":'
+        self._reasoning_suffix = '},"finish_reason":null}]}\n\n'
+
+    def content(self, content: str) -> str:
+        """渲染一个内容chunk"""
+        return self._content_prefix + encode_basestring(content) + self._content_suffix
+
+    def reasoning(self, reasoning: str) -> str:
+        """渲染一个思考内容chunk（delta.reasoning）"""
+        return self._reasoning_prefix + encode_basestring(reasoning) + self._reasoning_suffix
+
+    def finish(self, finish_reason: Optional[str]) -> str:
+        """渲染带finish_reason的结束chunk（delta为空）"""
+        reason = encode_basestring(finish_reason) if finish_reason is not None else "null"
+        return self._prefix + '{"role":null,"content":null,"reasoning":null},"finish_reason":' + reason + "}]}\n\n"
+
+    def usage(self, prompt_tokens: int, completion_tokens: int) -> str:
+        """渲染stream_options.include_usage要求的最后一个chunk（choices为空）"""
+        return (
+            f'{self._head}[],"usage":{{"prompt_tokens":{int(prompt_tokens)},'
+            f'"completion_tokens":{int(completion_tokens)},"total_tokens":{int(prompt_tokens) + int(completion_tokens)}}}}}\n\n'
+        )
+
+
+# SSE注释帧，客户端会忽略，只用于保持连接活跃
+HEARTBEAT = ": keep-alive\n\n"
+
+
+async def with_heartbeats(frames: AsyncIterator[str], interval: float) -> AsyncIterator[str]:
+    """在等待第一个SSE帧期间每interval秒发送一次心跳
+
+    防止负载均衡器和Serverless平台在推理模型长时间的首个token延迟中断开空闲连接。
+    收到第一个真实数据后直接透传，不再有任何额外开销。
+    """
+    iterator = frames.__aiter__()
+    pending = asyncio.ensure_future(iterator.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if done:
+                break
+            yield HEARTBEAT
+        try:
+            first = pending.result()
+        except StopAsyncIteration:
+            return
+        pending = None
+        yield first
+        async for frame in iterator:
+            yield frame
+    finally:
+        if pending is not None and not pending.done():
+            # 正在读取的任务被取消时，源生成器在该任务中自行清理
+            pending.cancel()
+        else:
+            # 及时关闭源生成器（释放上游连接），被取消时也必须执行完毕
+            with anyio.CancelScope(shield=True):
+                await iterator.aclose()
+
+
+async def coalesce_deltas(
+    deltas: AsyncIterator[Tuple[Optional[str], int, Optional[str]]],
+    window: float,
+    max_bytes: int
+) -> AsyncIterator[Tuple[Optional[str], int, Optional[str]]]:
+    """合并连续的内容delta，减少SSE帧数和socket写入次数
+
+    deltas产出(内容, token数, finish_reason)。第一个内容delta立即发出，不影响首个token延迟；
+    之后的内容delta最多缓冲window秒或max_bytes字节后合并为一个。带finish_reason的delta
+    会先发出已缓冲的内容再原样发出，保证顺序不变。
+    """
+    loop = asyncio.get_running_loop()
+    iterator = deltas.__aiter__()
+    pending = None
+    buffered: List[str] = []
+    buffered_tokens = 0
+    buffered_bytes = 0
+    deadline = 0.0
+    first_content_sent = False
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            if buffered:
+                done, _ = await asyncio.wait({pending}, timeout=max(deadline - loop.time(), 0))
+                if not done:
+                    # 窗口到期，上游的下一个delta还没到，先发出已缓冲的内容
+                    yield "".join(buffered), buffered_tokens, None
+                    buffered, buffered_tokens, buffered_bytes = [], 0, 0
+                    continue
+
+            try:
+                content, tokens, finish_reason = await pending
+            except StopAsyncIteration:
+                break
+            except Exception:
+                # 出错前收到的内容仍然发给客户端
+                if buffered:
+                    yield "".join(buffered), buffered_tokens, None
+                    buffered = []
+                raise
+            finally:
+                pending = None
+
+            if content is not None and finish_reason is None and first_content_sent:
+                if not buffered:
+                    deadline = loop.time() + window
+                buffered.append(content)
+                buffered_tokens += tokens
+                buffered_bytes += len(content.encode("utf-8"))
+                if buffered_bytes >= max_bytes:
+                    yield "".join(buffered), buffered_tokens, None
+                    buffered, buffered_tokens, buffered_bytes = [], 0, 0
+                continue
+
+            if buffered:
+                yield "".join(buffered), buffered_tokens, None
+                buffered, buffered_tokens, buffered_bytes = [], 0, 0
+            if content is not None:
+                first_content_sent = True
+            yield content, tokens, finish_reason
+
+        if buffered:
+            yield "".join(buffered), buffered_tokens, None
+    finally:
+        if pending is not None:
+            pending.cancel()
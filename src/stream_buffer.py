@@ -0,0 +1,124 @@
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Optional, Tuple
+
+from .exceptions import SlowClientError
+
+# 背压策略
+COALESCE = "coalesce"  # 超过高水位后把新内容合并进最后一个排队的delta，只缓存原始文本
+DROP = "drop"          # 超过高水位后中止该流，向客户端发送slow_client错误
+BLOCK = "block"        # 超过高水位后暂停读取上游，直到客户端追上
+
+POLICIES = (COALESCE, DROP, BLOCK)
+
+# 每个排队delta除内容文本外的估算内存开销（字节）
+ITEM_OVERHEAD = 120
+
+
+class StreamBuffer:
+    """单个流的上游读取与客户端写入之间的有界缓冲
+
+    读取任务调用put()写入(内容, token数, finish_reason)，写入方异步迭代取出。
+    缓冲的估算内存超过high_water字节后按policy处理。
+    """
+
+    def __init__(self, high_water: int, policy: str = COALESCE):
+        self.high_water = high_water
+        self.policy = policy if policy in POLICIES else COALESCE
+        # 排队的delta：[内容片段列表或None, token数, finish_reason]
+        self._items: deque = deque()
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+        # 统计信息
+        self.buffered_bytes = 0
+        self.peak_bytes = 0
+        self.high_water_events = 0
+        self.coalesced = 0
+        self.dropped = False
+
+    def _over_high_water(self) -> bool:
+        return self.buffered_bytes >= self.high_water
+
+    async def put(self, item: Tuple[Optional[str], int, Optional[str]]):
+        """写入一个delta（由读取任务调用）"""
+        content, tokens, finish_reason = item
+        size = ITEM_OVERHEAD + (len(content) if content else 0)
+
+        if self._over_high_water():
+            self.high_water_events += 1
+            if self.policy == DROP:
+                self.dropped = True
+                self._items.clear()
+                self.buffered_bytes = 0
+                error = SlowClientError("Client is reading too slowly, stream aborted")
+                self.close(error)
+                raise error
+            if self.policy == BLOCK:
+                self._writable.clear()
+                await self._writable.wait()
+            elif content is not None and finish_reason is None and self._items:
+                last = self._items[-1]
+                if last[0] is not None and last[2] is None:
+                    # 合并进最后一个排队的内容delta，只增加原始文本的内存
+                    last[0].append(content)
+                    last[1] += tokens
+                    self.coalesced += 1
+                    self._grow(len(content))
+                    return
+
+        self._items.append([[content] if content is not None else None, tokens, finish_reason])
+        self._grow(size)
+        self._readable.set()
+
+    def _grow(self, size: int):
+        self.buffered_bytes += size
+        if self.buffered_bytes > self.peak_bytes:
+            self.peak_bytes = self.buffered_bytes
+
+    def close(self, error: Optional[BaseException] = None):
+        """上游读取结束（error不为None表示读取出错，写入方取完已缓冲的数据后抛出）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._error = error
+        self._readable.set()
+
+    def __aiter__(self) -> AsyncIterator[Tuple[Optional[str], int, Optional[str]]]:
+        return self._drain()
+
+    async def _drain(self) -> AsyncIterator[Tuple[Optional[str], int, Optional[str]]]:
+        while True:
+            if not self._items:
+                if self._closed:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                self._readable.clear()
+                await self._readable.wait()
+                continue
+
+            parts, tokens, finish_reason = self._items.popleft()
+            content = None
+            if parts is not None:
+                content = parts[0] if len(parts) == 1 else "".join(parts)
+            self.buffered_bytes -= ITEM_OVERHEAD + (len(content) if content else 0)
+            if not self._over_high_water():
+                self._writable.set()
+            yield content, tokens, finish_reason
+
+
+async def pump(source: AsyncIterator[Tuple[Optional[str], int, Optional[str]]], buffer: StreamBuffer):
+    """读取任务：把上游delta写入缓冲，直到上游结束或出错"""
+    try:
+        async for item in source:
+            await buffer.put(item)
+    except SlowClientError:
+        pass
+    except Exception as e:
+        buffer.close(e)
+    finally:
+        buffer.close()
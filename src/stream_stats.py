@@ -0,0 +1,86 @@
+from typing import Any, Dict, Optional, Set
+
+from .stream_buffer import StreamBuffer
+
+
+class StreamStats:
+    """流式响应统计：完成/客户端断开的流数量，提前取消节省的上游token估算，以及各流缓冲的内存占用"""
+
+    def __init__(self, ewma_alpha: float = 0.1):
+        self.ewma_alpha = ewma_alpha
+        # 正常完成的流的平均输出token数，用于估算被取消的流原本还会生成多少token
+        self.avg_completion_tokens: Optional[float] = None
+
+        # 统计信息
+        self.active_streams = 0
+        self.completed_streams = 0
+        self.cancelled_streams = 0
+        self.tokens_before_cancel = 0
+        self.estimated_tokens_saved = 0
+        
+        # 活跃流的缓冲区，以及已结束的流的背压统计
+        self._buffers: Set[StreamBuffer] = set()
+        self.peak_buffer_bytes = 0
+        self.high_water_events = 0
+        self.coalesced_deltas = 0
+        self.slow_client_drops = 0
+
+    def record_completed(self, tokens: int):
+        """记录一个正常完成的流"""
+        self.completed_streams += 1
+        if self.avg_completion_tokens is None:
+            self.avg_completion_tokens = float(tokens)
+        else:
+            self.avg_completion_tokens += self.ewma_alpha * (tokens - self.avg_completion_tokens)
+
+    def record_cancelled(self, tokens: int, max_tokens: Optional[int] = None):
+        """记录一个因客户端断开而提前关闭的流
+
+        预计总长度取正常完成的流的平均长度，不超过max_tokens；两者都未知时不计入节省量。
+        """
+        self.cancelled_streams += 1
+        self.tokens_before_cancel += tokens
+        expected = self.avg_completion_tokens
+        if max_tokens:
+            expected = min(expected, max_tokens) if expected is not None else max_tokens
+        if expected is not None:
+            self.estimated_tokens_saved += max(int(expected) - tokens, 0)
+
+    def add_buffer(self, buffer: StreamBuffer):
+        """登记一个活跃流的缓冲区"""
+        self._buffers.add(buffer)
+
+    def remove_buffer(self, buffer: StreamBuffer):
+        """流结束，汇总其缓冲区的背压统计"""
+        self._buffers.discard(buffer)
+        self.peak_buffer_bytes = max(self.peak_buffer_bytes, buffer.peak_bytes)
+        self.high_water_events += buffer.high_water_events
+        self.coalesced_deltas += buffer.coalesced
+        if buffer.dropped:
+            self.slow_client_drops += 1
+
+    def get_buffer_stats(self) -> Dict[str, Any]:
+        """各流缓冲的估算内存占用（字节）"""
+        sizes = [buffer.buffered_bytes for buffer in self._buffers]
+        return {
+            "buffered_streams": len(sizes),
+            "buffered_bytes_total": sum(sizes),
+            "buffered_bytes_max": max(sizes, default=0),
+            "buffered_bytes_avg": round(sum(sizes) / len(sizes), 1) if sizes else 0.0,
+            "peak_stream_bytes": max([self.peak_buffer_bytes] + [buffer.peak_bytes for buffer in self._buffers]),
+            "high_water_events": self.high_water_events + sum(buffer.high_water_events for buffer in self._buffers),
+            "coalesced_deltas": self.coalesced_deltas + sum(buffer.coalesced for buffer in self._buffers),
+            "slow_client_drops": self.slow_client_drops,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取流式响应统计"""
+        return {
+            "active_streams": self.active_streams,
+            "completed_streams": self.completed_streams,
+            "cancelled_streams": self.cancelled_streams,
+            "tokens_before_cancel": self.tokens_before_cancel,
+            "estimated_tokens_saved": self.estimated_tokens_saved,
+            "avg_completion_tokens": round(self.avg_completion_tokens, 1) if self.avg_completion_tokens is not None else None,
+            "buffers": self.get_buffer_stats(),
+        }
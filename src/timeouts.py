@@ -0,0 +1,188 @@
+import asyncio
+import time
+from typing import AsyncIterator
+
+import httpx
+
+from .config import config
+from .exceptions import UpstreamTimeoutError
+
+
+class TimeoutPolicy:
+    """上游请求的超时策略
+
+    - connect: 建立连接的超时
+    - first_token: 从发出请求到收到第一个流式chunk的超时
+    - idle: 流式响应中两个chunk之间的最大空闲时间
+    - total: 整个请求的总时长上限
+    """
+
+    def __init__(self, connect: float, first_token: float, idle: float, total: float):
+        self.connect = connect
+        self.first_token = first_token
+        self.idle = idle
+        self.total = total
+        self.started_at = time.monotonic()
+
+    @classmethod
+    def for_model(cls, model: str, app_config=None) -> "TimeoutPolicy":
+        """获取模型的超时策略，MODEL_TIMEOUTS中的配置优先于全局默认值"""
+        app_config = app_config or config
+        overrides = app_config.model_timeouts.get(model)
+        if overrides is None:
+            # 带provider后缀的模型ID（如 model:provider）回退到基础模型的配置
+            overrides = app_config.model_timeouts.get(model.split(":", 1)[0], {})
+
+        return cls(
+            connect=float(overrides.get("connect", app_config.upstream_connect_timeout)),
+            first_token=float(overrides.get("first_token", app_config.upstream_first_token_timeout)),
+            idle=float(overrides.get("idle", app_config.upstream_idle_timeout)),
+            total=float(overrides.get("total", app_config.request_timeout)),
+        )
+
+    def remaining(self) -> float:
+        """距离总时长上限的剩余时间"""
+        return self.total - (time.monotonic() - self.started_at)
+
+    def http_timeout(self, stream: bool = True) -> httpx.Timeout:
+        """传给httpx的超时：连接超时由httpx控制，读超时只作兜底，阶段超时由上层控制
+
+        非流式响应在生成完成前不会返回任何数据，因此读超时取总时长。
+        """
+        read = max(self.first_token, self.idle) if stream else self.total
+        return httpx.Timeout(connect=self.connect, read=read, write=read, pool=self.connect)
+
+    async def run(self, awaitable, phase: str = "total"):
+        """在阶段超时与剩余总时长内等待awaitable完成"""
+        return await self._wait(awaitable, phase)
+
+    async def iter_stream(self, stream, response=None) -> AsyncIterator:
+        """按首个token/chunk间空闲/总时长超时逐个读取上游流式chunk
+
+        每个流只使用一个定时器：每次读取前更新期限，定时器到期时如果期限已经延后则重新设定，
+        否则关闭上游响应（response，默认为stream.response）使正在进行的读取立即失败。
+        每个chunk不再创建新的Task。
+        """
+        if response is None:
+            response = getattr(stream, "response", None)
+        if response is None:
+            # 无法关闭的流只能逐个读取时等待
+            async for chunk in self._iter_with_wait(stream):
+                yield chunk
+            return
+
+        loop = asyncio.get_running_loop()
+        iterator = stream.__aiter__()
+        # 事件循环的时钟即time.monotonic，与started_at一致
+        total_deadline = self.started_at + self.total
+        first_token_deadline = self.started_at + self.first_token
+        if first_token_deadline <= total_deadline:
+            deadline, phase = first_token_deadline, "first_token"
+        else:
+            deadline, phase = total_deadline, "total"
+        reading = False
+        # 是否已收到过chunk（之后的读取使用空闲期限）
+        received = False
+        fired = None
+        closing = None
+        handle = None
+
+        def on_timer():
+            nonlocal handle, fired, closing
+            handle = None
+            if not reading:
+                # 客户端处理chunk期间不计时，下次读取时重新设定
+                return
+            if loop.time() < deadline:
+                handle = loop.call_at(deadline, on_timer)
+                return
+            fired = phase
+            closing = asyncio.ensure_future(response.aclose())
+            closing.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+        try:
+            while True:
+                reading = True
+                if received:
+                    # chunk间的空闲期限从开始读取下一个chunk时计时，不计入客户端处理chunk的时间
+                    idle_deadline = loop.time() + self.idle
+                    if idle_deadline <= total_deadline:
+                        deadline, phase = idle_deadline, "idle"
+                    else:
+                        deadline, phase = total_deadline, "total"
+                if handle is None or handle.when() > deadline:
+                    # 期限只会延后时保留已有的定时器（如每个chunk之后的空闲期限），提前时重新设定
+                    if handle is not None:
+                        handle.cancel()
+                    handle = loop.call_at(deadline, on_timer)
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    if fired is not None:
+                        raise self._timeout_error(fired) from None
+                    return
+                except Exception:
+                    if fired is not None:
+                        raise self._timeout_error(fired) from None
+                    raise
+                reading = False
+                if fired is not None:
+                    raise self._timeout_error(fired)
+                received = True
+                yield chunk
+        finally:
+            reading = False
+            if handle is not None:
+                handle.cancel()
+
+    async def _iter_with_wait(self, stream) -> AsyncIterator:
+        phase = "first_token"
+        while True:
+            try:
+                chunk = await self._wait(stream.__anext__(), phase)
+            except StopAsyncIteration:
+                return
+            phase = "idle"
+            yield chunk
+
+    async def _wait(self, awaitable, phase: str):
+        # 首个token的期限从请求开始计时，chunk间空闲期限从上一个chunk开始计时
+        remaining = self.remaining()
+        if phase == "first_token":
+            limit = self.first_token - (time.monotonic() - self.started_at)
+        elif phase == "idle":
+            limit = self.idle
+        else:
+            limit = remaining
+        timeout = min(limit, remaining)
+        if timeout <= 0:
+            # 协程未被等待时需要手动关闭，避免RuntimeWarning
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise self._timeout_error("total")
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise self._timeout_error(phase if limit <= remaining else "total")
+
+    def from_client_timeout(self, error: Exception) -> UpstreamTimeoutError:
+        """将OpenAI SDK/httpx抛出的超时转换为代理超时错误"""
+        if isinstance(error.__cause__, httpx.ConnectTimeout) or isinstance(error, httpx.ConnectTimeout):
+            return UpstreamTimeoutError(
+                f"Upstream connection timed out after {self.connect:g}s",
+                code="connect_timeout",
+            )
+        return UpstreamTimeoutError(f"Upstream request timed out: {error}")
+
+    def _timeout_error(self, phase: str) -> UpstreamTimeoutError:
+        limits = {"first_token": self.first_token, "idle": self.idle, "total": self.total}
+        messages = {
+            "first_token": "Upstream did not send the first token within",
+            "idle": "Upstream stream was idle for more than",
+            "total": "Upstream request exceeded the total timeout of",
+        }
+        return UpstreamTimeoutError(
+            f"{messages[phase]} {limits[phase]:g}s",
+            code=f"{phase}_timeout",
+        )
+
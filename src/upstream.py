@@ -0,0 +1,121 @@
+import logging
+from typing import Dict, Any, Optional
+
+import httpx
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamPool:
+    """共享的上游HTTP连接池
+
+    整个进程只创建一个httpx.AsyncClient，所有上游请求复用其中的长连接，
+    避免每次请求都重新建立TCP连接和TLS握手。API Key按请求设置，不绑定到连接池。
+    启用HTTP/2后，并发请求在少量连接上多路复用；上游不支持时通过ALPN自动回退到HTTP/1.1。
+    """
+
+    def __init__(self, app_config=None):
+        """初始化连接池（尚未创建底层连接）"""
+        self.config = app_config or config
+        self.http_client: Optional[httpx.AsyncClient] = None
+
+        # 连接池统计
+        self.requests_sent = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.http2_enabled = False
+        self.responses_by_http_version: Dict[str, int] = {}
+
+    def start(self) -> httpx.AsyncClient:
+        """创建共享的httpx.AsyncClient"""
+        if self.http_client is not None and not self.http_client.is_closed:
+            return self.http_client
+
+        # 所有流量都发往同一个上游主机，因此max_connections即为单主机的最大连接数
+        limits = httpx.Limits(
+            max_connections=self.config.http_max_connections,
+            max_keepalive_connections=self.config.http_pool_size,
+            keepalive_expiry=self.config.http_keepalive_expiry,
+        )
+        self.http2_enabled = self.config.http2_enabled and self._http2_available()
+        self.http_client = httpx.AsyncClient(
+            limits=limits,
+            http2=self.http2_enabled,
+            event_hooks={"request": [self._on_request], "response": [self._on_response]},
+        )
+        logger.info(
+            f"Upstream connection pool created - max_connections: {limits.max_connections}, "
+            f"pool_size: {limits.max_keepalive_connections}, keepalive_expiry: {limits.keepalive_expiry}s, "
+            f"http2: {self.http2_enabled}"
+        )
+        return self.http_client
+
+    @staticmethod
+    def _http2_available() -> bool:
+        """HTTP/2需要可选依赖h2，缺失时回退到HTTP/1.1"""
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP2_ENABLED is set but the 'h2' package is not installed, falling back to HTTP/1.1")
+            return False
+        return True
+
+    async def close(self):
+        """关闭连接池及其所有连接"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            logger.info("Upstream connection pool closed")
+        self.http_client = None
+
+    @property
+    def is_started(self) -> bool:
+        """连接池是否可用"""
+        return self.http_client is not None and not self.http_client.is_closed
+
+    async def _on_request(self, request: httpx.Request):
+        """请求钩子：挂载httpcore trace以统计新建连接和握手次数"""
+        self.requests_sent += 1
+        request.extensions["trace"] = self._trace
+
+    async def _on_response(self, response: httpx.Response):
+        """响应钩子：统计实际协商出的HTTP版本"""
+        version = response.http_version
+        self.responses_by_http_version[version] = self.responses_by_http_version.get(version, 0) + 1
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]):
+        """httpcore trace回调"""
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计信息"""
+        idle = 0
+        active = 0
+        http2_connections = 0
+        if self.is_started:
+            # httpx没有公开连接池状态，这里读取httpcore连接池的连接列表
+            pool = getattr(self.http_client._transport, "_pool", None)
+            for connection in getattr(pool, "connections", []):
+                if connection.is_idle():
+                    idle += 1
+                elif not connection.is_closed():
+                    active += 1
+                if "HTTP/2" in connection.info():
+                    http2_connections += 1
+
+        return {
+            "started": self.is_started,
+            "idle_connections": idle,
+            "active_connections": active,
+            "requests_sent": self.requests_sent,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "handshakes_avoided": max(self.requests_sent - self.connections_opened, 0),
+            "http2_enabled": self.http2_enabled,
+            "http2_connections": http2_connections,
+            "responses_by_http_version": dict(self.responses_by_http_version),
+        }
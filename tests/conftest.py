@@ -0,0 +1,36 @@
+"""测试公共fixture：用httpx.MockTransport模拟上游，通过HuggingFaceConverter走完整的请求路径，不访问网络"""
+import httpx
+import pytest
+
+from src.config import config
+from src.converter import HuggingFaceConverter
+from src.upstream import UpstreamPool
+from tests.helpers import BASE_URL
+
+
+@pytest.fixture
+async def make_converter(monkeypatch):
+    """make_converter(handler, **settings)：按settings覆盖配置，上游请求交给handler处理"""
+    clients = []
+
+    def make(handler, **settings):
+        options = dict(
+            hf_token="server-token",
+            hf_base_url=BASE_URL,
+            hf_upstreams=[{"url": BASE_URL, "weight": 1.0}],
+            retry_base_delay=0.001,
+            retry_max_delay=0.001,
+            sse_heartbeat_interval=0,
+            disconnect_poll_interval=0.01,
+        )
+        options.update(settings)
+        for name, value in options.items():
+            monkeypatch.setattr(config, name, value)
+        pool = UpstreamPool()
+        pool.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        clients.append(pool.http_client)
+        return HuggingFaceConverter(upstream_pool=pool)
+
+    yield make
+    for client in clients:
+        await client.aclose()
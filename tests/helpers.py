@@ -0,0 +1,117 @@
+"""模拟上游的请求和响应构造工具"""
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from src.models import ChatCompletionRequest
+
+BASE_URL = "https://upstream.test/v1"
+
+
+def make_request(model: str = "m", content: str = "hi", **kwargs) -> ChatCompletionRequest:
+    return ChatCompletionRequest(model=model, messages=[{"role": "user", "content": content}], **kwargs)
+
+
+def completion(model: str, content: str, finish_reason: str = "stop", usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """上游非流式响应体"""
+    return {
+        "id": "chatcmpl-upstream",
+        "object": "chat.completion",
+        "created": 1700000000,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+        "usage": usage or {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+def sse_frames(model: str, contents: List[str], finish_reason: str = "stop", usage: Optional[Dict[str, int]] = None) -> List[bytes]:
+    """上游流式响应的SSE帧：每段内容一帧，然后是结束帧、可选的usage帧和[DONE]"""
+    def frame(delta, reason=None, chunk_usage=None):
+        payload = {
+            "id": "chatcmpl-upstream",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": reason}] if chunk_usage is None else [],
+        }
+        if chunk_usage is not None:
+            payload["usage"] = chunk_usage
+        return f"data: {json.dumps(payload)}\n\n".encode()
+
+    frames = [frame({"role": "assistant", "content": text}) for text in contents]
+    frames.append(frame({}, finish_reason))
+    if usage is not None:
+        frames.append(frame(None, chunk_usage=usage))
+    frames.append(b"data: [DONE]\n\n")
+    return frames
+
+
+def scripted(*responses):
+    """按顺序返回给定的响应（最后一个重复使用），异常实例直接抛出"""
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(request)
+        response = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return response() if callable(response) else response
+
+    return handler, calls
+
+
+class SSEStream(httpx.AsyncByteStream):
+    """逐帧产出的上游响应体，每帧之前等待delay秒，记录已发送的帧数以及是否被关闭
+
+    与真实连接一样，关闭之后正在进行和之后的读取都会失败。
+    """
+
+    def __init__(self, frames: List[bytes], delay: float = 0.0):
+        self.frames = frames
+        self.delay = delay
+        self.sent = 0
+        self.closed = False
+        self._closing = asyncio.Event()
+
+    async def __aiter__(self):
+        for frame in self.frames:
+            if self.delay:
+                try:
+                    await asyncio.wait_for(self._closing.wait(), self.delay)
+                except asyncio.TimeoutError:
+                    pass
+            if self.closed:
+                raise httpx.ReadError("connection closed")
+            self.sent += 1
+            yield frame
+
+    async def aclose(self):
+        self.closed = True
+        self._closing.set()
+
+
+def sse_response(frames: List[bytes], delay: float = 0.0) -> httpx.Response:
+    return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=SSEStream(frames, delay))
+
+
+async def read_frames(chunks) -> List[str]:
+    return [chunk if isinstance(chunk, str) else chunk.decode() async for chunk in chunks]
+
+
+def payloads(frames: List[str]) -> List[Dict[str, Any]]:
+    """解析SSE数据帧（忽略心跳注释和[DONE]）"""
+    return [
+        json.loads(frame[len("data: "):])
+        for frame in frames
+        if frame.startswith("data: ") and frame.strip() != "data: [DONE]"
+    ]
+
+
+def streamed_text(frames: List[str], field: str = "content") -> str:
+    return "".join(
+        choice["delta"].get(field) or ""
+        for payload in payloads(frames)
+        for choice in payload.get("choices", [])
+    )
@@ -0,0 +1,103 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.exceptions import ModelNotServedError
+from tests.helpers import completion, make_request
+
+UPSTREAM_A = "https://a.test/v1"
+UPSTREAM_B = "https://b.test/v1"
+
+
+def _recording(status=None, delays=None):
+    """按主机名返回响应（status/delays为主机名到状态码/延迟的映射），记录(主机名, Authorization)"""
+    seen = []
+
+    async def handler(request: httpx.Request):
+        host = request.url.host
+        seen.append((host, request.headers.get("authorization")))
+        await asyncio.sleep((delays or {}).get(host, 0))
+        code = (status or {}).get(host, 200)
+        if code != 200:
+            return httpx.Response(code)
+        return httpx.Response(200, json=completion("m", "ok"))
+
+    return handler, seen
+
+
+async def test_own_credentials_are_sent_instead_of_client_key(make_converter):
+    handler, seen = _recording()
+    converter = make_converter(handler, hf_upstreams=[
+        {"url": UPSTREAM_A, "weight": 1.0},
+        {"url": UPSTREAM_B, "weight": 1.0, "api_key": "b-secret"},
+        {"url": "https://c.test/v1", "weight": 1.0, "api_key": ""},
+    ])
+
+    for _ in range(30):
+        await converter.create_chat_completion(make_request(), "client-key")
+
+    keys = {}
+    for host, authorization in seen:
+        keys.setdefault(host, set()).add(authorization)
+    assert keys == {
+        "a.test": {"Bearer client-key"},
+        "b.test": {"Bearer b-secret"},
+        "c.test": {"Bearer EMPTY"},
+    }
+
+
+async def test_requests_only_go_to_upstreams_serving_the_model(make_converter):
+    handler, seen = _recording()
+    converter = make_converter(handler, hf_upstreams=[
+        {"url": UPSTREAM_A, "weight": 1.0, "models": ["model-a"]},
+        {"url": UPSTREAM_B, "weight": 1.0, "models": ["model-b"]},
+    ])
+
+    for _ in range(10):
+        await converter.create_chat_completion(make_request("model-a"))
+        await converter.create_chat_completion(make_request("model-b"))
+    assert seen[0::2] == [("a.test", "Bearer server-token")] * 10
+    assert seen[1::2] == [("b.test", "Bearer server-token")] * 10
+
+    with pytest.raises(ModelNotServedError):
+        await converter.create_chat_completion(make_request("model-c"))
+    assert len(seen) == 20
+
+
+async def test_failing_upstream_is_ejected(make_converter):
+    handler, seen = _recording(status={"a.test": 503})
+    converter = make_converter(
+        handler,
+        hf_upstreams=[{"url": UPSTREAM_A, "weight": 1.0}, {"url": UPSTREAM_B, "weight": 1.0}],
+        upstream_max_retries=3,
+        retry_budget_ratio=1.0,
+        lb_ejection_failures=2,
+        lb_max_ejection_percent=0.5,
+        circuit_breaker_enabled=False,
+    )
+
+    for _ in range(20):
+        response = await converter.create_chat_completion(make_request())
+        assert response.choices[0].message.content == "ok"
+
+    stats = converter.balancer.get_stats()
+    assert stats[UPSTREAM_A]["ejections"] == 1
+    assert stats[UPSTREAM_A]["ejected"]
+    # 摘除之后不再发往a
+    last_a = max(index for index, (host, _) in enumerate(seen) if host == "a.test")
+    assert all(host == "b.test" for host, _ in seen[last_a + 1:])
+    assert stats[UPSTREAM_A]["requests"] <= 3
+
+
+async def test_prefers_lower_latency_upstream(make_converter):
+    handler, seen = _recording(delays={"a.test": 0.03, "b.test": 0.0})
+    converter = make_converter(handler, hf_upstreams=[{"url": UPSTREAM_A, "weight": 1.0}, {"url": UPSTREAM_B, "weight": 1.0}])
+
+    for _ in range(20):
+        await converter.create_chat_completion(make_request())
+
+    # 两个上游都有延迟样本之后只选择更快的b
+    hosts = [host for host, _ in seen]
+    both_sampled = max(hosts.index("a.test"), hosts.index("b.test"))
+    assert "a.test" not in hosts[both_sampled + 1:]
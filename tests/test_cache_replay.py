@@ -0,0 +1,79 @@
+import json
+
+import httpx
+
+from src.models import StreamOptions
+from tests.helpers import SSEStream, completion, make_request, payloads, read_frames, sse_frames, streamed_text
+
+CACHE = dict(response_cache_enabled=True, response_cache_backend="memory", request_coalescing_enabled=False)
+TEXT = ["thinking", "</think>", "answer"]
+
+
+def _upstream(delay=0.0):
+    calls = []
+
+    def handler(request: httpx.Request):
+        body = json.loads(request.content)
+        calls.append(body.get("stream", False))
+        if body.get("stream"):
+            stream = SSEStream(sse_frames(body["model"], TEXT), delay)
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=stream)
+        return httpx.Response(200, json=completion(body["model"], "".join(TEXT)))
+
+    return handler, calls
+
+
+async def _stream(converter, request):
+    served_model, chunks, status = await converter.cached_chat_completion_stream(request)
+    return await read_frames(chunks), status
+
+
+async def test_non_streaming_hit_after_streamed_miss_matches_cold_call(make_converter):
+    handler, calls = _upstream()
+    # 非推理模型的流不以<think>开头，实时流原样作为content发送
+    converter = make_converter(handler, reasoning_models=[], **CACHE)
+
+    frames, status = await _stream(converter, make_request(temperature=0, stream=True))
+    assert status == "MISS"
+    assert streamed_text(frames) == "thinking</think>answer"
+
+    body, _, status = await converter.cached_chat_completion(make_request(temperature=0))
+    cold = await converter.create_chat_completion(make_request(temperature=0))
+
+    assert status == "HIT"
+    message = json.loads(body)["choices"][0]["message"]
+    assert (message["reasoning"], message["content"]) == ("thinking", "answer")
+    assert (message["reasoning"], message["content"]) == (cold.choices[0].message.reasoning, cold.choices[0].message.content)
+    assert calls == [True, False]
+
+
+async def test_streaming_hit_replays_cached_response(make_converter):
+    handler, calls = _upstream()
+    converter = make_converter(handler, **CACHE)
+    request = make_request(temperature=0, stream=True, stream_options=StreamOptions(include_usage=True))
+
+    await _stream(converter, request)
+    frames, status = await _stream(converter, request)
+
+    assert status == "HIT"
+    assert (streamed_text(frames, "reasoning"), streamed_text(frames)) == ("thinking", "answer")
+    chunks = payloads(frames)
+    assert chunks[-2]["choices"][0]["finish_reason"] == "stop"
+    assert chunks[-1]["usage"]["completion_tokens"] > 0
+    assert frames[-1] == "data: [DONE]\n\n"
+    assert calls == [True]
+
+
+async def test_interrupted_stream_is_not_cached(make_converter):
+    handler, calls = _upstream(delay=0.01)
+    converter = make_converter(handler, **CACHE)
+    request = make_request(temperature=0, stream=True)
+
+    _, chunks, _ = await converter.cached_chat_completion_stream(request)
+    async for _ in chunks:
+        break
+    await chunks.aclose()
+
+    _, status = await _stream(converter, request)
+    assert status == "MISS"
+    assert calls == [True, True]
@@ -0,0 +1,174 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import APIStatusError
+
+from src import circuit_breaker
+from src.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry
+from src.exceptions import CircuitOpenError
+from tests.helpers import make_request, scripted
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", fake.monotonic)
+    return fake
+
+
+def _breaker(**overrides):
+    options = dict(
+        key="m",
+        failure_rate_threshold=0.5,
+        slow_call_seconds=0,
+        slow_call_rate_threshold=0.8,
+        window_size=10,
+        min_calls=4,
+        open_duration=30,
+        probes=1,
+    )
+    options.update(overrides)
+    return CircuitBreaker(**options)
+
+
+def test_opens_when_failure_rate_reaches_threshold(clock):
+    breaker = _breaker()
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_stays_closed_below_min_calls(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_after_open_duration_and_closes_on_probe_success(clock):
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # 只放行一个探测请求
+    assert not breaker.allow()
+
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_probe_failure_reopens(clock):
+    breaker = _breaker(probes=2)
+    for _ in range(4):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow() and breaker.allow()
+    breaker.record_success(0.1)
+    assert breaker.state == HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+    assert breaker.retry_after() == 30
+
+
+def test_ignored_outcome_releases_probe_slot(clock):
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_ignored()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_opens_on_slow_call_rate(clock):
+    breaker = _breaker(slow_call_seconds=1.0, slow_call_rate_threshold=0.75)
+    for latency in (2.0, 2.0, 0.1, 2.0):
+        breaker.record_success(latency)
+    assert breaker.state == OPEN
+
+
+def _config(**overrides):
+    options = dict(
+        circuit_breaker_enabled=True,
+        cb_failure_rate=0.5,
+        cb_slow_call_seconds=0,
+        cb_slow_call_rate=0.8,
+        cb_window_size=4,
+        cb_min_calls=2,
+        cb_open_seconds=30,
+        cb_half_open_probes=1,
+    )
+    options.update(overrides)
+    return SimpleNamespace(**options)
+
+
+def _status_error(status_code: int) -> APIStatusError:
+    request = httpx.Request("POST", "https://upstream.test/v1/chat/completions")
+    return APIStatusError("error", response=httpx.Response(status_code, request=request), body=None)
+
+
+async def test_registry_counts_only_upstream_failures(clock):
+    registry = CircuitBreakerRegistry(_config())
+
+    async def fail_with(status_code):
+        raise _status_error(status_code)
+
+    for _ in range(3):
+        with pytest.raises(APIStatusError):
+            await registry.call("m", lambda: fail_with(400))
+    assert registry.get("m").state == CLOSED
+
+    for _ in range(2):
+        with pytest.raises(APIStatusError):
+            await registry.call("m", lambda: fail_with(503))
+    assert registry.is_open("m")
+
+    async def succeed():
+        return "ok"
+
+    with pytest.raises(CircuitOpenError):
+        await registry.call("m", succeed)
+
+    clock.now += 30
+    assert not registry.is_open("m")
+    assert await registry.call("m", succeed) == "ok"
+    assert registry.get("m").state == CLOSED
+
+
+async def test_open_circuit_fails_fast_without_calling_upstream(make_converter):
+    handler, calls = scripted(httpx.Response(503))
+    converter = make_converter(
+        handler, upstream_max_retries=0, cb_min_calls=2, cb_window_size=4, cb_failure_rate=0.5, cb_open_seconds=30
+    )
+
+    for _ in range(2):
+        with pytest.raises(APIStatusError):
+            await converter.create_chat_completion(make_request())
+    with pytest.raises(CircuitOpenError) as excinfo:
+        await converter.create_chat_completion(make_request())
+
+    assert len(calls) == 2
+    assert excinfo.value.headers["Retry-After"] == "30"
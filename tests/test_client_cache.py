@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+
+from src import client_cache
+from src.client_cache import ClientCache, hash_api_key
+from tests.helpers import completion, make_request
+
+
+def test_evicts_least_recently_used():
+    evicted = []
+    cache = ClientCache(max_entries=2, ttl=0, on_evict=evicted.append)
+    cache.put("a", "client-a")
+    cache.put("b", "client-b")
+    assert cache.get("a") == "client-a"
+    cache.put("c", "client-c")
+
+    assert evicted == ["client-b"]
+    assert cache.get("b") is None
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_expired_entry_is_evicted_on_access(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(client_cache.time, "monotonic", lambda: now[0])
+    evicted = []
+    cache = ClientCache(max_entries=2, ttl=10, on_evict=evicted.append)
+    cache.put("a", "client-a")
+    now[0] += 11
+
+    assert cache.get("a") is None
+    assert evicted == ["client-a"]
+    assert cache.get_stats()["expirations"] == 1
+
+
+async def test_evicted_clients_do_not_close_the_shared_pool(make_converter):
+    seen = []
+
+    def handler(request: httpx.Request):
+        seen.append(request.headers["authorization"])
+        return httpx.Response(200, json=completion("m", "ok"))
+
+    converter = make_converter(handler, client_cache_size=2)
+    for api_key in ["key-a", "key-b", "key-a", "key-c", "key-b"]:
+        await converter.create_chat_completion(make_request(), api_key)
+    await asyncio.sleep(0)
+
+    assert seen == ["Bearer key-a", "Bearer key-b", "Bearer key-a", "Bearer key-c", "Bearer key-b"]
+    stats = converter.client_cache.get_stats()
+    assert (stats["size"], stats["hits"], stats["evictions"]) == (2, 1, 2)
+    assert not converter.upstream_pool.http_client.is_closed
+    # 缓存键只包含API Key的哈希
+    assert all("key-" not in key for key in converter.client_cache._entries)
+    assert any(hash_api_key("key-b") in key for key in converter.client_cache._entries)
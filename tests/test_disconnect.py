@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+import pytest
+
+from tests.helpers import SSEStream, make_request, sse_frames
+
+
+def _slow_upstream(count=200, delay=0.01):
+    """逐帧缓慢产出的上游流，记录每个上游响应体"""
+    streams = []
+
+    def handler(request: httpx.Request):
+        stream = SSEStream(sse_frames("m", ["token "] * count), delay)
+        streams.append(stream)
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=stream)
+
+    return handler, streams
+
+
+@pytest.mark.parametrize("buffer_high_water", [0, 65536])
+async def test_polled_disconnect_closes_upstream(make_converter, buffer_high_water):
+    handler, streams = _slow_upstream()
+    converter = make_converter(handler, stream_buffer_high_water=buffer_high_water, disconnect_poll_interval=0.01)
+    gone = asyncio.Event()
+
+    async def is_disconnected():
+        return gone.is_set()
+
+    _, chunks = await converter.open_chat_completion_stream(make_request(stream=True, max_tokens=200), None, is_disconnected)
+    received = 0
+    async for _ in chunks:
+        received += 1
+        if received == 5:
+            gone.set()
+
+    assert streams[0].closed
+    assert streams[0].sent < 50
+    stats = converter.stream_stats.get_stats()
+    assert stats["cancelled_streams"] == 1
+    assert stats["completed_streams"] == 0
+    assert stats["active_streams"] == 0
+    assert stats["estimated_tokens_saved"] > 100
+
+
+async def test_closing_the_generator_closes_upstream(make_converter):
+    handler, streams = _slow_upstream()
+    converter = make_converter(handler, disconnect_poll_interval=0)
+
+    _, chunks = await converter.open_chat_completion_stream(make_request(stream=True))
+    async for _ in chunks:
+        break
+    # ASGI服务器在客户端断开时关闭（或取消）响应生成器
+    await chunks.aclose()
+
+    assert streams[0].closed
+    assert converter.stream_stats.get_stats()["cancelled_streams"] == 1
+
+
+async def test_cancelled_consumer_closes_upstream(make_converter):
+    handler, streams = _slow_upstream()
+    converter = make_converter(handler, disconnect_poll_interval=0)
+    _, chunks = await converter.open_chat_completion_stream(make_request(stream=True))
+
+    async def consume():
+        async for _ in chunks:
+            pass
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await chunks.aclose()
+
+    assert streams[0].closed
+    assert streams[0].sent < 50
+
+
+async def test_completed_stream_is_not_counted_as_cancelled(make_converter):
+    handler, streams = _slow_upstream(count=3, delay=0)
+    converter = make_converter(handler)
+
+    async def is_disconnected():
+        return False
+
+    _, chunks = await converter.open_chat_completion_stream(make_request(stream=True), None, is_disconnected)
+    frames = [frame async for frame in chunks]
+
+    assert frames[-1] == "data: [DONE]\n\n"
+    stats = converter.stream_stats.get_stats()
+    assert (stats["completed_streams"], stats["cancelled_streams"]) == (1, 0)
@@ -0,0 +1,84 @@
+import json
+
+import httpx
+import pytest
+from openai import APIStatusError
+
+import api_server
+from tests.helpers import completion, make_request, payloads, read_frames, sse_frames, sse_response
+
+FALLBACKS = {"primary": ["backup", "last"]}
+
+
+def _by_model(status):
+    """按请求的模型返回响应：status中的模型返回对应状态码，其余模型正常响应"""
+    seen = []
+
+    def handler(request: httpx.Request):
+        body = json.loads(request.content)
+        model = body["model"]
+        seen.append(model)
+        if model in status:
+            return httpx.Response(status[model], json={"error": "unavailable"})
+        if body.get("stream"):
+            return sse_response(sse_frames(model, ["from ", model]))
+        return httpx.Response(200, json=completion(model, f"from {model}"))
+
+    return handler, seen
+
+
+async def test_overloaded_model_falls_back_along_the_chain(make_converter):
+    handler, seen = _by_model({"primary": 429, "backup": 503})
+    converter = make_converter(handler, model_fallbacks=FALLBACKS, upstream_max_retries=0)
+
+    response = await converter.create_chat_completion(make_request("primary"))
+
+    assert response.model == "last"
+    assert response.choices[0].message.content == "from last"
+    assert seen == ["primary", "backup", "last"]
+    assert converter.fallbacks == {"primary -> backup": 1, "backup -> last": 1}
+
+
+async def test_client_errors_do_not_fall_back(make_converter):
+    handler, seen = _by_model({"primary": 400})
+    converter = make_converter(handler, model_fallbacks=FALLBACKS, upstream_max_retries=0)
+
+    with pytest.raises(APIStatusError):
+        await converter.create_chat_completion(make_request("primary"))
+    assert seen == ["primary"]
+
+
+async def test_last_error_is_raised_when_chain_is_exhausted(make_converter):
+    handler, seen = _by_model({"primary": 503, "backup": 503, "last": 502})
+    converter = make_converter(handler, model_fallbacks=FALLBACKS, upstream_max_retries=0)
+
+    with pytest.raises(APIStatusError) as excinfo:
+        await converter.create_chat_completion(make_request("primary"))
+    assert excinfo.value.status_code == 502
+    assert seen == ["primary", "backup", "last"]
+
+
+async def test_stream_falls_back_before_sending_data(make_converter):
+    handler, _ = _by_model({"primary": 503})
+    converter = make_converter(handler, model_fallbacks=FALLBACKS, upstream_max_retries=0)
+
+    served_model, chunks = await converter.open_chat_completion_stream(make_request("primary", stream=True))
+    frames = await read_frames(chunks)
+
+    assert served_model == "backup"
+    assert {payload["model"] for payload in payloads(frames)} == {"backup"}
+
+
+@pytest.mark.parametrize("stream", [False, True])
+async def test_served_model_header(make_converter, monkeypatch, stream):
+    handler, _ = _by_model({"primary": 503})
+    monkeypatch.setattr(api_server, "converter", make_converter(handler, model_fallbacks=FALLBACKS, upstream_max_retries=0))
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api_server.app), base_url="http://proxy") as client:
+        response = await client.post(
+            "/v1/chat/completions",
+            json={"model": "primary", "messages": [{"role": "user", "content": "hi"}], "stream": stream},
+        )
+
+    assert response.status_code == 200
+    assert response.headers["x-served-model"] == "backup"
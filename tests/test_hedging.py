@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import httpx
+
+from tests.helpers import completion, make_request, read_frames, sse_frames, sse_response
+
+
+def _latencies(*delays):
+    """第n次调用等待delays[n]秒后返回，记录被取消的调用"""
+    calls = []
+    cancelled = []
+
+    async def handler(request: httpx.Request):
+        index = len(calls)
+        calls.append(request)
+        try:
+            await asyncio.sleep(delays[min(index, len(delays) - 1)])
+        except asyncio.CancelledError:
+            cancelled.append(index)
+            raise
+        return httpx.Response(200, json=completion("m", f"call {index}"))
+
+    return handler, calls, cancelled
+
+
+async def test_slow_primary_is_hedged_and_loser_cancelled(make_converter):
+    handler, calls, cancelled = _latencies(1.0, 0.01)
+    converter = make_converter(handler, hedge_enabled=True, hedge_delay=0.05, hedge_max_fraction=1.0)
+
+    started = time.monotonic()
+    response = await converter.create_chat_completion(make_request())
+    await asyncio.sleep(0.01)
+
+    assert response.choices[0].message.content == "call 1"
+    assert time.monotonic() - started < 0.5
+    assert cancelled == [0]
+    stats = converter.hedge_policy.get_stats()
+    assert (stats["hedges_sent"], stats["hedge_wins"]) == (1, 1)
+
+
+async def test_fast_primary_is_not_hedged(make_converter):
+    handler, calls, _ = _latencies(0.0)
+    converter = make_converter(handler, hedge_enabled=True, hedge_delay=0.05, hedge_max_fraction=1.0)
+
+    await converter.create_chat_completion(make_request())
+    assert len(calls) == 1
+
+
+async def test_hedges_are_limited_by_budget(make_converter):
+    handler, calls, _ = _latencies(0.1)
+    converter = make_converter(handler, hedge_enabled=True, hedge_delay=0.01, hedge_max_fraction=0.0)
+
+    await converter.create_chat_completion(make_request())
+    assert len(calls) == 1
+    assert converter.hedge_policy.get_stats()["budget_denied"] == 1
+
+
+async def test_adaptive_delay_waits_for_enough_samples(make_converter):
+    handler, calls, _ = _latencies(0.02)
+    converter = make_converter(
+        handler, hedge_enabled=True, hedge_delay=0, hedge_min_samples=3, hedge_percentile=0.5, hedge_max_fraction=1.0
+    )
+
+    assert converter.hedge_policy.hedge_delay("m") is None
+    for _ in range(3):
+        await converter.create_chat_completion(make_request())
+    # 样本不足时不对冲
+    assert len(calls) == 3
+    assert 0.02 <= converter.hedge_policy.hedge_delay("m") < 0.5
+
+
+async def test_streams_are_never_hedged(make_converter):
+    calls = []
+
+    async def handler(request: httpx.Request):
+        calls.append(request)
+        await asyncio.sleep(0.1)
+        return sse_response(sse_frames("m", ["hello"]))
+
+    converter = make_converter(handler, hedge_enabled=True, hedge_delay=0.01, hedge_max_fraction=1.0)
+    _, chunks = await converter.open_chat_completion_stream(make_request(stream=True))
+    await read_frames(chunks)
+    assert len(calls) == 1
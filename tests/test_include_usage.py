@@ -0,0 +1,64 @@
+import json
+
+import httpx
+import pytest
+
+from src.models import StreamOptions
+from tests.helpers import make_request, payloads, read_frames, sse_frames, sse_response, streamed_text
+
+UPSTREAM_USAGE = {"prompt_tokens": 11, "completion_tokens": 3, "total_tokens": 14}
+
+
+def _upstream(usage=None):
+    bodies = []
+
+    def handler(request: httpx.Request):
+        bodies.append(json.loads(request.content))
+        return sse_response(sse_frames("m", ["a", "b", "c"], usage=usage))
+
+    return handler, bodies
+
+
+async def _stream(converter, include_usage):
+    options = StreamOptions(include_usage=True) if include_usage else None
+    _, chunks = await converter.open_chat_completion_stream(make_request(stream=True, stream_options=options))
+    return await read_frames(chunks)
+
+
+async def test_upstream_usage_is_sent_before_done(make_converter):
+    handler, bodies = _upstream(usage=UPSTREAM_USAGE)
+    converter = make_converter(handler)
+
+    frames = await _stream(converter, include_usage=True)
+
+    assert bodies[0]["stream_options"] == {"include_usage": True}
+    assert frames[-1] == "data: [DONE]\n\n"
+    usage_chunk = payloads(frames)[-1]
+    assert usage_chunk["choices"] == []
+    assert usage_chunk["usage"] == UPSTREAM_USAGE
+    # 结束chunk在usage chunk之前
+    assert payloads(frames)[-2]["choices"][0]["finish_reason"] == "stop"
+    assert streamed_text(frames) == "abc"
+
+
+async def test_local_estimate_when_upstream_sends_no_usage(make_converter):
+    handler, _ = _upstream(usage=None)
+    converter = make_converter(handler)
+
+    frames = await _stream(converter, include_usage=True)
+
+    usage = payloads(frames)[-1]["usage"]
+    assert usage["completion_tokens"] == 3
+    assert usage["total_tokens"] == usage["prompt_tokens"] + 3
+
+
+@pytest.mark.parametrize("usage", [None, UPSTREAM_USAGE])
+async def test_no_usage_chunk_unless_requested(make_converter, usage):
+    handler, bodies = _upstream(usage=usage)
+    converter = make_converter(handler)
+
+    frames = await _stream(converter, include_usage=False)
+
+    assert "stream_options" not in bodies[0]
+    assert all("usage" not in payload for payload in payloads(frames))
+    assert frames[-1] == "data: [DONE]\n\n"
@@ -0,0 +1,183 @@
+import asyncio
+
+import httpx
+import pytest
+
+import api_server
+from src import model_list_cache
+from src.model_list_cache import ModelListCache, etag_matches
+
+
+class Clock:
+    """替换模块内的time，只控制缓存的过期判断（不影响事件循环的时钟）"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_list_cache, "time", clock)
+    return clock
+
+
+def _fetcher(delay=0.0):
+    calls = []
+
+    async def fetch():
+        calls.append(len(calls) + 1)
+        await asyncio.sleep(delay)
+        return f"body-{len(calls)}".encode(), f'"etag-{len(calls)}"'
+
+    return fetch, calls
+
+
+async def test_fresh_entry_is_served_without_fetching(clock):
+    cache = ModelListCache(ttl=10, stale_ttl=100)
+    fetch, calls = _fetcher()
+
+    assert await cache.get("k", fetch) == (b"body-1", '"etag-1"')
+    clock.now += 5
+    assert await cache.get("k", fetch) == (b"body-1", '"etag-1"')
+
+    assert calls == [1]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+async def test_stale_entry_is_served_while_refreshing_in_background(clock):
+    cache = ModelListCache(ttl=10, stale_ttl=100)
+    fetch, calls = _fetcher(delay=0.01)
+    await cache.get("k", fetch)
+    clock.now += 20
+
+    # 过期后立即返回旧列表，并发请求只触发一次刷新
+    results = await asyncio.gather(*[cache.get("k", fetch) for _ in range(3)])
+    assert results == [(b"body-1", '"etag-1"')] * 3
+    await asyncio.sleep(0.03)
+
+    assert await cache.get("k", fetch) == (b"body-2", '"etag-2"')
+    assert calls == [1, 2]
+    assert (cache.stale_hits, cache.refreshes) == (3, 1)
+
+
+async def test_expired_entry_waits_for_single_fetch(clock):
+    cache = ModelListCache(ttl=10, stale_ttl=100)
+    fetch, calls = _fetcher(delay=0.01)
+    await cache.get("k", fetch)
+    clock.now += 200
+
+    results = await asyncio.gather(*[cache.get("k", fetch) for _ in range(3)])
+
+    assert results == [(b"body-2", '"etag-2"')] * 3
+    assert calls == [1, 2]
+
+
+async def test_failed_refresh_keeps_old_list(clock):
+    cache = ModelListCache(ttl=10, stale_ttl=100)
+    fetch, _ = _fetcher()
+    await cache.get("k", fetch)
+    clock.now += 200
+
+    async def fail():
+        raise RuntimeError("upstream down")
+
+    assert await cache.get("k", fail) == (b"body-1", '"etag-1"')
+    assert cache.refresh_failures == 1
+
+
+async def test_failed_fetch_without_entry_raises_and_is_not_cached(clock):
+    cache = ModelListCache(ttl=10, stale_ttl=100)
+
+    async def fail():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        await cache.get("k", fail)
+    assert cache.get_stats()["entries"] == 0
+
+
+async def test_entries_are_bounded(clock, monkeypatch):
+    monkeypatch.setattr(ModelListCache, "MAX_ENTRIES", 2)
+    cache = ModelListCache(ttl=10, stale_ttl=100)
+    fetch, _ = _fetcher()
+
+    for key in ("a", "b", "c"):
+        await cache.get(key, fetch)
+
+    assert list(cache._entries) == ["b", "c"]
+
+
+@pytest.mark.parametrize(
+    "header, matches",
+    [
+        (None, False),
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"other", "abc"', True),
+        ("*", True),
+        ('"other"', False),
+    ],
+)
+def test_etag_matches(header, matches):
+    assert etag_matches(header, '"abc"') is matches
+
+
+def _models_upstream(status=200):
+    seen = []
+
+    def handler(request: httpx.Request):
+        seen.append(request.headers["authorization"])
+        if status != 200:
+            return httpx.Response(status, json={"error": "unavailable"})
+        return httpx.Response(200, json={
+            "object": "list",
+            "data": [{"id": "org/model", "object": "model", "created": 1, "owned_by": "org"}],
+        })
+
+    return handler, seen
+
+
+async def test_models_are_cached_per_api_key(make_converter):
+    handler, seen = _models_upstream()
+    converter = make_converter(handler, models_cache_ttl=60, models_cache_stale_ttl=600)
+
+    first = await converter.get_models_body("key-a")
+    assert await converter.get_models_body("key-a") == first
+    await converter.get_models_body("key-b")
+
+    assert seen == ["Bearer key-a", "Bearer key-b"]
+    assert b"org/model" in first[0]
+
+
+async def test_default_models_are_not_cached_when_upstream_fails(make_converter):
+    handler, seen = _models_upstream(status=503)
+    converter = make_converter(handler, models_cache_ttl=60, models_cache_stale_ttl=600, upstream_max_retries=0)
+
+    body, _ = await converter.get_models_body()
+    await converter.get_models_body()
+
+    assert b"org/model" not in body
+    assert len(seen) == 2
+    assert converter.models_cache.get_stats()["entries"] == 0
+
+
+async def test_models_endpoint_returns_304_for_matching_etag(make_converter, monkeypatch):
+    handler, seen = _models_upstream()
+    monkeypatch.setattr(api_server, "converter", make_converter(handler, models_cache_ttl=60, models_cache_stale_ttl=600))
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api_server.app), base_url="http://proxy") as client:
+        response = await client.get("/v1/models")
+        etag = response.headers["etag"]
+        revalidated = await client.get("/v1/models", headers={"If-None-Match": etag})
+        changed = await client.get("/v1/models", headers={"If-None-Match": '"stale"'})
+
+    assert response.status_code == 200
+    assert response.json()["data"][0]["id"] == "org/model"
+    assert (revalidated.status_code, revalidated.content) == (304, b"")
+    assert revalidated.headers["etag"] == etag
+    assert changed.status_code == 200
+    assert len(seen) == 1
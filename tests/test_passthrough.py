@@ -0,0 +1,82 @@
+import json
+
+import httpx
+import pytest
+
+from src.models import StreamOptions
+from tests.helpers import SSEStream, make_request, payloads, read_frames, sse_frames
+
+PASSTHROUGH = dict(stream_passthrough=True, stream_reasoning_split=False)
+
+
+def _upstream(fail_models=()):
+    streams = []
+
+    def handler(request: httpx.Request):
+        model = json.loads(request.content)["model"]
+        if model in fail_models:
+            return httpx.Response(503)
+        stream = SSEStream(sse_frames(model, ["<think>a</think>", "b"] * 50), delay=0.001)
+        streams.append(stream)
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=stream)
+
+    return handler, streams
+
+
+async def test_upstream_bytes_are_forwarded_unchanged(make_converter):
+    handler, streams = _upstream()
+    converter = make_converter(handler, **PASSTHROUGH)
+
+    _, chunks = await converter.open_chat_completion_stream(make_request("m", stream=True))
+    body = b"".join([chunk async for chunk in chunks])
+
+    assert body == b"".join(streams[0].frames)
+    stats = converter.stream_stats.get_stats()
+    assert (stats["completed_streams"], stats["cancelled_streams"]) == (1, 0)
+
+
+async def test_closing_passthrough_stream_closes_upstream(make_converter):
+    handler, streams = _upstream()
+    converter = make_converter(handler, **PASSTHROUGH)
+
+    _, chunks = await converter.open_chat_completion_stream(make_request("m", stream=True))
+    async for _ in chunks:
+        break
+    await chunks.aclose()
+
+    assert streams[0].closed
+    assert streams[0].sent < len(streams[0].frames)
+    assert converter.stream_stats.get_stats()["cancelled_streams"] == 1
+
+
+@pytest.mark.parametrize(
+    "settings, request_options",
+    [
+        # 拆分<think>时需要解析内容
+        (dict(stream_passthrough=True), {}),
+        # include_usage需要本地统计兜底
+        (PASSTHROUGH, dict(stream_options=StreamOptions(include_usage=True))),
+        # 合并需要解析delta
+        (dict(PASSTHROUGH, stream_coalesce_enabled=True), {}),
+    ],
+)
+async def test_streams_needing_conversion_are_not_passed_through(make_converter, settings, request_options):
+    handler, _ = _upstream()
+    converter = make_converter(handler, **settings)
+
+    _, chunks = await converter.open_chat_completion_stream(make_request("m", stream=True, **request_options))
+    frames = await read_frames(chunks)
+
+    assert all(payload["id"] != "chatcmpl-upstream" for payload in payloads(frames))
+
+
+async def test_fallback_stream_is_converted_with_served_model(make_converter):
+    handler, _ = _upstream(fail_models={"m"})
+    converter = make_converter(handler, model_fallbacks={"m": ["backup"]}, upstream_max_retries=0, **PASSTHROUGH)
+
+    served_model, chunks = await converter.open_chat_completion_stream(make_request("m", stream=True))
+    frames = await read_frames(chunks)
+
+    assert served_model == "backup"
+    assert all(payload["id"] != "chatcmpl-upstream" for payload in payloads(frames))
+    assert {payload["model"] for payload in payloads(frames)} == {"backup"}
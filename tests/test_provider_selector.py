@@ -0,0 +1,112 @@
+import json
+import math
+from types import SimpleNamespace
+
+import httpx
+
+from src.provider_selector import ProviderScore, ProviderSelector
+from tests.helpers import completion, make_request
+
+
+def _selector(model_providers=None, exploration_rate=0.0):
+    config = SimpleNamespace(
+        provider_selection_enabled=True,
+        provider_exploration_rate=exploration_rate,
+        provider_ewma_alpha=0.5,
+        provider_expected_tokens=100,
+        model_providers=model_providers or {},
+    )
+    return ProviderSelector(config)
+
+
+def test_explicit_provider_suffix_is_forwarded_unchanged():
+    selector = _selector({"m": ["a"]})
+    assert selector.select("m:typo") == "m:typo"
+
+
+def test_request_suffix_is_never_learned():
+    selector = _selector({"m": ["a"]})
+    selector.record("m:typo", ttft=0.01, tokens=100, generation_seconds=0.1)
+    selector.record_failure("m:typo")
+    assert selector.get_stats()["models"]["m"].keys() == {"a"}
+    assert selector.select("m") == "m:a"
+
+
+def test_unknown_model_is_not_routed():
+    assert _selector().select("m") == "m"
+
+
+def test_picks_lowest_expected_time():
+    selector = _selector({"m": ["fast", "slow"]})
+    selector.record("m:fast", ttft=0.1, tokens=100, generation_seconds=1.0)
+    selector.record("m:slow", ttft=1.0, tokens=100, generation_seconds=10.0)
+    assert {selector.select("m") for _ in range(20)} == {"m:fast"}
+
+
+def test_unscored_provider_is_tried_at_most_once_per_interval():
+    selector = _selector({"m": ["scored", "new"]})
+    selector.record("m:scored", ttft=0.1, tokens=100, generation_seconds=1.0)
+    picks = [selector.select("m") for _ in range(20)]
+    assert picks.count("m:new") == 1
+
+
+def test_failures_push_provider_down():
+    selector = _selector({"m": ["a", "b"]})
+    selector.record("m:a", ttft=0.1, tokens=100, generation_seconds=1.0)
+    selector.record("m:b", ttft=0.2, tokens=100, generation_seconds=1.2)
+    for _ in range(3):
+        selector.record_failure("m:a")
+    assert selector.select("m") == "m:b"
+
+
+def test_expected_seconds_without_timing_is_infinite():
+    score = ProviderScore()
+    assert math.isinf(score.expected_seconds(100))
+    score.fail(0.5)
+    assert math.isinf(score.expected_seconds(100))
+
+
+def test_expected_seconds_accounts_for_failure_rate():
+    score = ProviderScore()
+    score.update(1.0, ttft=1.0, tokens_per_second=100.0)
+    healthy = score.expected_seconds(100)
+    score.fail(0.5)
+    assert score.expected_seconds(100) == healthy / (1 - score.failure_rate)
+
+
+def test_completion_samples_do_not_mix_with_stream_samples():
+    selector = _selector({"m": ["a"]})
+    selector.record("m:a", ttft=0.5, tokens=100, generation_seconds=1.0)
+    selector.record_completion("m:a", completion_tokens=100, seconds=10.0)
+    stats = selector.get_stats()["models"]["m"]["a"]
+    assert stats["tokens_per_second"] == 100.0
+    assert stats["completion_tokens_per_second"] == 10.0
+
+
+def test_expected_seconds_from_completion_samples_only():
+    score = ProviderScore()
+    score.update_completion(1.0, tokens_per_second=50.0)
+    assert score.expected_seconds(100) == 2.0
+    # 有流式计时后以流式计时为准
+    score.update(1.0, ttft=0.5, tokens_per_second=100.0)
+    assert score.expected_seconds(100) == 1.5
+
+
+async def test_non_streaming_score_uses_upstream_usage_and_excludes_retries(make_converter):
+    attempts = []
+
+    def handler(request: httpx.Request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            return httpx.Response(503, headers={"retry-after": "0.2"})
+        model = json.loads(request.content)["model"]
+        return httpx.Response(200, json=completion(model, "short", usage={"prompt_tokens": 1, "completion_tokens": 400, "total_tokens": 401}))
+
+    converter = make_converter(handler, provider_selection_enabled=True, model_providers={"m": ["a"]}, upstream_max_retries=1)
+    await converter.create_chat_completion(make_request("m"))
+
+    stats = converter.provider_selector.get_stats()["models"]["m"]["a"]
+    assert stats["tokens_per_second"] is None
+    # 400个token除以成功那一次调用的耗时；如果包含0.2秒的重试等待，速度不会超过2000
+    assert stats["completion_tokens_per_second"] > 2000
+    assert stats["failure_rate"] == 0.0
@@ -0,0 +1,92 @@
+import json
+
+import httpx
+import pytest
+
+from src.config import Config
+from src.reasoning import ReasoningSplitter
+from tests.helpers import completion, make_request, read_frames, sse_frames, sse_response, streamed_text
+
+
+def _split(chunks, reasoning=False):
+    splitter = ReasoningSplitter(reasoning=reasoning)
+    reasoning_parts, content_parts = [], []
+    for chunk in chunks:
+        r, c = splitter.feed(chunk)
+        reasoning_parts.append(r)
+        content_parts.append(c)
+    r, c = splitter.flush()
+    reasoning_parts.append(r)
+    content_parts.append(c)
+    return "".join(reasoning_parts), "".join(content_parts)
+
+
+def _every_split(text):
+    """text在每个位置切成两块，以及逐字符切分"""
+    yield [text]
+    for i in range(1, len(text)):
+        yield [text[:i], text[i:]]
+    yield list(text)
+
+
+@pytest.mark.parametrize("chunks", list(_every_split("<think>plan it</think>\n\nThe answer")))
+def test_tags_split_across_chunks(chunks):
+    assert _split(chunks) == ("plan it", "The answer")
+
+
+def test_leading_whitespace_before_think_tag():
+    assert _split(["  \n", "<thi", "nk>\nidea</think>  done"]) == ("idea", "done")
+
+
+def test_stream_without_think_tag_is_content():
+    assert _split(["Hello ", "<b>world</b>"]) == ("", "Hello <b>world</b>")
+
+
+def test_short_stream_that_looks_like_a_tag_prefix_is_flushed_as_content():
+    assert _split(["<thi"]) == ("", "<thi")
+
+
+def test_partial_end_tag_inside_reasoning_is_not_lost():
+    assert _split(["<think>a </thin", "king b</think>ok"]) == ("a </thinking b", "ok")
+
+
+def test_unterminated_reasoning_is_flushed_as_reasoning():
+    assert _split(["<think>still thinking </th"]) == ("still thinking </th", "")
+
+
+def test_content_after_end_tag_is_passed_through_unchanged():
+    splitter = ReasoningSplitter()
+    splitter.feed("<think>x</think>")
+    assert splitter.feed("a</think>b") == ("", "a</think>b")
+
+
+def test_tagless_reasoning_model():
+    assert _split(["step one ", "step two</th", "ink>answer"], reasoning=True) == ("step one step two", "answer")
+
+
+def test_tagless_reasoning_model_without_end_tag_is_all_reasoning():
+    assert _split(["only reasoning"], reasoning=True) == ("only reasoning", "")
+
+
+def test_deepseek_r1_is_a_tagless_reasoning_model_by_default(monkeypatch):
+    monkeypatch.delenv("REASONING_MODELS", raising=False)
+    assert Config().reasoning_models == ["DeepSeek-R1"]
+
+
+@pytest.mark.parametrize("model", ["deepseek-ai/DeepSeek-R1", "deepseek-ai/DeepSeek-R1-Distill-Qwen-32B:novita"])
+async def test_default_stream_split_matches_non_streaming(make_converter, monkeypatch, model):
+    monkeypatch.delenv("REASONING_MODELS", raising=False)
+    text = ["Let me ", "think.</th", "ink>\n\nThe answer."]
+
+    def handler(request: httpx.Request):
+        if json.loads(request.content).get("stream"):
+            return sse_response(sse_frames(model, text))
+        return httpx.Response(200, json=completion(model, "".join(text)))
+
+    converter = make_converter(handler, reasoning_models=Config().reasoning_models)
+    _, chunks = await converter.open_chat_completion_stream(make_request(model, stream=True))
+    frames = await read_frames(chunks)
+    message = (await converter.create_chat_completion(make_request(model))).choices[0].message
+
+    assert (message.reasoning, message.content) == ("Let me think.", "The answer.")
+    assert (streamed_text(frames, "reasoning"), streamed_text(frames)) == ("Let me think.", "The answer.")
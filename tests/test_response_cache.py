@@ -0,0 +1,179 @@
+import asyncio
+import json
+import threading
+
+import httpx
+import pytest
+
+import api_server
+from src.response_cache import ENTRY_OVERHEAD, ResponseCache, SQLiteResponseCache, cache_key
+from tests.helpers import completion, make_request, read_frames, sse_frames, sse_response, streamed_text
+
+
+def test_cache_key_depends_on_params_and_api_key():
+    params = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+    assert cache_key(params, "k1") == cache_key(dict(reversed(list(params.items()))), "k1")
+    assert cache_key(params, "k1") != cache_key(params, "k2")
+    assert cache_key(params, "k1") != cache_key({**params, "max_tokens": 10}, "k1")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(max_bytes=1 << 20, ttl=3600.0):
+        if request.param == "memory":
+            return ResponseCache(max_bytes=max_bytes, ttl=ttl)
+        return SQLiteResponseCache(str(tmp_path / "responses.db"), max_bytes=max_bytes, ttl=ttl)
+
+    return make
+
+
+async def test_put_then_get(make_cache):
+    cache = make_cache()
+    assert await cache.get("k") is None
+    await cache.put("k", b'{"id":1}', "served")
+    assert await cache.get("k") == (b'{"id":1}', "served")
+    stats = await cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+async def test_put_replaces_existing_entry(make_cache):
+    cache = make_cache()
+    await cache.put("k", b"old", "m")
+    await cache.put("k", b"new", "m")
+    assert await cache.get("k") == (b"new", "m")
+    assert (await cache.get_stats())["entries"] == 1
+
+
+async def test_expired_entries_are_misses(make_cache):
+    cache = make_cache(ttl=0.001)
+    await cache.put("k", b"body", "m")
+    await asyncio.sleep(0.01)
+    assert await cache.get("k") is None
+
+
+async def test_memory_cache_evicts_least_recently_used():
+    entry_size = len(b"x" * 100) + len("k0") + ENTRY_OVERHEAD
+    cache = ResponseCache(max_bytes=entry_size * 2, ttl=0)
+    await cache.put("k0", b"x" * 100, "m")
+    await cache.put("k1", b"x" * 100, "m")
+    assert await cache.get("k0") is not None
+    await cache.put("k2", b"x" * 100, "m")
+    assert await cache.get("k1") is None
+    assert await cache.get("k0") is not None
+    assert (await cache.get_stats())["evictions"] == 1
+
+
+async def test_sqlite_cache_compacts_to_byte_budget(tmp_path):
+    cache = SQLiteResponseCache(str(tmp_path / "responses.db"), max_bytes=5000, ttl=0)
+    for i in range(cache.COMPACT_EVERY):
+        await cache.put(f"k{i}", b"x" * 400, "m")
+    stats = await cache.get_stats()
+    assert stats["size_bytes"] <= 5000
+    assert stats["evictions"] == cache.COMPACT_EVERY - stats["entries"]
+    # 最近写入的条目保留
+    assert await cache.get(f"k{cache.COMPACT_EVERY - 1}") is not None
+    assert await cache.get("k0") is None
+
+
+async def test_sqlite_cache_survives_reopen(tmp_path):
+    path = str(tmp_path / "responses.db")
+    await SQLiteResponseCache(path, max_bytes=1 << 20, ttl=3600).put("k", b"body", "m")
+    assert await SQLiteResponseCache(path, max_bytes=1 << 20, ttl=3600).get("k") == (b"body", "m")
+
+
+async def test_sqlite_stats_are_counted_off_the_event_loop(tmp_path):
+    cache = SQLiteResponseCache(str(tmp_path / "responses.db"), max_bytes=1 << 20, ttl=3600)
+    await cache.put("k", b"body", "m")
+    count = cache._count
+    threads = []
+
+    def recording_count():
+        threads.append(threading.get_ident())
+        return count()
+
+    cache._count = recording_count
+    stats = await cache.get_stats()
+
+    assert (stats["entries"], stats["size_bytes"]) == (1, len(b"body") + len("k") + ENTRY_OVERHEAD)
+    assert threads and threads[0] != threading.get_ident()
+
+
+CACHE = dict(response_cache_enabled=True, response_cache_backend="memory", request_coalescing_enabled=False)
+
+
+def _by_model(fail_models=()):
+    calls = []
+
+    def handler(request: httpx.Request):
+        body = json.loads(request.content)
+        calls.append(body["model"])
+        if body["model"] in fail_models:
+            return httpx.Response(503)
+        if body.get("stream"):
+            return sse_response(sse_frames(body["model"], ["cached ", "answer"]))
+        return httpx.Response(200, json=completion(body["model"], "cached answer"))
+
+    return handler, calls
+
+
+async def test_deterministic_request_is_served_from_cache(make_converter):
+    handler, calls = _by_model()
+    converter = make_converter(handler, **CACHE)
+    request = make_request(temperature=0)
+
+    first = await converter.cached_chat_completion(request)
+    second = await converter.cached_chat_completion(request)
+
+    assert (first[2], second[2]) == ("MISS", "HIT")
+    assert first[:2] == second[:2]
+    assert calls == ["m"]
+    assert not converter.is_cacheable(make_request(temperature=0.7))
+
+
+async def test_cache_control_directives(make_converter):
+    handler, calls = _by_model()
+    converter = make_converter(handler, **CACHE)
+    request = make_request(temperature=0)
+
+    assert (await converter.cached_chat_completion(request, cache_control="no-store"))[2] == "BYPASS"
+    assert (await converter.cached_chat_completion(request))[2] == "MISS"
+    assert (await converter.cached_chat_completion(request, cache_control="no-cache"))[2] == "BYPASS"
+    assert (await converter.cached_chat_completion(request))[2] == "HIT"
+    assert len(calls) == 3
+
+
+async def test_fallback_answer_is_not_cached(make_converter):
+    handler, calls = _by_model(fail_models={"m"})
+    converter = make_converter(handler, model_fallbacks={"m": ["backup"]}, upstream_max_retries=0, **CACHE)
+    request = make_request(temperature=0)
+
+    for _ in range(2):
+        _, served_model, status = await converter.cached_chat_completion(request)
+        assert (served_model, status) == ("backup", "MISS")
+    assert calls == ["m", "backup", "m", "backup"]
+
+
+async def test_fallback_stream_is_not_cached(make_converter):
+    handler, calls = _by_model(fail_models={"m"})
+    converter = make_converter(handler, model_fallbacks={"m": ["backup"]}, upstream_max_retries=0, **CACHE)
+    request = make_request(temperature=0, stream=True)
+
+    for _ in range(2):
+        served_model, chunks, status = await converter.cached_chat_completion_stream(request)
+        assert streamed_text(await read_frames(chunks)) == "cached answer"
+        assert (served_model, status) == ("backup", "MISS")
+    assert (await converter.response_cache.get_stats())["entries"] == 0
+
+
+async def test_stats_endpoint_reports_sqlite_cache(make_converter, monkeypatch, tmp_path):
+    handler, _ = _by_model()
+    converter = make_converter(
+        handler, **dict(CACHE, response_cache_backend="sqlite", response_cache_path=str(tmp_path / "responses.db"))
+    )
+    await converter.cached_chat_completion(make_request(temperature=0))
+    monkeypatch.setattr(api_server, "converter", converter)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api_server.app), base_url="http://proxy") as client:
+        stats = (await client.get("/stats")).json()["response_cache"]
+
+    assert (stats["backend"], stats["entries"], stats["misses"]) == ("sqlite", 1, 1)
@@ -0,0 +1,82 @@
+import time
+
+import httpx
+import pytest
+from openai import APIStatusError
+
+from tests.helpers import completion, make_request, read_frames, scripted, sse_frames, sse_response, streamed_text
+
+
+def _ok():
+    return httpx.Response(200, json=completion("m", "ok"))
+
+
+async def test_retries_retryable_status_until_success(make_converter):
+    handler, calls = scripted(httpx.Response(503), httpx.Response(502), _ok)
+    converter = make_converter(handler, upstream_max_retries=2)
+
+    response = await converter.create_chat_completion(make_request())
+
+    assert response.choices[0].message.content == "ok"
+    assert len(calls) == 3
+    assert converter.retry_policy.get_stats()["recovered"] == 1
+
+
+async def test_retries_connection_errors(make_converter):
+    handler, calls = scripted(httpx.ConnectError("refused"), _ok)
+    converter = make_converter(handler, upstream_max_retries=2)
+
+    await converter.create_chat_completion(make_request())
+    assert len(calls) == 2
+
+
+async def test_client_errors_are_not_retried(make_converter):
+    handler, calls = scripted(httpx.Response(400, json={"error": "bad request"}))
+    converter = make_converter(handler, upstream_max_retries=2)
+
+    with pytest.raises(APIStatusError) as excinfo:
+        await converter.create_chat_completion(make_request())
+    assert excinfo.value.status_code == 400
+    assert len(calls) == 1
+
+
+async def test_gives_up_after_max_retries(make_converter):
+    handler, calls = scripted(httpx.Response(503))
+    converter = make_converter(handler, upstream_max_retries=2)
+
+    with pytest.raises(APIStatusError):
+        await converter.create_chat_completion(make_request())
+    assert len(calls) == 3
+    assert converter.retry_policy.get_stats()["gave_up"] == 1
+
+
+async def test_honours_retry_after(make_converter):
+    handler, calls = scripted(httpx.Response(429, headers={"retry-after": "0.1"}), _ok)
+    converter = make_converter(handler, upstream_max_retries=1, retry_base_delay=0, retry_max_delay=0)
+
+    started = time.monotonic()
+    await converter.create_chat_completion(make_request())
+    assert time.monotonic() - started >= 0.1
+    assert len(calls) == 2
+
+
+async def test_retry_budget_caps_extra_requests(make_converter):
+    handler, calls = scripted(httpx.Response(503))
+    # 比例为0时只剩每秒1次的最低额度，10秒窗口内最多重试10次
+    converter = make_converter(handler, upstream_max_retries=1, retry_budget_ratio=0.0, circuit_breaker_enabled=False)
+
+    for _ in range(12):
+        with pytest.raises(APIStatusError):
+            await converter.create_chat_completion(make_request())
+
+    assert len(calls) == 12 + 10
+    assert converter.retry_policy.get_stats()["budget"]["budget_exhausted"] == 2
+
+
+async def test_stream_open_is_retried_before_any_data_is_sent(make_converter):
+    handler, calls = scripted(httpx.Response(503), lambda: sse_response(sse_frames("m", ["hello"])))
+    converter = make_converter(handler, upstream_max_retries=1)
+
+    _, chunks = await converter.open_chat_completion_stream(make_request(stream=True))
+    assert streamed_text(await read_frames(chunks)) == "hello"
+    assert len(calls) == 2
@@ -0,0 +1,237 @@
+import asyncio
+import gc
+import json
+
+import httpx
+import pytest
+
+from src.singleflight import SingleFlight
+from tests.helpers import SSEStream, completion, make_request, read_frames, sse_frames, streamed_text
+
+
+async def test_do_runs_once_for_concurrent_callers():
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "result"
+
+    tasks = [asyncio.ensure_future(flight.do("k", fetch)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*tasks)
+
+    assert calls == 1
+    assert [value for value, _ in results] == ["result"] * 5
+    assert [leader for _, leader in results].count(True) == 1
+    assert flight.get_stats()["leaders"] == 1
+    assert flight.get_stats()["coalesced"] == 4
+    assert flight.get_stats()["in_flight"] == 0
+
+
+async def test_do_shares_exception_and_forgets_the_key():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(*[flight.do("k", fail) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+
+    async def succeed():
+        return 1
+
+    assert await flight.do("k", succeed) == (1, True)
+
+
+async def test_cancelled_waiter_does_not_cancel_the_call():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    first = asyncio.ensure_future(flight.do("k", fetch))
+    second = asyncio.ensure_future(flight.do("k", fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == ("done", False)
+
+
+class Upstream:
+    """可控的上游SSE帧生成器"""
+
+    def __init__(self, count: int, delay: float = 0.01):
+        self.count = count
+        self.delay = delay
+        self.started = 0
+        self.closed = False
+
+    def start(self):
+        self.started += 1
+        loop = asyncio.get_running_loop()
+        opening = loop.create_future()
+        opening.set_result(("served-model", None))
+        return self._frames(), opening
+
+    async def _frames(self):
+        try:
+            for i in range(self.count):
+                await asyncio.sleep(self.delay)
+                yield f"data: {i}\n\n"
+        finally:
+            self.closed = True
+
+
+async def _read(subscription):
+    return [frame async for frame in subscription]
+
+
+async def test_stream_fans_out_every_frame_to_late_joiners():
+    flight = SingleFlight()
+    upstream = Upstream(10)
+
+    first, first_leader = flight.stream("k", upstream.start)
+    reader = asyncio.ensure_future(_read(first))
+    await asyncio.sleep(0.05)
+    second, second_leader = flight.stream("k", upstream.start)
+
+    expected = [f"data: {i}\n\n" for i in range(10)]
+    assert await reader == expected
+    assert await _read(second) == expected
+    assert (first_leader, second_leader) == (True, False)
+    assert upstream.started == 1
+    assert flight.get_stats()["in_flight_streams"] == 0
+
+
+async def test_stream_keeps_running_while_any_subscriber_remains():
+    flight = SingleFlight()
+    upstream = Upstream(10)
+
+    first, _ = flight.stream("k", upstream.start)
+    second, _ = flight.stream("k", upstream.start)
+    async for _ in first:
+        break
+    await first.aclose()
+
+    frames = await _read(second)
+    assert len(frames) == 10
+
+
+async def test_stream_is_cancelled_when_last_subscriber_leaves():
+    flight = SingleFlight()
+    upstream = Upstream(1000)
+
+    subscription, _ = flight.stream("k", upstream.start)
+    async for _ in subscription:
+        break
+    await subscription.aclose()
+    await asyncio.sleep(0.02)
+
+    assert upstream.closed
+    assert flight.get_stats()["in_flight_streams"] == 0
+    # 之后的相同请求重新发往上游
+    flight.stream("k", upstream.start)[0].close()
+    assert upstream.started == 2
+
+
+async def test_close_is_idempotent():
+    flight = SingleFlight()
+    upstream = Upstream(1000)
+
+    first, _ = flight.stream("k", upstream.start)
+    second, _ = flight.stream("k", upstream.start)
+    first.close()
+    await first.aclose()
+    first.close()
+
+    # 第一个订阅者多次退订不能把第二个订阅者也算作离开
+    async for _ in second:
+        break
+    assert not upstream.closed
+    second.close()
+
+
+async def test_abandoned_subscription_unsubscribes_when_collected():
+    flight = SingleFlight()
+    upstream = Upstream(1000)
+
+    subscription, _ = flight.stream("k", upstream.start)
+    await asyncio.sleep(0.03)
+    # 从未迭代就被丢弃（例如响应在发送第一帧之前失败）
+    del subscription
+    gc.collect()
+    await asyncio.sleep(0.02)
+
+    assert upstream.closed
+    assert flight.get_stats()["in_flight_streams"] == 0
+
+
+async def test_cancelled_read_unsubscribes():
+    flight = SingleFlight()
+    upstream = Upstream(1000, delay=0.05)
+
+    subscription, _ = flight.stream("k", upstream.start)
+    reader = asyncio.ensure_future(_read(subscription))
+    await asyncio.sleep(0.01)
+    reader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await reader
+    await asyncio.sleep(0.01)
+
+    assert upstream.closed
+
+
+def _counting_upstream():
+    calls = []
+
+    async def handler(request: httpx.Request):
+        body = json.loads(request.content)
+        calls.append(body.get("stream", False))
+        if body.get("stream"):
+            stream = SSEStream(sse_frames("m", ["a", "b", "c"]), delay=0.01)
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=stream)
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json=completion("m", "abc"))
+
+    return handler, calls
+
+
+async def test_converter_coalesces_identical_completions(make_converter):
+    handler, calls = _counting_upstream()
+    converter = make_converter(handler, request_coalescing_enabled=True)
+
+    responses = await asyncio.gather(*[converter.coalesced_chat_completion(make_request(temperature=0)) for _ in range(5)])
+
+    assert calls == [False]
+    assert {response.choices[0].message.content for response in responses} == {"abc"}
+    # 每个请求得到独立的副本
+    assert len({id(response) for response in responses}) == 5
+
+
+async def test_converter_coalesces_identical_streams(make_converter):
+    handler, calls = _counting_upstream()
+    converter = make_converter(handler, request_coalescing_enabled=True)
+
+    async def stream():
+        _, chunks = await converter.coalesced_chat_completion_stream(make_request(temperature=0, stream=True))
+        return await read_frames(chunks)
+
+    results = await asyncio.gather(*[stream() for _ in range(3)])
+
+    assert calls == [True]
+    assert [streamed_text(frames) for frames in results] == ["abc"] * 3
+
+
+async def test_sampled_requests_are_not_coalesced(make_converter):
+    handler, calls = _counting_upstream()
+    converter = make_converter(handler, request_coalescing_enabled=True)
+
+    await asyncio.gather(*[converter.coalesced_chat_completion(make_request(temperature=0.7)) for _ in range(3)])
+
+    assert calls == [False] * 3
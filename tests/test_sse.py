@@ -0,0 +1,161 @@
+import asyncio
+import json
+
+import pytest
+
+from src.models import ChatCompletionStreamResponse, Delta, StreamChoice
+from src.sse import HEARTBEAT, StreamChunkEncoder, coalesce_deltas, with_heartbeats
+from tests.helpers import make_request, read_frames, sse_frames, sse_response, streamed_text
+
+RESPONSE_ID = "chatcmpl-test"
+CREATED = 1700000000
+
+
+def _reference(model: str, delta: Delta, finish_reason=None) -> str:
+    response = ChatCompletionStreamResponse(
+        id=RESPONSE_ID,
+        created=CREATED,
+        model=model,
+        choices=[StreamChoice(index=0, delta=delta, finish_reason=finish_reason)],
+    )
+    return f"data: {response.model_dump_json()}\n\n"
+
+
+TEXTS = [
+    "",
+    "Hello",
+    ' "quoted" \\ backslash',
+    "line\nbreak\ttab\r\x00\x1f",
+    "中文，全角标点",
+    "emoji 🙂 and non-BMP 𝄞",
+    "   separators",
+    "</think>",
+]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("model", ["openai/gpt-oss-120b:fireworks-ai", 'model "with" \\ quotes', "模型"])
+def test_encoder_matches_model_dump_json(text, model):
+    encoder = StreamChunkEncoder(RESPONSE_ID, CREATED, model)
+    assert encoder.content(text) == _reference(model, Delta(content=text))
+    assert encoder.reasoning(text) == _reference(model, Delta(reasoning=text))
+
+
+@pytest.mark.parametrize("finish_reason", ["stop", "length", None])
+def test_encoder_finish_matches_model_dump_json(finish_reason):
+    encoder = StreamChunkEncoder(RESPONSE_ID, CREATED, "m")
+    assert encoder.finish(finish_reason) == _reference("m", Delta(), finish_reason)
+
+
+def test_encoder_usage_chunk():
+    chunk = StreamChunkEncoder(RESPONSE_ID, CREATED, "m").usage(3, 4)
+    assert chunk.startswith("data: ") and chunk.endswith("\n\n")
+    payload = json.loads(chunk[len("data: "):])
+    assert payload["choices"] == []
+    assert payload["usage"] == {"prompt_tokens": 3, "completion_tokens": 4, "total_tokens": 7}
+
+
+async def test_converted_stream_frames_are_valid_chunks(make_converter):
+    converter = make_converter(lambda request: sse_response(sse_frames("m", ["Hel", "lo \"x\""])))
+    served_model, chunks = await converter.open_chat_completion_stream(make_request(stream=True))
+    frames = await read_frames(chunks)
+
+    assert frames[-1] == "data: [DONE]\n\n"
+    parsed = [ChatCompletionStreamResponse.model_validate_json(frame[len("data: "):]) for frame in frames[:-1]]
+    assert {chunk.model for chunk in parsed} == {served_model}
+    assert len({chunk.id for chunk in parsed}) == 1
+    assert "".join(chunk.choices[0].delta.content or "" for chunk in parsed) == 'Hello "x"'
+    assert parsed[-1].choices[0].finish_reason == "stop"
+
+
+async def _deltas(items, delay=0.0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+async def _collect(iterator):
+    return [item async for item in iterator]
+
+
+async def test_coalesce_sends_first_delta_immediately_and_merges_the_rest():
+    items = [("a", 1, None), ("b", 1, None), ("c", 1, None), (None, 0, "stop")]
+    result = await _collect(coalesce_deltas(_deltas(items), window=1.0, max_bytes=1024))
+    assert result == [("a", 1, None), ("bc", 2, None), (None, 0, "stop")]
+
+
+async def test_coalesce_keeps_order_around_finish_reason():
+    items = [("a", 1, None), ("b", 1, None), ("c", 1, "length"), ("d", 1, None)]
+    result = await _collect(coalesce_deltas(_deltas(items), window=1.0, max_bytes=1024))
+    assert result == [("a", 1, None), ("b", 1, None), ("c", 1, "length"), ("d", 1, None)]
+    assert "".join(content for content, _, _ in result) == "abcd"
+
+
+async def test_coalesce_flushes_at_max_bytes():
+    items = [("x", 1, None)] + [("yy", 1, None)] * 4
+    result = await _collect(coalesce_deltas(_deltas(items), window=10.0, max_bytes=4))
+    assert result == [("x", 1, None), ("yyyy", 2, None), ("yyyy", 2, None)]
+
+
+async def test_coalesce_flushes_when_window_expires():
+    items = [("a", 1, None), ("b", 1, None), ("c", 1, None)]
+    result = await _collect(coalesce_deltas(_deltas(items, delay=0.05), window=0.01, max_bytes=1024))
+    assert [content for content, _, _ in result] == ["a", "b", "c"]
+
+
+async def test_coalesce_emits_buffered_content_before_error():
+    async def failing():
+        yield "a", 1, None
+        yield "b", 1, None
+        raise RuntimeError("upstream failed")
+
+    received = []
+    with pytest.raises(RuntimeError):
+        async for item in coalesce_deltas(failing(), window=1.0, max_bytes=1024):
+            received.append(item)
+    assert received == [("a", 1, None), ("b", 1, None)]
+
+
+async def test_converter_coalesces_fast_stream(make_converter):
+    converter = make_converter(
+        lambda request: sse_response(sse_frames("m", [f"{i} " for i in range(50)])),
+        stream_coalesce_enabled=True,
+        stream_coalesce_window=1.0,
+        stream_coalesce_bytes=32,
+        stream_reasoning_split=False,
+    )
+    _, chunks = await converter.open_chat_completion_stream(make_request(stream=True))
+    frames = await read_frames(chunks)
+
+    assert streamed_text(frames) == "".join(f"{i} " for i in range(50))
+    # 首个delta立即发送，其余按字节上限合并，远少于上游的50帧
+    assert len(frames) < 15
+    assert converter.stream_stats.get_stats()["completed_streams"] == 1
+
+
+async def test_heartbeats_until_first_frame():
+    async def slow():
+        await asyncio.sleep(0.12)
+        yield "data: 1\n\n"
+        yield "data: 2\n\n"
+
+    frames = await _collect(with_heartbeats(slow(), 0.05))
+    assert frames[-2:] == ["data: 1\n\n", "data: 2\n\n"]
+    assert frames[:-2] and all(frame == HEARTBEAT for frame in frames[:-2])
+
+
+async def test_converter_sends_heartbeats_while_upstream_is_slow_to_open(make_converter):
+    async def handler(request):
+        await asyncio.sleep(0.15)
+        return sse_response(sse_frames("m", ["hello"]))
+
+    converter = make_converter(handler, sse_heartbeat_interval=0.05)
+    served_model, chunks = await converter.start_chat_completion_stream(make_request(stream=True))
+    frames = await read_frames(chunks)
+
+    # 超过一个心跳间隔仍未打开时先开始响应，实际服务的模型未知
+    assert served_model is None
+    assert frames[0] == HEARTBEAT
+    assert streamed_text(frames) == "hello"
+    assert frames[-1] == "data: [DONE]\n\n"
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import httpx
+
+from tests.helpers import SSEStream, make_request, payloads, sse_frames, streamed_text
+
+FRAMES = 100
+TEXT = "x" * 100
+
+
+def _fast_upstream():
+    streams = []
+
+    def handler(request: httpx.Request):
+        stream = SSEStream(sse_frames("m", [TEXT] * FRAMES))
+        streams.append(stream)
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=stream)
+
+    return handler, streams
+
+
+async def _read_with_stall(converter, stall=0.2):
+    """读取第一帧后暂停stall秒（慢客户端），然后读完剩余的帧"""
+    _, chunks = await converter.open_chat_completion_stream(make_request(stream=True))
+    frames = [await chunks.__anext__()]
+    await asyncio.sleep(stall)
+    frames += [frame async for frame in chunks]
+    return frames
+
+
+async def test_coalesce_policy_keeps_reading_upstream_and_merges_deltas(make_converter):
+    handler, streams = _fast_upstream()
+    converter = make_converter(handler, stream_buffer_high_water=1000, stream_backpressure_policy="coalesce")
+
+    frames = await _read_with_stall(converter)
+
+    assert streamed_text(frames) == TEXT * FRAMES
+    assert len(frames) < FRAMES
+    stats = converter.stream_stats.get_buffer_stats()
+    assert stats["coalesced_deltas"] > 0
+    assert stats["high_water_events"] > 0
+    assert converter.stream_stats.get_stats()["completed_streams"] == 1
+
+
+async def test_block_policy_pauses_upstream_reads(make_converter):
+    handler, streams = _fast_upstream()
+    converter = make_converter(handler, stream_buffer_high_water=1000, stream_backpressure_policy="block")
+
+    _, chunks = await converter.open_chat_completion_stream(make_request(stream=True))
+    frames = [await chunks.__anext__()]
+    await asyncio.sleep(0.1)
+    # 缓冲达到高水位后读取任务暂停，上游只被读取了少量帧
+    assert streams[0].sent < 20
+    frames += [frame async for frame in chunks]
+
+    assert streamed_text(frames) == TEXT * FRAMES
+    assert streams[0].sent == len(streams[0].frames)
+
+
+async def test_drop_policy_aborts_slow_client(make_converter):
+    handler, streams = _fast_upstream()
+    converter = make_converter(handler, stream_buffer_high_water=1000, stream_backpressure_policy="drop")
+
+    frames = await _read_with_stall(converter)
+
+    assert json.loads(frames[-1][len("data: "):])["error"]["code"] == "slow_client"
+    assert "data: [DONE]\n\n" not in frames
+    assert len(payloads(frames)) < FRAMES
+    assert streams[0].closed
+    assert converter.stream_stats.get_buffer_stats()["slow_client_drops"] == 1
+
+
+async def test_buffer_is_released_when_stream_ends(make_converter):
+    handler, _ = _fast_upstream()
+    converter = make_converter(handler, stream_buffer_high_water=1000)
+
+    await _read_with_stall(converter, stall=0.01)
+
+    stats = converter.stream_stats.get_buffer_stats()
+    assert (stats["buffered_streams"], stats["buffered_bytes_total"]) == (0, 0)
+    assert stats["peak_stream_bytes"] > 0
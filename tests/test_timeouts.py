@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from src.exceptions import UpstreamTimeoutError
+from src.timeouts import TimeoutPolicy
+
+
+class FakeStream:
+    """按给定间隔产出chunk的上游流，关闭响应时正在进行的读取失败（与httpx一致）"""
+
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.response = self
+        self.closed = False
+        self._pending = None
+
+    async def aclose(self):
+        self.closed = True
+        if self._pending is not None and not self._pending.done():
+            self._pending.set_exception(ConnectionError("response closed"))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed:
+            raise ConnectionError("response closed")
+        if not self.delays:
+            raise StopAsyncIteration
+        delay = self.delays.pop(0)
+        loop = asyncio.get_running_loop()
+        self._pending = loop.create_future()
+        handle = loop.call_later(delay, lambda: self._pending.done() or self._pending.set_result(delay))
+        try:
+            return await self._pending
+        finally:
+            handle.cancel()
+
+
+def _policy(first_token=1.0, idle=1.0, total=10.0):
+    return TimeoutPolicy(connect=1.0, first_token=first_token, idle=idle, total=total)
+
+
+async def _drain(policy, stream, **kwargs):
+    return [chunk async for chunk in policy.iter_stream(stream, **kwargs)]
+
+
+@pytest.mark.parametrize("fallback", [False, True])
+async def test_stream_within_limits_is_unchanged(fallback):
+    stream = FakeStream([0.01, 0.01, 0.01])
+    if fallback:
+        stream.response = None
+    assert await _drain(_policy(), stream) == [0.01, 0.01, 0.01]
+
+
+@pytest.mark.parametrize(
+    "delays, limits, code",
+    [
+        ([0.2], dict(first_token=0.05), "first_token_timeout"),
+        ([0.01, 0.2], dict(idle=0.05), "idle_timeout"),
+        ([0.03, 0.03, 0.03, 0.03], dict(idle=1.0, total=0.08), "total_timeout"),
+    ],
+)
+@pytest.mark.parametrize("fallback", [False, True])
+async def test_phase_timeouts(delays, limits, code, fallback):
+    stream = FakeStream(delays)
+    if fallback:
+        stream.response = None
+    with pytest.raises(UpstreamTimeoutError) as excinfo:
+        await _drain(_policy(**limits), stream)
+    assert excinfo.value.code == code
+    if not fallback:
+        # 超时通过关闭上游响应中断读取
+        assert stream.closed
+
+
+async def test_consumer_time_is_not_counted_as_idle():
+    stream = FakeStream([0.01, 0.01, 0.01])
+    received = []
+    async for chunk in _policy(idle=0.05).iter_stream(stream):
+        received.append(chunk)
+        await asyncio.sleep(0.1)
+    assert len(received) == 3
+    assert not stream.closed
+
+
+async def test_upstream_error_is_not_reported_as_timeout():
+    class Failing(FakeStream):
+        async def __anext__(self):
+            raise ConnectionError("reset")
+
+    with pytest.raises(ConnectionError):
+        await _drain(_policy(), Failing([]))